@@ -1,58 +1,126 @@
 #import packages
 import pandas as pd
-from sqlalchemy import create_engine
 import os
 import shutil
-from datetime import datetime
-from dotenv import load_dotenv
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from db_utils import get_connection, prepare_raw_frame, create_raw_stage, copy_frame_to_stage, insert_stage_into_raw
+import pipeline_metrics as metrics
 
 # Directory containing CSV files. csv_dir_path is the project root directory 
 csv_dir_path = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
 archive_dir_path = os.path.join(csv_dir_path, "archive")
 
-load_dotenv()  # Load environment variables from .env
+# Rows read from a CSV at a time, which bounds memory regardless of file size
+CHUNK_ROWS = 10000
+# Files loaded in parallel; each worker process holds one connection, so this also caps connections
+MAX_WORKERS = 4
 
-db_details = {
-    'user': os.getenv('DB_USER'),
-    'password': os.getenv('DB_PASSWORD'),
-    'host': os.getenv('DB_HOST'),
-    'port': os.getenv('DB_PORT'),
-    'database': os.getenv('DB_NAME')
-}
+# Connection owned by each worker process, opened once by the pool initializer
+worker_conn = None
 
-table_name = "adzuna_results_raw"
 
-# Ensure the archive folder exists
-os.makedirs(archive_dir_path, exist_ok=True)
+def init_worker():
+    """Opens the connection a worker process reuses for every file it is given."""
+    global worker_conn
+    worker_conn = get_connection()
 
-# Create the PostgreSQL connection string
-conn_str = f"postgresql://{db_details['user']}:{db_details['password']}@{db_details['host']}:{db_details['port']}/{db_details['database']}"
-engine = create_engine(conn_str)
 
-# Iterate over all .csv files in the directory
-for filename in os.listdir(csv_dir_path):
-    if filename.endswith(".csv"):
-        file_path = os.path.join(csv_dir_path, filename)
-        print(f"Processing file: {filename}")
-        
+def ingest_file(file_path, conn=None, archive_dir=archive_dir_path):
+    """Loads one CSV into adzuna_results_raw and archives it.
+
+    Returns (rows_read, rows_inserted, file_bytes, seconds); the caller records the metrics,
+    as a worker process's own metrics would be lost.
+
+    The file is read in chunks and COPYed into a staging table, then moved into raw with
+    a single INSERT ... ON CONFLICT DO NOTHING, so duplicate keys are skipped instead of
+    failing the file. The file is only archived once the insert has committed.
+    """
+    conn = conn or worker_conn
+    filename = os.path.basename(file_path)
+    file_bytes = os.path.getsize(file_path)
+    rows_read = 0
+    start = time.perf_counter()
+
+    try:
+        with conn.cursor() as cur:
+            create_raw_stage(cur)
+            for chunk in pd.read_csv(file_path, chunksize=CHUNK_ROWS):
+                rows_read += len(chunk)
+                copy_frame_to_stage(cur, prepare_raw_frame(chunk))
+            rows_inserted = insert_stage_into_raw(cur)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+    # Move the file to the archive folder
+    shutil.move(file_path, os.path.join(archive_dir, filename))
+    return rows_read, rows_inserted, file_bytes, time.perf_counter() - start
+
+
+def ingest_csv_files(csv_dir=csv_dir_path, max_workers=MAX_WORKERS, conn=None, archive_dir=archive_dir_path):
+    """Ingests every .csv file in csv_dir, several at a time. Returns the total rows inserted.
+
+    With max_workers=1 the files are loaded one by one in this process, on conn if given.
+    """
+    # Ensure the archive folder exists
+    os.makedirs(archive_dir, exist_ok=True)
+
+    file_paths = [os.path.join(csv_dir, filename) for filename in sorted(os.listdir(csv_dir))
+                  if filename.endswith(".csv")]
+    total_inserted = 0
+
+    if not file_paths:
+        print("No CSV files to ingest.")
+        return total_inserted
+
+    def report(file_path, rows_read, rows_inserted, file_bytes, seconds):
+        filename = os.path.basename(file_path)
+        print(f"Data from {filename} inserted successfully: {rows_inserted} of {rows_read} rows were new "
+              f"({file_bytes / 1e6:.1f} MB in {seconds:.1f}s, {rows_read / max(seconds, 1e-9):,.0f} rows/s).")
+        print(f"{filename} moved to archive folder.")
+        metrics.observe("ingest_file_seconds", seconds)
+        metrics.inc("ingest_files_total")
+        metrics.inc("ingest_bytes_total", file_bytes)
+        metrics.inc("ingest_rows_total", rows_read, result="read")
+        metrics.inc("ingest_rows_total", rows_inserted, result="inserted")
+
+    if max_workers <= 1 or len(file_paths) == 1:
+        owns_conn = conn is None
+        if owns_conn:
+            conn = get_connection()
         try:
-            # Load CSV into a pandas DataFrame
-            df = pd.read_csv(file_path)
-
-            # Drop duplicates based on key columns
-            df = df.drop_duplicates(subset=["Title", "Company", "Created", "timestamp"])
-
-            # Drop rows where "Company" is NULL
-            df = df.dropna(subset=["Company"])
-
-            # Insert DataFrame into the PostgreSQL table
-            df.to_sql(table_name, engine, index=False, if_exists='append')
-            print(f"Data from {filename} inserted successfully.")
-            
-            # Move the file to the archive folder
-            shutil.move(file_path, os.path.join(archive_dir_path, filename))
-            print(f"{filename} moved to archive folder.")
-
-        except Exception as e:
-            print(f"Error processing {filename}: {e}")
-    
\ No newline at end of file
+            for file_path in file_paths:
+                print(f"Processing file: {os.path.basename(file_path)}")
+                try:
+                    rows_read, rows_inserted, file_bytes, seconds = ingest_file(file_path, conn, archive_dir)
+                    report(file_path, rows_read, rows_inserted, file_bytes, seconds)
+                    total_inserted += rows_inserted
+                except Exception as e:
+                    print(f"Error processing {os.path.basename(file_path)}: {e}")
+        finally:
+            if owns_conn:
+                conn.close()
+        return total_inserted
+
+    with ProcessPoolExecutor(max_workers=min(max_workers, len(file_paths)), initializer=init_worker) as executor:
+        futures = {}
+        for file_path in file_paths:
+            print(f"Processing file: {os.path.basename(file_path)}")
+            futures[executor.submit(ingest_file, file_path, None, archive_dir)] = file_path
+
+        for future in as_completed(futures):
+            file_path = futures[future]
+            try:
+                rows_read, rows_inserted, file_bytes, seconds = future.result()
+                report(file_path, rows_read, rows_inserted, file_bytes, seconds)
+                total_inserted += rows_inserted
+            except Exception as e:
+                print(f"Error processing {os.path.basename(file_path)}: {e}")
+
+    return total_inserted
+
+
+if __name__ == "__main__":
+    ingest_csv_files()
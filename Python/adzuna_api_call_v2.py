@@ -1,104 +1,720 @@
+import argparse
 import requests
 import json
 import pandas as pd
 import os
 import time
+import math
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from datetime import datetime
 from dotenv import load_dotenv
+from requests.adapters import HTTPAdapter
+from db_utils import RAW_TABLE, get_connection, prepare_raw_frame, copy_frame_to_raw
+from listing_key import listing_keys
+import pipeline_metrics as metrics
+from response_archive import ARCHIVE_DIR, ResponseArchive, list_runs, read_index, read_pages
+from search_catalogue import DEFAULT_COUNTRY, country_locations, load_catalogue, search_label, searches
 
-def fetch_jobs_and_save_to_csv(search_terms):
-    # API details
-    base_url = "https://api.adzuna.com/v1/api/jobs/au/search/"
+# Adzuna's default quota is 25 hits per minute (and 250/day, 1000/week, 2500/month)
+API_CALLS_PER_MINUTE = 25
+RESULTS_PER_PAGE = 50
+MAX_RETRIES = 5
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+BACKOFF_BASE_SECONDS = 2
+BACKOFF_MAX_SECONDS = 60
+
+# Incremental fetches ask for listings up to this old
+MAX_DAYS_OLD = 4
+
+# The scheduler refetches a search once it expects about a page of new listings, going by
+# the listings per hour its recent fetches found (smoothed), but at least MAX_REFRESH_HOURS
+# apart, inside the MAX_DAYS_OLD window an incremental fetch can still reach
+MIN_REFRESH_HOURS = 1
+MAX_REFRESH_HOURS = 72
+CHURN_SMOOTHING = 0.5
+
+# With sharding on, a search deeper than SHARD_MAX_PAGES is split into slices paginated in
+# parallel: first by state or territory (Australian searches only), then by salary band. Unknown salaries are only
+# requested with the lowest band, so each listing is reachable through exactly one slice
+# (bar band-edge overlaps, which are deduplicated by listing key).
+SHARD_MAX_PAGES = 10
+STATES = ["New South Wales", "Victoria", "Queensland", "Western Australia", "South Australia",
+          "Australian Capital Territory", "Tasmania", "Northern Territory"]
+SALARY_BANDS = [(None, 80000), (80000, 120000), (120000, 160000), (160000, None)]
+# Listings located only as "Australia" fall outside every state; if the slices of a split
+# report more than this share fewer listings than their parent, the parent is paginated instead
+SHARD_COVERAGE_TOLERANCE = 0.02
+
+# ADZUNA_API_BASE_URL in .env points the fetcher elsewhere, eg the benchmark's local stand-in server
+# {country} is replaced by each search's country code; a URL without it serves every country
+DEFAULT_API_BASE_URL = "https://api.adzuna.com/v1/api/jobs/{country}/search/"
+
+# Per search: the newest "created" timestamp fetched, used to stop paginating at known listings,
+# and when it was last fetched and how many new listings an hour it finds, used by the scheduler
+FETCH_STATE_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "fetch_state.json"))
+
+
+class TokenBucket:
+    """Thread-safe token bucket shared by every worker calling the API."""
+
+    def __init__(self, calls_per_minute=API_CALLS_PER_MINUTE, capacity=1):
+        # A capacity of 1 spaces calls evenly, so no 60 second window can exceed the quota
+        self.rate = calls_per_minute / 60.0
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """Blocks until a token is available, then consumes it."""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait_time = (1 - self.tokens) / self.rate
+            time.sleep(wait_time)
+
+
+class CallBudget:
+    """Thread-safe count of the HTTP requests a run makes, retries included, against an optional limit."""
+
+    def __init__(self, max_calls=None):
+        self.max_calls = max_calls
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def spend(self):
+        """Counts one request. Returns False, counting nothing, once the limit is reached."""
+        with self.lock:
+            if self.max_calls is not None and self.calls >= self.max_calls:
+                return False
+            self.calls += 1
+            return True
+
+    def spent(self):
+        """True once the limit is reached; never without one."""
+        with self.lock:
+            return self.max_calls is not None and self.calls >= self.max_calls
+
+
+def create_session(pool_size):
+    """Creates one pooled HTTP session reused by every request in the run."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def backoff_seconds(attempt, response=None):
+    """Exponential backoff with full jitter, honouring Retry-After when the API sends it."""
+    if response is not None and response.headers.get("Retry-After", "").isdigit():
+        return int(response.headers["Retry-After"])
+    return random.uniform(0, min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** attempt))
+
+
+def fetch_page(session, limiter, url, params, label, budget=None):
+    """Fetches one page, retrying 429/5xx and network errors. Returns the parsed JSON or None.
+
+    Every attempt is counted against budget (a CallBudget), if given; none is made once it is spent.
+    """
+    response = None
+    last_error = None
+
+    for attempt in range(MAX_RETRIES):
+        if budget is not None and not budget.spend():
+            print(f"API budget spent, giving up on {label}.")
+            return None
+        limiter.acquire()
+        start = time.perf_counter()
+        try:
+            response = session.get(url, params=params, timeout=60)
+        except requests.RequestException as e:
+            last_error = type(e).__name__
+            metrics.observe("adzuna_http_request_seconds", time.perf_counter() - start, status="error")
+            metrics.inc("adzuna_http_retries_total", reason=type(e).__name__)
+            wait_time = backoff_seconds(attempt)
+            print(f"Request error for {label}: {e}. Retrying {attempt + 1}/{MAX_RETRIES} in {wait_time:.1f} seconds...")
+            time.sleep(wait_time)
+            continue
+
+        metrics.observe("adzuna_http_request_seconds", time.perf_counter() - start, status=response.status_code)
+        if response.status_code == 200:
+            return response.json()
+
+        if response.status_code not in RETRY_STATUS_CODES:
+            break
+
+        last_error = f"HTTP Status {response.status_code}"
+        metrics.inc("adzuna_http_retries_total", reason=response.status_code)
+        wait_time = backoff_seconds(attempt, response)
+        print(f"Failed to fetch {label}. HTTP Status: {response.status_code}. "
+              f"Retrying {attempt + 1}/{MAX_RETRIES} in {wait_time:.1f} seconds...")
+        time.sleep(wait_time)
+
+    if response is not None and response.status_code not in RETRY_STATUS_CODES:
+        print(f"Failed to fetch {label}. HTTP Status: {response.status_code}, not retried. Stopping pagination.")
+    else:
+        print(f"Max retries exceeded for {label}. Last error: {last_error}. Stopping pagination.")
+    if response is not None:
+        print(response.text)  # Optionally print the error text
+    return None
 
+
+def split_filters(filters, country=DEFAULT_COUNTRY):
+    """The (filters, label) of the slices that split a shard one level further, or [] at the finest level."""
+    if country == "au" and "location1" not in filters:
+        # requests drops None params, so "where" gives way to the structured location
+        return [(dict(filters, where=None, location0="Australia", location1=state), state) for state in STATES]
+    if "salary_band" not in filters:
+        children = []
+        for i, (low, high) in enumerate(SALARY_BANDS):
+            child = dict(filters, salary_band=i, salary_min=low, salary_max=high)
+            if i == 0:
+                child["salary_include_unknown"] = 1
+            if low and high:
+                label = f"${low // 1000}k-${high // 1000}k"
+            else:
+                label = f"under ${high // 1000}k or unknown" if high else f"${low // 1000}k+"
+            children.append((child, label))
+        return children
+    return []
+
+
+def request_params(params, term, filters):
+    """The query string of one shard; salary_band only names the slice and is not sent."""
+    return {key: value for key, value in dict(params, what=term, **filters).items() if key != "salary_band"}
+
+
+def search_params(max_days_old=MAX_DAYS_OLD, sort_dir=None, country=DEFAULT_COUNTRY, where="Australia"):
+    """The API base URL for a country and the query parameters every search there shares, read from .env.
+
+    Results are sorted by date, newest first unless sort_dir is "up".
+    """
     load_dotenv()  # Load environment variables from .env
 
+    # API details
+    base_url = os.getenv("ADZUNA_API_BASE_URL", DEFAULT_API_BASE_URL).format(country=country)
+
     params = {
         "app_id": os.getenv('API_APP_ID'),
         "app_key": os.getenv('API_APP_KEY'),
-        "where": "Australia",
-        "results_per_page": 50,
-        "max_days_old": 4,
+        "where": where,
+        "results_per_page": RESULTS_PER_PAGE,
+        "max_days_old": max_days_old,
+        "sort_by": "date",
+        "sort_dir": sort_dir,
         "content-type": "application/json"
     }
+    return base_url, params
 
-    for term in search_terms:
-        page = 1
-        all_jobs = []
-        params["what"] = term  # Set the search term
 
-        print(f"Starting search for: {term}")
-        
-        while True:
-            print(f"Fetching page {page} for '{term}'...")
-            url = f"{base_url}{page}"
-
-            max_retries = 3
-            retry_count = 0
-            response = None
-
-            # Attempt to fetch this page with retries
-            while retry_count < max_retries:
-                response = requests.get(url, params=params)
-                
-                if response.status_code == 200:
-                    # Successful fetch, break out of the retry loop
-                    break
-                else:
-                    retry_count += 1
-                    wait_time = 10  # seconds to wait before retry
-                    print(f"Failed to fetch page {page} for '{term}'. HTTP Status: {response.status_code}. "
-                          f"Retrying {retry_count}/{max_retries} in {wait_time} seconds...")
-                    time.sleep(wait_time)
-
-            # After trying up to max_retries, if it's still not 200, break out of pagination
-            if not response or response.status_code != 200:
-                print(f"Max retries exceeded for page {page} of '{term}'. Stopping pagination.")
-                if response is not None:
-                    print(response.text)  # Optionally print the error text
-                break
+def parse_created(value):
+    """Parses Adzuna's ISO-8601 "created" value, returning None when it is missing or malformed."""
+    try:
+        return datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except (AttributeError, ValueError):
+        return None
 
-            # If we got here, response.status_code == 200
-            data = response.json()
-            job_listings = data.get('results', [])
 
-            if not job_listings:
-                print(f"No more results for '{term}', ending pagination.")
-                break
+def load_fetch_state(path=FETCH_STATE_PATH):
+    """Loads the per-term high-water marks written by the previous run."""
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
 
-            for job in job_listings:
-                all_jobs.append({
-                    "Title": job.get("title", ""),
-                    "Company": job.get("company", {}).get("display_name", ""),
-                    "Location": job.get("location", {}).get("display_name", ""),
-                    "Category": job.get("category", {}).get("label", ""),
-                    "Contract Type": job.get("contract_type", ""),
-                    "Contract Time": job.get("contract_time", ""),
-                    "Salary Min": job.get("salary_min", ""),
-                    "Salary Max": job.get("salary_max", ""),
-                    "Created": job.get("created", ""),
-                    "Description": job.get("description", "").replace("\n", " "),
-                    "Redirect URL": job.get("redirect_url", ""),
-                })
-
-            # Sleep between page fetches to avoid hitting rate limits
-            time.sleep(15)
-            page += 1
-
-        # Convert to DataFrame and save to CSV
-        if all_jobs:
-            jobs_df = pd.DataFrame(all_jobs)
-            jobs_df["timestamp"] = datetime.now()
+
+def save_fetch_state(state, path=FETCH_STATE_PATH):
+    """Persists the high-water marks atomically so a crash cannot leave a truncated file."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(state, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def only_known_listings(job_listings, high_water_mark):
+    """True when every listing on the page is older than the newest listing already fetched."""
+    if high_water_mark is None:
+        return False
+    for job in job_listings:
+        created = parse_created(job.get("created"))
+        if created is None or created >= high_water_mark:
+            return False
+    return True
+
+
+def parse_jobs(job_listings):
+    """Reduces the API listings to the columns stored in adzuna_results_raw."""
+    return [{
+        "Title": job.get("title", ""),
+        "Company": job.get("company", {}).get("display_name", ""),
+        "Location": job.get("location", {}).get("display_name", ""),
+        "Category": job.get("category", {}).get("label", ""),
+        "Contract Type": job.get("contract_type", ""),
+        "Contract Time": job.get("contract_time", ""),
+        "Salary Min": job.get("salary_min", ""),
+        "Salary Max": job.get("salary_max", ""),
+        "Created": job.get("created", ""),
+        "Description": job.get("description", "").replace("\n", " "),
+        "Redirect URL": job.get("redirect_url", ""),
+    } for job in job_listings]
+
+
+def page_frame(job_listings, timestamp, country=DEFAULT_COUNTRY):
+    """One page of listings as a raw frame stamped with its batch timestamp, country and listing keys."""
+    jobs_df = pd.DataFrame(parse_jobs(job_listings))
+    jobs_df["timestamp"] = timestamp
+    jobs_df["Country"] = country
+    jobs_df["Listing Key"] = listing_keys(jobs_df)
+    return jobs_df
+
+
+class CsvSink:
+    """Appends each page of a term to that term's timestamped CSV as it arrives."""
+
+    def __init__(self, output_dir):
+        self.output_dir = output_dir
+        self.paths = {}
+        os.makedirs(output_dir, exist_ok=True)
+
+    def write_page(self, term, jobs_df):
+        if term not in self.paths:
             timestamp_str = datetime.now().strftime("%Y%m%d_%H%M%S")
             suffix = term.lower().replace(" ", "_")
+            self.paths[term] = os.path.join(self.output_dir, f"jobs_output_data_{suffix}_{timestamp_str}.csv")
+            jobs_df.to_csv(self.paths[term], index=False)
+        else:
+            jobs_df.to_csv(self.paths[term], index=False, header=False, mode="a")
 
-            csv_dir_path = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
-            output_csv_path = os.path.join(csv_dir_path, f"jobs_output_data_{suffix}_{timestamp_str}.csv")
-
-            jobs_df.to_csv(output_csv_path, index=False)
-            print(f"Data for '{term}' successfully fetched and saved to '{output_csv_path}'")
+    def close_term(self, term):
+        if term in self.paths:
+            print(f"Data for '{term}' successfully fetched and saved to '{self.paths[term]}'")
         else:
             print(f"No job data was fetched for '{term}'")
 
 
-# Call the function with the specified terms
-fetch_jobs_and_save_to_csv(["Data Scientist", "Data Analyst","Data Engineer"])
+class PostgresSink:
+    """Pushes each page straight into adzuna_results_raw through a COPY buffer."""
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.rows = {}
+
+    def write_page(self, term, jobs_df):
+        inserted = copy_frame_to_raw(self.conn, prepare_raw_frame(jobs_df))
+        self.conn.commit()
+        self.rows[term] = self.rows.get(term, 0) + inserted
+
+    def close_term(self, term):
+        print(f"Streamed {self.rows.get(term, 0)} rows for '{term}' into {RAW_TABLE}")
+
+
+def create_sinks(stream_to_db, save_csv, conn=None, output_dir=None):
+    """Builds the page sinks for a run. Returns (sinks, conn, owns_conn)."""
+    csv_dir_path = output_dir or os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+    sinks = []
+    owns_conn = False
+    if stream_to_db:
+        if conn is None:
+            conn = get_connection()
+            owns_conn = True
+        sinks.append(PostgresSink(conn))
+    if save_csv:
+        # Streamed runs archive their CSVs directly so the ingestion script does not load them twice
+        sinks.append(CsvSink(os.path.join(csv_dir_path, "archive") if stream_to_db else csv_dir_path))
+    return sinks, conn, owns_conn
+
+
+def refresh_hours(churn_per_hour):
+    """How long to wait between fetches of a search finding churn_per_hour new listings an hour."""
+    if not churn_per_hour:
+        return MAX_REFRESH_HOURS
+    return min(MAX_REFRESH_HOURS, max(MIN_REFRESH_HOURS, RESULTS_PER_PAGE / churn_per_hour))
+
+
+def schedule_searches(search_pairs, fetch_state, max_calls=None, now=None):
+    """The (country, term) searches due for a fetch, most overdue first.
+
+    A search is due once its refresh interval has passed; searches never fetched come first.
+    With max_calls set, searches are taken while their estimated pages (the new listings
+    expected since the last fetch, plus the page reaching known ones) fit in it, and at
+    least one is always taken. The estimate ignores retries; the fetch counts every request
+    against max_calls and stops there.
+    """
+    now = now or datetime.now()
+    due = []
+    for country, term in search_pairs:
+        entry = fetch_state.get(search_label(country, term), {})
+        if "last_fetched" not in entry:
+            due.append((math.inf, 1, (country, term)))
+            continue
+        elapsed = (now - datetime.fromisoformat(entry["last_fetched"])).total_seconds() / 3600
+        overdue = elapsed / refresh_hours(entry.get("churn_per_hour"))
+        if overdue >= 1:
+            pages = math.ceil(entry.get("churn_per_hour", 0) * elapsed / RESULTS_PER_PAGE) + 1
+            due.append((overdue, pages, (country, term)))
+
+    due.sort(key=lambda item: item[0], reverse=True)
+    scheduled, calls = [], 0
+    for _, pages, search in due:
+        if max_calls and scheduled and calls + pages > max_calls:
+            continue
+        scheduled.append(search)
+        calls += pages
+    print(f"Scheduled {len(scheduled)} of {len(search_pairs)} searches (about {calls} calls), "
+          f"{len(due) - len(scheduled)} more due but over budget.")
+    return scheduled
+
+
+def fetch_jobs_and_save_to_csv(search_pairs, max_workers=4, calls_per_minute=API_CALLS_PER_MINUTE,
+                               incremental=True, stream_to_db=False, save_csv=True, conn=None,
+                               output_dir=None, state_path=FETCH_STATE_PATH, archive_dir=ARCHIVE_DIR,
+                               max_shard_pages=None, locations=None, max_calls=None):
+    """Fetches every page for each (country, term) search concurrently behind one shared rate limiter.
+
+    Page 1 of each search reveals the result count, after which the remaining pages are
+    spread across the worker pool, earlier searches first. Wall-clock time is bounded by
+    the API quota rather than by fixed sleeps. Returns the number of listings fetched.
+    locations maps a country code to the "where" sent with its searches (default
+    search_catalogue.json's).
+
+    With incremental=True results are requested newest first and a search stops paginating
+    at the first page holding only listings older than the previous run's high-water mark.
+    Until then each of its shards has one page in flight at a time, so no call is spent on
+    pages past that one; searches without a mark, and full runs, page in parallel.
+
+    Each page is written to the sinks as soon as it arrives, so memory holds one page
+    per in-flight request. With stream_to_db=True pages are COPYed into adzuna_results_raw
+    and the CSVs, if kept, go straight to the archive folder as a record of the run.
+
+    With max_shard_pages set (eg SHARD_MAX_PAGES), a search with more pages than that is
+    split into state and then salary band shards, each paginated independently, so no
+    single chain of pages runs deep and a failed page only stops its own shard. Rows that
+    overlapping shards both return are written once per search.
+
+    With max_calls set, no more than that many HTTP requests are made, retries included;
+    searches left unfinished keep their previous high-water mark, so the next run fills the gap.
+
+    Every page response is also kept, compressed, in the responses folder (archive_dir,
+    None to skip it) so the run can be replayed with replay_archived_run.
+
+    output_dir (default the project root) and state_path let a benchmark run without
+    touching the real CSVs and high-water marks.
+    """
+    locations = locations or country_locations(load_catalogue())
+    endpoints = {country: search_params(country=country, where=locations.get(country))
+                 for country in dict.fromkeys(country for country, _ in search_pairs)}
+
+    # A full run ignores the marks but still refreshes them for the next incremental run
+    fetch_state = load_fetch_state(state_path)
+    previous_marks = {search_label(country, term): parse_created(fetch_state.get(search_label(country, term), {}).get("latest_created"))
+                      for country, term in search_pairs}
+    high_water_marks = previous_marks if incremental else dict.fromkeys(previous_marks)
+
+    sinks, conn, owns_conn = create_sinks(stream_to_db, save_csv, conn, output_dir)
+    archive = ResponseArchive(archive_dir) if archive_dir else None
+
+    limiter = TokenBucket(calls_per_minute)
+    budget = CallBudget(max_calls)
+    total_rows = 0
+    session = create_session(max_workers)
+    started = datetime.now()
+
+    # Per-search state: batch timestamp, newest listing seen, listings newer than the previous
+    # mark, listing keys written (to drop the rows overlapping slices return twice) and the
+    # shards the search is paginated in
+    terms = {search_label(country, term): {"timestamp": None, "latest_created": None, "failed": False, "saved": False,
+                                           "new": 0, "seen": set(), "shards": []} for country, term in search_pairs}
+    shards = []
+
+    def add_shard(country, term, filters, label, parent=None):
+        """Adds a slice of a search with its own pagination state."""
+        shard = {"country": country, "term": term, "search": search_label(country, term), "filters": filters,
+                 "label": label, "parent": parent, "children": [], "next_page": 1, "total_pages": None, "count": None,
+                 "stopped": False, "in_flight": 0, "fallback": False, "cancelled": False}
+        shards.append(shard)
+        terms[shard["search"]]["shards"].append(shard)
+        if parent is not None:
+            parent["children"].append(shard)
+        return shard
+
+    def stop_descendants(shard):
+        for child in shard["children"]:
+            child["stopped"] = child["cancelled"] = True
+            stop_descendants(child)
+
+    def shard_finished(shard):
+        return shard["in_flight"] == 0 and (shard["stopped"] or (
+            shard["total_pages"] is not None and shard["next_page"] > shard["total_pages"]))
+
+    def waiting(shard):
+        """A shard with a high-water mark pages one at a time, so no page past the first known one is requested."""
+        return shard["in_flight"] > 0 and high_water_marks[shard["search"]] is not None
+
+    def next_request():
+        """Picks the next (shard, page) to submit: any page 1 first, as it may split the shard."""
+        for shard in shards:
+            if not shard["stopped"] and shard["total_pages"] is None and shard["next_page"] == 1:
+                return shard, 1
+        for shard in shards:
+            if not shard["stopped"] and shard["total_pages"] is not None and shard["next_page"] <= shard["total_pages"] \
+                    and not waiting(shard):
+                return shard, shard["next_page"]
+        return None
+
+    for country, term in search_pairs:
+        add_shard(country, term, {}, search_label(country, term))
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        in_flight = {}
+
+        for search in terms:
+            print(f"Starting search for: {search}")
+
+        while True:
+            while len(in_flight) < max_workers:
+                request = next_request()
+                if request is None:
+                    break
+                # Pages already in flight when the budget runs out are refused by fetch_page
+                if budget.spent():
+                    print(f"API budget of {max_calls} calls spent, the unfinished searches resume next run.")
+                    for shard in shards:
+                        if not shard["stopped"] and (shard["total_pages"] is None or shard["next_page"] <= shard["total_pages"]):
+                            shard["stopped"] = True
+                            terms[shard["search"]]["failed"] = True
+                    break
+                shard, page = request
+                base_url, params = endpoints[shard["country"]]
+                print(f"Fetching page {page} for '{shard['label']}'...")
+                future = executor.submit(fetch_page, session, limiter, f"{base_url}{page}",
+                                         request_params(params, shard["term"], shard["filters"]),
+                                         f"page {page} of '{shard['label']}'", budget)
+                in_flight[future] = (shard, page)
+                shard["next_page"] = page + 1
+                shard["in_flight"] += 1
+
+            if not in_flight:
+                break
+
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                shard, page = in_flight.pop(future)
+                search = shard["search"]
+                state = terms[search]
+                shard["in_flight"] -= 1
+                try:
+                    data = future.result()
+                except Exception as e:
+                    # eg a 200 response that is not JSON; handled like any other failed page
+                    print(f"Fetching page {page} of '{shard['label']}' failed: {e!r}")
+                    data = None
+
+                if data is None:
+                    # Only this slice stops; the rest of the search carries on
+                    shard["stopped"] = True
+                    state["failed"] = True
+                else:
+                    job_listings = data.get('results', [])
+                    if page == 1:
+                        shard["count"] = data.get("count", 0)
+                        shard["total_pages"] = math.ceil(shard["count"] / RESULTS_PER_PAGE)
+                        children = split_filters(shard["filters"], shard["country"]) if (
+                            max_shard_pages and shard["total_pages"] > max_shard_pages
+                            and not shard["fallback"] and not shard["cancelled"]) else []
+                        if children:
+                            # The page 1 rows are kept; the rest of the search comes from the slices
+                            print(f"'{shard['label']}' has {shard['total_pages']} pages, splitting into {len(children)} shards.")
+                            shard["stopped"] = True
+                            metrics.inc("adzuna_shard_splits_total", term=search)
+                            for filters, label in children:
+                                add_shard(shard["country"], shard["term"], filters, f"{shard['label']} / {label}", shard)
+                    if not job_listings:
+                        print(f"No more results for '{shard['label']}', ending pagination.")
+                        shard["stopped"] = True
+                    else:
+                        # Every page of a search shares one timestamp, which identifies the batch in raw
+                        if state["timestamp"] is None:
+                            state["timestamp"] = datetime.now()
+                        if archive:
+                            archive.write_page(search, page, data, state["timestamp"], shard=shard["label"],
+                                               country=shard["country"])
+                        jobs_df = page_frame(job_listings, state["timestamp"], shard["country"])
+                        metrics.inc("adzuna_pages_fetched_total", term=search)
+                        metrics.inc("adzuna_rows_fetched_total", len(jobs_df), term=search)
+                        new_rows = ~jobs_df["Listing Key"].isin(state["seen"]) & ~jobs_df["Listing Key"].duplicated()
+                        if not new_rows.all():
+                            metrics.inc("adzuna_duplicate_rows_total", int((~new_rows).sum()), term=search)
+                            jobs_df = jobs_df[new_rows]
+                        state["seen"].update(jobs_df["Listing Key"])
+                        total_rows += len(jobs_df)
+                        if len(jobs_df):
+                            for sink in sinks:
+                                sink.write_page(search, jobs_df)
+                        previous = previous_marks[search]
+                        for job, is_new in zip(job_listings, new_rows):
+                            created = parse_created(job.get("created"))
+                            if created and (state["latest_created"] is None or created > state["latest_created"]):
+                                state["latest_created"] = created
+                            if is_new and (previous is None or (created and created > previous)):
+                                state["new"] += 1
+                        if not shard["stopped"] and only_known_listings(job_listings, high_water_marks[search]):
+                            print(f"Page {page} for '{shard['label']}' holds only known listings, ending pagination.")
+                            shard["stopped"] = True
+
+                # Coverage check once every slice of a split has reported its count
+                parent = shard["parent"]
+                if page == 1 and parent is not None and not parent.get("checked") and not parent["cancelled"] and \
+                        all(child["count"] is not None for child in parent["children"]):
+                    parent["checked"] = True
+                    covered = sum(child["count"] for child in parent["children"])
+                    if covered < parent["count"] * (1 - SHARD_COVERAGE_TOLERANCE):
+                        print(f"Shards of '{parent['label']}' cover {covered} of {parent['count']} listings, "
+                              f"paginating it unsplit instead.")
+                        metrics.inc("adzuna_shard_fallbacks_total", term=search)
+                        stop_descendants(parent)
+                        parent["fallback"] = True
+                        parent["stopped"] = False
+
+                if not state["saved"] and all(shard_finished(search_shard) for search_shard in state["shards"]):
+                    state["saved"] = True
+                    for sink in sinks:
+                        sink.close_term(search)
+                    if len(state["shards"]) > 1:
+                        print(f"'{search}': {len(state['seen'])} distinct listings from {len(state['shards'])} shards "
+                              f"(the API reports {state['shards'][0]['count']}).")
+
+                    # Only advance the mark when no page was lost, otherwise the gap would be skipped next run
+                    if not state["failed"] and state["latest_created"] is not None:
+                        save_search_state(fetch_state, search, state, previous_marks[search], started)
+                        save_fetch_state(fetch_state, state_path)
+
+    session.close()
+    if owns_conn:
+        conn.close()
+    if archive and archive.pages:
+        print(f"Archived {archive.pages} page responses to {archive.path}")
+    return total_rows
+
+
+def save_search_state(fetch_state, search, state, previous_mark, started):
+    """Records a completed search's high-water mark and the new listings an hour it found, smoothed."""
+    entry = fetch_state.get(search, {})
+    if previous_mark is not None and "last_fetched" in entry:
+        hours = (started - datetime.fromisoformat(entry["last_fetched"])).total_seconds() / 3600
+    else:
+        # A first fetch sees the whole MAX_DAYS_OLD window
+        hours = MAX_DAYS_OLD * 24
+    churn = state["new"] / max(hours, MIN_REFRESH_HOURS)
+    if "churn_per_hour" in entry:
+        churn = CHURN_SMOOTHING * churn + (1 - CHURN_SMOOTHING) * entry["churn_per_hour"]
+    latest = state["latest_created"] if previous_mark is None else max(previous_mark, state["latest_created"])
+    fetch_state[search] = {"latest_created": latest.isoformat(), "last_fetched": started.isoformat(),
+                           "churn_per_hour": round(churn, 3)}
+
+
+def fetch_catalogue(catalogue=None, incremental=True, all_searches=False, state_path=FETCH_STATE_PATH, **kwargs):
+    """Fetches the searches of the search catalogue that are due, within its API budget.
+
+    A full run (incremental=False) or all_searches=True fetches every search regardless of
+    its refresh interval. The budget's calls_per_run caps incremental runs, --all included;
+    a full run pages through every result, so only calls_per_minute applies to it. Other
+    keywords are passed to fetch_jobs_and_save_to_csv. Returns the number of listings fetched.
+    """
+    catalogue = catalogue or load_catalogue()
+    budget = catalogue.get("budget", {})
+    search_pairs = searches(catalogue)
+    if incremental and not all_searches:
+        search_pairs = schedule_searches(search_pairs, load_fetch_state(state_path), budget.get("calls_per_run"))
+    if not search_pairs:
+        return 0
+    return fetch_jobs_and_save_to_csv(search_pairs, calls_per_minute=budget.get("calls_per_minute", API_CALLS_PER_MINUTE),
+                                      incremental=incremental, state_path=state_path,
+                                      locations=country_locations(catalogue),
+                                      max_calls=budget.get("calls_per_run") if incremental else None, **kwargs)
+
+
+def replay_archived_run(run_id, stream_to_db=False, save_csv=True, conn=None, output_dir=None,
+                        archive_dir=ARCHIVE_DIR, terms=None, as_new_batch=False):
+    """Rebuilds a fetch run's CSVs or raw-table loads from its archived responses, without the API.
+
+    Listings keep the batch timestamp of the original fetch, so replaying into a table
+    that already holds the run adds nothing. With as_new_batch they are stamped with the
+    replay time instead, so the next merge applies them over master like a fresh fetch,
+    eg after a change to the field mapping. Rows repeated across shards are written once.
+    run_id "latest" replays the most recent run. Returns the number of listings replayed.
+    """
+    replay_timestamp = datetime.now() if as_new_batch else None
+    if run_id == "latest":
+        runs = list_runs(archive_dir)
+        if not runs:
+            raise FileNotFoundError(f"No archived runs in {archive_dir}")
+        run_id = runs[-1]
+    sinks, conn, owns_conn = create_sinks(stream_to_db, save_csv, conn, output_dir)
+    total_rows = 0
+    seen = {}
+    try:
+        for record in read_pages(run_id, archive_dir, terms):
+            job_listings = record["response"].get("results", [])
+            if not job_listings:
+                continue
+            jobs_df = page_frame(job_listings, replay_timestamp or record["timestamp"], record.get("country", DEFAULT_COUNTRY))
+            term_seen = seen.setdefault(record["term"], set())
+            jobs_df = jobs_df[~jobs_df["Listing Key"].isin(term_seen) & ~jobs_df["Listing Key"].duplicated()]
+            term_seen.update(jobs_df["Listing Key"])
+            total_rows += len(jobs_df)
+            for sink in sinks:
+                sink.write_page(record["term"], jobs_df)
+        for term in dict.fromkeys(entry["term"] for entry in read_index(run_id, archive_dir)):
+            if not terms or term in terms:
+                for sink in sinks:
+                    sink.close_term(term)
+    finally:
+        if owns_conn:
+            conn.close()
+    print(f"Replayed {total_rows} listings from run {run_id}")
+    return total_rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fetch Adzuna job listings to CSV.")
+    parser.add_argument("--full", action="store_true",
+                        help="ignore the saved high-water marks and page through every result, "
+                             "without the catalogue's calls_per_run limit")
+    parser.add_argument("--all", action="store_true",
+                        help="fetch every search in the catalogue, not only those due a refresh")
+    parser.add_argument("--stream", action="store_true",
+                        help="COPY each page into adzuna_results_raw instead of leaving CSVs for ingestion")
+    parser.add_argument("--no-csv", action="store_true",
+                        help="with --stream, skip writing the archive CSVs")
+    parser.add_argument("--shard", action="store_true",
+                        help=f"split searches deeper than {SHARD_MAX_PAGES} pages into state and salary band shards")
+    parser.add_argument("--no-archive", action="store_true",
+                        help="do not keep the raw page responses in the responses folder")
+    parser.add_argument("--replay", metavar="RUN_ID",
+                        help="rebuild the CSVs (or with --stream, the raw rows) of an archived run instead of fetching; 'latest' for the last run")
+    parser.add_argument("--as-new-batch", action="store_true",
+                        help="with --replay, stamp the listings with the replay time so the next merge applies them again")
+    parser.add_argument("--list-runs", action="store_true", help="list the archived runs and exit")
+    args = parser.parse_args()
+
+    save_csv = not (args.stream and args.no_csv)
+    if args.list_runs:
+        for run_id in list_runs():
+            index = read_index(run_id)
+            print(f"{run_id}: {len(index)} pages, {sum(entry['listings'] for entry in index)} listings")
+    elif args.replay:
+        replay_archived_run(args.replay, stream_to_db=args.stream, save_csv=save_csv,
+                            as_new_batch=args.as_new_batch)
+    else:
+        # Fetch the catalogue's searches that are due
+        fetch_catalogue(incremental=not args.full, all_searches=args.all, stream_to_db=args.stream,
+                        save_csv=save_csv, archive_dir=None if args.no_archive else ARCHIVE_DIR,
+                        max_shard_pages=SHARD_MAX_PAGES if args.shard else None)
@@ -0,0 +1,253 @@
+import argparse
+import math
+import os
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from datetime import datetime
+import pandas as pd
+from adzuna_api_call_v2 import (API_CALLS_PER_MINUTE, RESULTS_PER_PAGE, CallBudget, TokenBucket, create_session, fetch_page,
+                                load_fetch_state, page_frame, save_fetch_state, search_params)
+from db_utils import RAW_TABLE, get_connection, prepare_raw_frame, copy_frame_to_raw
+import pipeline_metrics as metrics
+from response_archive import ARCHIVE_DIR, ResponseArchive
+from search_catalogue import country_locations, load_catalogue, search_label, searches
+
+# A historical backfill runs to thousands of pages, more than a day's API quota, so it is
+# split into units of PAGES_PER_UNIT pages of one search. The plan and each unit's status live
+# in BACKFILL_STATE_PATH; a unit is written (one CSV, or one COPY transaction) and checkpointed
+# only once all of its pages arrived, so an interrupted backfill resumes at the first unit not done.
+BACKFILL_STATE_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "backfill_state.json"))
+BACKFILL_MAX_DAYS_OLD = 90
+PAGES_PER_UNIT = 10
+# Results are paged oldest first, so listings posted during the backfill land after the planned
+# pages; listings ageing out of the window shift pages forward instead, so each unit re-reads
+# the last page of the unit before it. Each written unit keeps the keys of its first and last
+# pages, so whichever of two neighbouring units is written second leaves out the listings they share
+OVERLAP_PAGES = 1
+# Units failing in a row, usually because the daily quota is spent, before the backfill stops
+MAX_CONSECUTIVE_FAILURES = 3
+
+
+def unit_label(unit):
+    return f"'{search_label(unit['country'], unit['term'])}' pages {unit['first_page']}-{unit['last_page']}"
+
+
+def plan_units(country, term, total_pages, pages_per_unit=PAGES_PER_UNIT):
+    """Splits a search's pages into pending units of pages_per_unit pages."""
+    return [{"country": country, "term": term, "first_page": first,
+             "last_page": min(first + pages_per_unit - 1, total_pages), "status": "pending", "rows": 0, "timestamp": None}
+            for first in range(1, total_pages + 1, pages_per_unit)]
+
+
+def neighbour_edge_keys(units, unit):
+    """The listing keys written from the edge pages of the done units next to unit in its search."""
+    keys = set()
+    for other in units:
+        if other["status"] == "done" and (other["country"], other["term"]) == (unit["country"], unit["term"]) and \
+                (other["last_page"] == unit["first_page"] - 1 or other["first_page"] == unit["last_page"] + 1):
+            keys.update(other.get("edge_keys", []))
+    return keys
+
+
+def fetch_unit(session, limiter, base_url, params, unit, budget=None):
+    """Fetches the pages of a unit in order. Returns [(page, response)], or None if a page failed."""
+    pages = []
+    for page in range(max(1, unit["first_page"] - OVERLAP_PAGES), unit["last_page"] + 1):
+        data = fetch_page(session, limiter, f"{base_url}{page}", dict(params, what=unit["term"]),
+                          f"page {page} of '{search_label(unit['country'], unit['term'])}'", budget)
+        if data is None:
+            return None
+        pages.append((page, data))
+        if not data.get("results"):
+            break  # The search has shrunk since it was planned
+    return pages
+
+
+def write_unit_csv(output_dir, unit, jobs_df):
+    """Writes a unit's listings to its own CSV, renamed into place so ingestion never sees half a file."""
+    suffix = search_label(unit["country"], unit["term"]).lower().replace(" ", "_")
+    path = os.path.join(output_dir, f"jobs_output_data_{suffix}_backfill_"
+                                    f"p{unit['first_page']:05d}-{unit['last_page']:05d}_{unit['timestamp']}.csv")
+    tmp_path = f"{path}.tmp"
+    jobs_df.to_csv(tmp_path, index=False)
+    os.replace(tmp_path, path)
+    return path
+
+
+def backfill(search_pairs, max_days_old=BACKFILL_MAX_DAYS_OLD, pages_per_unit=PAGES_PER_UNIT, max_workers=2,
+             calls_per_minute=API_CALLS_PER_MINUTE, stream_to_db=False, conn=None, output_dir=None,
+             state_path=BACKFILL_STATE_PATH, archive_dir=ARCHIVE_DIR, restart=False, locations=None, max_calls=None):
+    """Fetches every listing of the last max_days_old days for each (country, term) search in checkpointed units.
+
+    An unfinished backfill in state_path is resumed with its own plan; restart=True (or a
+    finished backfill) plans a new one. Page 1 of each search sizes its plan, then up to
+    max_workers units are fetched at once behind one shared rate limiter. Each finished
+    unit is written to its own CSV in output_dir (default the project root) or, with
+    stream_to_db=True, COPYed into adzuna_results_raw in one transaction, and stamped
+    with the time it was written, so a later unit is never older than the last merge.
+    With max_calls set, no more than that many HTTP requests are made, retries included;
+    a unit the budget cuts short is retried when the backfill resumes.
+    Returns the number of listings written by this call.
+    """
+    locations = locations or country_locations(load_catalogue())
+    endpoints = {country: search_params(max_days_old=max_days_old, sort_dir="up", country=country,
+                                        where=locations.get(country))
+                 for country in dict.fromkeys(country for country, _ in search_pairs)}
+    output_dir = output_dir or os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+    os.makedirs(output_dir, exist_ok=True)
+
+    state = load_fetch_state(state_path)
+    if not state or state.get("complete") or restart:
+        state = {"max_days_old": max_days_old, "pages_per_unit": pages_per_unit, "terms": {}, "units": [],
+                 "complete": False}
+    else:
+        print(f"Resuming the backfill in {state_path}: "
+              f"{sum(unit['status'] == 'done' for unit in state['units'])} of {len(state['units'])} units done.")
+        for _, params in endpoints.values():
+            params["max_days_old"] = state["max_days_old"]
+
+    limiter = TokenBucket(calls_per_minute)
+    budget = CallBudget(max_calls)
+    session = create_session(max_workers)
+    owns_conn = stream_to_db and conn is None
+    if owns_conn:
+        conn = get_connection()
+    archive = ResponseArchive(archive_dir) if archive_dir else None
+    total_rows = 0
+
+    try:
+        for country, term in search_pairs:
+            search = search_label(country, term)
+            if search in state["terms"]:
+                continue
+            base_url, params = endpoints[country]
+            data = fetch_page(session, limiter, f"{base_url}1", dict(params, what=term), f"page 1 of '{search}'", budget)
+            if data is None:
+                print(f"Could not size the backfill of '{search}', it will be planned on the next run.")
+                continue
+            count = data.get("count", 0)
+            total_pages = math.ceil(count / RESULTS_PER_PAGE)
+            units = plan_units(country, term, total_pages, state["pages_per_unit"])
+            state["terms"][search] = {"count": count, "total_pages": total_pages}
+            state["units"].extend(units)
+            save_fetch_state(state, state_path)
+            print(f"Planned {len(units)} units for '{search}' ({count} listings, {total_pages} pages).")
+
+        pending = [unit for unit in state["units"]
+                   if unit["status"] != "done" and (unit["country"], unit["term"]) in search_pairs]
+        failures = 0
+        budget_stopped = False
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            in_flight = {}
+            while True:
+                if pending and budget.spent() and not budget_stopped:
+                    budget_stopped = True
+                    print(f"API budget of {max_calls} calls spent, stopping. Rerun to resume.")
+                while pending and len(in_flight) < max_workers and failures < MAX_CONSECUTIVE_FAILURES \
+                        and not budget.spent():
+                    unit = pending.pop(0)
+                    print(f"Fetching {unit_label(unit)}...")
+                    base_url, params = endpoints[unit["country"]]
+                    in_flight[executor.submit(fetch_unit, session, limiter, base_url, params, unit, budget)] = unit
+                if not in_flight:
+                    break
+
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    unit = in_flight.pop(future)
+                    try:
+                        pages = future.result()
+                    except Exception as e:
+                        print(f"Fetching {unit_label(unit)} failed: {e!r}")
+                        pages = None
+                    if pages is None:
+                        # A unit cut short by the budget is not a failure of the API
+                        if not budget.spent():
+                            failures += 1
+                        unit["status"] = "failed"
+                        save_fetch_state(state, state_path)
+                        print(f"{unit_label(unit)} failed; it will be retried when the backfill resumes.")
+                        if failures == MAX_CONSECUTIVE_FAILURES:
+                            print(f"{failures} units failed in a row, stopping. Rerun to resume.")
+                        continue
+                    failures = 0
+
+                    timestamp = datetime.now()
+                    unit["timestamp"] = timestamp.strftime("%Y%m%d_%H%M%S")
+                    frames = [page_frame(data["results"], timestamp, unit["country"]).assign(page=page)
+                              for page, data in pages if data.get("results")]
+                    jobs_df = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame({"Listing Key": [], "page": []})
+                    # Overlapping pages repeat listings, within the unit and with its neighbours
+                    jobs_df = jobs_df[~jobs_df["Listing Key"].duplicated()
+                                      & ~jobs_df["Listing Key"].isin(neighbour_edge_keys(state["units"], unit))]
+                    edge_pages = {pages[0][0], pages[-1][0]}
+                    edge_keys = [int(key) for key in jobs_df.loc[jobs_df["page"].isin(edge_pages), "Listing Key"]]
+                    jobs_df = jobs_df.drop(columns="page")
+                    search = search_label(unit["country"], unit["term"])
+                    metrics.inc("adzuna_pages_fetched_total", len(pages), term=search)
+                    metrics.inc("adzuna_rows_fetched_total", len(jobs_df), term=search)
+
+                    if archive:
+                        for page, data in pages:
+                            archive.write_page(search, page, data, timestamp, shard=f"backfill {unit_label(unit)}",
+                                               country=unit["country"])
+                    if stream_to_db:
+                        inserted = copy_frame_to_raw(conn, prepare_raw_frame(jobs_df)) if len(jobs_df) else 0
+                        conn.commit()
+                        print(f"Streamed {inserted} rows of {unit_label(unit)} into {RAW_TABLE}")
+                    elif len(jobs_df):
+                        path = write_unit_csv(output_dir, unit, jobs_df)
+                        print(f"Saved {len(jobs_df)} rows of {unit_label(unit)} to '{path}'")
+
+                    # The checkpoint follows the write, so a crash between them only repeats this unit
+                    unit["status"] = "done"
+                    unit["rows"] = len(jobs_df)
+                    unit["edge_keys"] = edge_keys
+                    total_rows += len(jobs_df)
+                    save_fetch_state(state, state_path)
+    finally:
+        session.close()
+        if owns_conn:
+            conn.close()
+
+    remaining = sum(unit["status"] != "done" for unit in state["units"])
+    if remaining == 0 and all(search_label(country, term) in state["terms"] for country, term in search_pairs):
+        state["complete"] = True
+        save_fetch_state(state, state_path)
+        print(f"Backfill complete: {len(state['units'])} units, "
+              f"{sum(unit['rows'] for unit in state['units'])} listings.")
+    else:
+        print(f"Backfill stopped with {remaining} units left. Rerun to resume.")
+    if archive and archive.pages:
+        print(f"Archived {archive.pages} page responses to {archive.path}")
+    return total_rows
+
+
+def backfill_catalogue(catalogue=None, **kwargs):
+    """Backfills the search catalogue's searches within its API budget.
+
+    The budget's calls_per_minute paces the requests and its calls_per_run caps each call,
+    so a long backfill spreads over several runs, each resuming where the last stopped.
+    Other keywords are passed to backfill. Returns the number of listings written.
+    """
+    catalogue = catalogue or load_catalogue()
+    budget = catalogue.get("budget", {})
+    return backfill(searches(catalogue), locations=country_locations(catalogue),
+                    calls_per_minute=budget.get("calls_per_minute", API_CALLS_PER_MINUTE),
+                    max_calls=budget.get("calls_per_run"), **kwargs)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Backfill historical Adzuna listings in resumable units.")
+    parser.add_argument("--days", type=int, default=BACKFILL_MAX_DAYS_OLD, help="how many days back to fetch")
+    parser.add_argument("--pages-per-unit", type=int, default=PAGES_PER_UNIT, help="pages fetched and checkpointed together")
+    parser.add_argument("--workers", type=int, default=2, help="units fetched at once")
+    parser.add_argument("--stream", action="store_true",
+                        help="COPY each unit into adzuna_results_raw instead of writing CSVs for ingestion")
+    parser.add_argument("--restart", action="store_true", help="discard an unfinished backfill and plan a new one")
+    parser.add_argument("--no-archive", action="store_true",
+                        help="do not keep the raw page responses in the responses folder")
+    args = parser.parse_args()
+
+    backfill_catalogue(max_days_old=args.days, pages_per_unit=args.pages_per_unit, max_workers=args.workers,
+                       stream_to_db=args.stream, restart=args.restart, archive_dir=None if args.no_archive else ARCHIVE_DIR)
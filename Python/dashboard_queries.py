@@ -0,0 +1,262 @@
+import pandas as pd
+from psycopg2 import errors
+from skills import SKILLS
+
+# The KPIs and charts read the daily rollups (SQL/refresh_rollups.sql), a few hundred rows whatever
+# the history. A search needs the listings' text, so it reads the materialized view instead, as
+# does the sample table, the only row-level query
+DASHBOARD_VIEW = "public.adzuna_jobs_streamlit_dashboard"
+DAILY_ROLLUP = "public.adzuna_daily_rollup"
+SALARY_HISTOGRAM = "public.adzuna_daily_salary_histogram"
+SKILL_ROLLUP = "public.adzuna_daily_skill_rollup"
+SALARY_BUCKET_WIDTH = 5000
+
+
+def query_frame(conn, query, params=None):
+    """Runs a query on a psycopg2 connection and returns the rows as a DataFrame.
+
+    Numeric columns come back as floats rather than Decimals, as with pd.read_sql,
+    which warns on every call when handed a raw psycopg2 connection.
+    """
+    with conn.cursor() as cur:
+        cur.execute(query, params)
+        return pd.DataFrame.from_records(cur.fetchall(), columns=[column.name for column in cur.description],
+                                         coerce_float=True)
+
+
+def data_version(conn):
+    """Identifies the data behind the dashboard: the last successful dashboard refresh of the pipeline.
+
+    Cheap enough to probe on every rerun; cached results are keyed on it so they are
+    reused until the pipeline publishes new data.
+    """
+    try:
+        with conn.cursor() as cur:
+            cur.execute("""
+                SELECT run_id, finished_at
+                FROM pipeline_run_log
+                WHERE stage = 'refresh_dashboard'
+                AND status = 'success'
+                ORDER BY finished_at DESC
+                LIMIT 1
+            """)
+            row = cur.fetchone()
+    except errors.UndefinedTable:
+        # Databases without the run log never invalidate; restart the dashboard to reload
+        conn.rollback()
+        row = None
+    return f"{row[0]}:{row[1].isoformat()}" if row else "unversioned"
+
+
+def filter_clause(start_date, end_date, families, search=None, one_per_cluster=False):
+    """Returns the WHERE clause and parameters shared by every filtered query, on the view or a rollup.
+
+    search is free text in web search syntax (quoted phrases, or, -word), matched
+    against the title and description through the view's full-text index.
+    one_per_cluster counts each near-duplicate cluster once, by its earliest listing.
+    """
+    clause = """
+        created <= current_date
+        AND created BETWEEN %(start_date)s AND %(end_date)s
+        AND title_data_family = ANY(%(families)s)
+    """
+    params = {"start_date": start_date, "end_date": end_date, "families": list(families)}
+    if one_per_cluster:
+        clause += "AND cluster_representative\n"
+    if search:
+        clause += "AND search_vector @@ websearch_to_tsquery('english', %(search)s)"
+        params["search"] = search
+    return clause, params
+
+
+def date_bounds(conn):
+    """First and last created date available to the date slider."""
+    with conn.cursor() as cur:
+        cur.execute(f"SELECT min(created), max(created) FROM {DAILY_ROLLUP} WHERE created <= current_date")
+        return cur.fetchone()
+
+
+def job_families(conn):
+    """Job families available to the family filter."""
+    with conn.cursor() as cur:
+        cur.execute(f"""
+            SELECT DISTINCT title_data_family
+            FROM {DAILY_ROLLUP}
+            WHERE created <= current_date
+            ORDER BY 1
+        """)
+        return [row[0] for row in cur.fetchall()]
+
+
+def last_updated(conn, start_date, end_date, families, search=None, one_per_cluster=False):
+    """Most recent created date within the filters."""
+    where, params = filter_clause(start_date, end_date, families, search, one_per_cluster)
+    with conn.cursor() as cur:
+        cur.execute(f"SELECT max(created) FROM {DASHBOARD_VIEW if search else DAILY_ROLLUP} WHERE {where}", params)
+        return cur.fetchone()[0]
+
+
+def kpi_summary(conn, start_date, end_date, families, search=None, one_per_cluster=False):
+    """Job counts and average annualized salary for the last two complete weeks and months.
+
+    Windows are anchored on the latest created date within the filters, as the
+    dashboard always has: weeks start on Monday, months on the 1st.
+    """
+    where, params = filter_clause(start_date, end_date, families, search, one_per_cluster)
+    if search:
+        filtered = f"""
+            SELECT created, 1 AS job_count, (annualized_salary IS NOT NULL)::int AS salary_count,
+                   annualized_salary AS salary_sum
+            FROM {DASHBOARD_VIEW}
+            WHERE {where}
+        """
+    else:
+        filtered = f"SELECT created, job_count, salary_count, salary_sum FROM {DAILY_ROLLUP} WHERE {where}"
+
+    # Counts and salary sums add up across listings and days alike, so one query serves both
+    windows = {
+        "latest_week": "created >= latest_week_start AND created < latest_week_start + interval '1 week'",
+        "previous_week": "created >= latest_week_start - interval '1 week' AND created < latest_week_start",
+        "latest_month": "created >= latest_month_start AND created < latest_month_start + interval '1 month'",
+        "previous_month": "created >= latest_month_start - interval '1 month' AND created < latest_month_start",
+    }
+    job_counts = [f"coalesce(sum(job_count) FILTER (WHERE {condition}), 0) AS {window}_job_count"
+                  for window, condition in windows.items()]
+    avg_salaries = [f"sum(salary_sum) FILTER (WHERE {condition}) / nullif(sum(salary_count) FILTER (WHERE {condition}), 0) "
+                    f"AS {window}_avg_salary" for window, condition in windows.items()]
+    query = f"""
+        WITH filtered AS ({filtered}),
+
+        -- computed once; inlined, a misestimated plan can re-aggregate it for every filtered row
+        anchors AS MATERIALIZED (
+            SELECT date_trunc('week', max(created)) - interval '1 week' AS latest_week_start,
+                   date_trunc('month', max(created)) - interval '1 month' AS latest_month_start
+            FROM filtered
+        )
+
+        SELECT {", ".join(job_counts + avg_salaries)}
+        FROM filtered
+        CROSS JOIN anchors
+    """
+    with conn.cursor() as cur:
+        cur.execute(query, params)
+        columns = [column.name for column in cur.description]
+        row = cur.fetchone()
+
+    # Averages over an empty window come back as NULL; the dashboard formats them as NaN
+    return {column: float("nan") if value is None else value for column, value in zip(columns, row)}
+
+
+def weekly_counts(conn, start_date, end_date, families, search=None, one_per_cluster=False):
+    """Job counts per week (labelled by the Monday that ends it, like pandas' W-MON) and family."""
+    where, params = filter_clause(start_date, end_date, families, search, one_per_cluster)
+    query = f"""
+        SELECT (date_trunc('week', created - interval '1 day') + interval '1 week')::date AS week_begin,
+               title_data_family,
+               {"count(*)" if search else "sum(job_count)"} AS job_count
+        FROM {DASHBOARD_VIEW if search else DAILY_ROLLUP}
+        WHERE {where}
+        GROUP BY 1, 2
+        ORDER BY 1, 2
+    """
+    return query_frame(conn, query, params)
+
+
+def skill_counts(conn, start_date, end_date, families, search=None, one_per_cluster=False):
+    """Listings mentioning each skill, counted from the stored skill bitmasks."""
+    where, params = filter_clause(start_date, end_date, families, search, one_per_cluster)
+    if search:
+        params["skill_count"] = len(SKILLS)
+        query = f"""
+            SELECT bit, count(*) AS count
+            FROM {DASHBOARD_VIEW}
+            CROSS JOIN generate_series(0, %(skill_count)s - 1) AS bit
+            WHERE {where}
+            AND skills_mask & (1 << bit) <> 0
+            GROUP BY bit
+        """
+    else:
+        query = f"SELECT bit, sum(listings) AS count FROM {SKILL_ROLLUP} WHERE {where} GROUP BY bit"
+    counts = query_frame(conn, query, params)
+    counts = dict(zip(counts["bit"], counts["count"]))
+    return pd.DataFrame({"Skill": SKILLS, "Count": [int(counts.get(bit, 0)) for bit in range(len(SKILLS))]})
+
+
+def histogram_quantile(buckets, q, low, high):
+    """Estimates quantile q from (bucket, count) pairs in ascending order as the centre of its bucket.
+
+    Advertised salaries are mostly round numbers, which sit on the bucket centres.
+    """
+    target = q * sum(count for _, count in buckets)
+    seen = 0
+    for bucket, count in buckets:
+        seen += count
+        if seen >= target:
+            # The true min and max are known exactly, and no quartile lies outside them
+            return float(min(max(bucket * SALARY_BUCKET_WIDTH, low), high))
+    return high
+
+
+def salary_distribution(conn, start_date, end_date, families, search=None, one_per_cluster=False):
+    """Five-number summary of annualized salary per family, enough to draw a box plot.
+
+    From the rollups the min and max are exact and the quartiles are estimated from the
+    $5,000 salary histogram, so they are within half a bucket of the exact value.
+    """
+    where, params = filter_clause(start_date, end_date, families, search, one_per_cluster)
+    if not search:
+        bounds = query_frame(conn, f"""
+            SELECT title_data_family, min(salary_min) AS min_salary, max(salary_max) AS max_salary
+            FROM {DAILY_ROLLUP}
+            WHERE {where}
+            AND salary_count > 0
+            GROUP BY title_data_family
+            ORDER BY title_data_family
+        """, params)
+        histogram = query_frame(conn, f"""
+            SELECT title_data_family, bucket, sum(listings) AS listings
+            FROM {SALARY_HISTOGRAM}
+            WHERE {where}
+            GROUP BY title_data_family, bucket
+            ORDER BY title_data_family, bucket
+        """, params)
+        buckets = {family: list(zip(group["bucket"], group["listings"]))
+                   for family, group in histogram.groupby("title_data_family")}
+        for column, q in (("q1_salary", 0.25), ("median_salary", 0.5), ("q3_salary", 0.75)):
+            bounds[column] = [histogram_quantile(buckets[row.title_data_family], q, row.min_salary, row.max_salary)
+                              for row in bounds.itertuples()]
+        return bounds[["title_data_family", "min_salary", "q1_salary", "median_salary", "q3_salary", "max_salary"]]
+
+    query = f"""
+        SELECT title_data_family,
+               min(annualized_salary) AS min_salary,
+               percentile_cont(0.25) WITHIN GROUP (ORDER BY annualized_salary) AS q1_salary,
+               percentile_cont(0.5) WITHIN GROUP (ORDER BY annualized_salary) AS median_salary,
+               percentile_cont(0.75) WITHIN GROUP (ORDER BY annualized_salary) AS q3_salary,
+               max(annualized_salary) AS max_salary
+        FROM {DASHBOARD_VIEW}
+        WHERE {where}
+        AND annualized_salary IS NOT NULL
+        GROUP BY title_data_family
+    """
+    return query_frame(conn, query, params)
+
+
+def sample_listings(conn, start_date, end_date, families, search=None, one_per_cluster=False, limit=50):
+    """The only row-level query: a small sample of listings for the table, newest first, or best matches first when searching.
+
+    Ties are broken by listing key, so reruns and the snapshot backend show the same rows.
+    """
+    where, params = filter_clause(start_date, end_date, families, search, one_per_cluster)
+    params["limit"] = limit
+    order_by = "created DESC, listing_key DESC"
+    if search:
+        order_by = f"ts_rank(search_vector, websearch_to_tsquery('english', %(search)s)) DESC, {order_by}"
+    query = f"""
+        SELECT title, company, created, location, url
+        FROM {DASHBOARD_VIEW}
+        WHERE {where}
+        ORDER BY {order_by}
+        LIMIT %(limit)s
+    """
+    return query_frame(conn, query, params)
@@ -0,0 +1,216 @@
+import os
+import threading
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+from skills import SKILLS, has_skill
+
+# Columnar copy of the dashboard view, published by the pipeline after each refresh.
+# Arrow IPC (uncompressed) so the dashboard can memory-map it instead of querying the database.
+SNAPSHOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "snapshots"))
+SNAPSHOT_PATH = os.path.join(SNAPSHOT_DIR, "adzuna_jobs_dashboard.arrow")
+
+FETCH_ROWS = 50000
+SLICE_CACHE_ENTRIES = 8
+
+# Recently filtered slices: (start, end, families, one_per_cluster) -> (frame, slice), oldest first
+_slices = {}
+_slices_lock = threading.Lock()
+
+# Low-cardinality text is dictionary-encoded; dates and salaries keep their types
+SNAPSHOT_SCHEMA = pa.schema([
+    ("title_data_family", pa.dictionary(pa.int32(), pa.string())),
+    ("title", pa.string()),
+    ("company", pa.dictionary(pa.int32(), pa.string())),
+    ("created", pa.date32()),
+    ("salary_min_new", pa.float64()),
+    ("salary_max_new", pa.float64()),
+    ("annualized_salary", pa.float64()),
+    ("location", pa.dictionary(pa.int32(), pa.string())),
+    ("url", pa.string()),
+    ("skills_mask", pa.int64()),
+    ("cluster_representative", pa.bool_()),
+])
+
+# Columns the dashboard reads; the rest of the snapshot is never touched
+DASHBOARD_COLUMNS = ["title_data_family", "title", "company", "created", "annualized_salary",
+                     "location", "url", "skills_mask", "cluster_representative"]
+
+
+def export_snapshot(conn, data_version, path=SNAPSHOT_PATH, include_description=False):
+    """Writes the dashboard view to an Arrow IPC file and returns the rows written.
+
+    Rows are streamed from a server-side cursor and the file is swapped in atomically,
+    so a dashboard reading the previous snapshot is never handed a partial file.
+    """
+    schema = SNAPSHOT_SCHEMA
+    if include_description:
+        schema = schema.append(pa.field("description", pa.string()))
+
+    chunks = {field.name: [] for field in schema}
+    with conn.cursor(name="dashboard_snapshot") as cur:
+        cur.itersize = FETCH_ROWS
+        # load_snapshot's stable sort on created keeps the listing key order within a day
+        cur.execute(f"SELECT {', '.join(schema.names)} FROM public.adzuna_jobs_streamlit_dashboard "
+                    f"ORDER BY created, listing_key")
+        while True:
+            rows = cur.fetchmany(FETCH_ROWS)
+            if not rows:
+                break
+            for i, field in enumerate(schema):
+                value_type = field.type.value_type if pa.types.is_dictionary(field.type) else field.type
+                chunks[field.name].append(pa.array([row[i] for row in rows], type=value_type))
+
+    # Dictionary-encode each column in one piece so the file carries a single dictionary per column
+    columns = []
+    for field in schema:
+        column = pa.chunked_array(chunks[field.name], type=field.type.value_type if pa.types.is_dictionary(field.type) else field.type)
+        column = column.combine_chunks()
+        if pa.types.is_dictionary(field.type):
+            column = pc.dictionary_encode(column).cast(field.type)
+        columns.append(column)
+
+    table = pa.Table.from_arrays(columns, schema=schema.with_metadata({"data_version": data_version}))
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with pa.OSFile(tmp_path, "wb") as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    os.replace(tmp_path, path)
+    return table.num_rows
+
+
+def snapshot_version(path=SNAPSHOT_PATH):
+    """Cheap version probe: the data version stored in the snapshot, plus its modification time."""
+    with pa.memory_map(path) as source:
+        metadata = pa.ipc.open_file(source).schema.metadata or {}
+    data_version = metadata.get(b"data_version", b"unversioned").decode()
+    return f"{data_version}@{os.path.getmtime(path)}"
+
+
+def load_snapshot(path=SNAPSHOT_PATH, columns=DASHBOARD_COLUMNS):
+    """Memory-maps the snapshot and returns the requested columns, sorted by created."""
+    with pa.memory_map(path) as source:
+        table = pa.ipc.open_file(source).read_all().select(columns)
+    frame = table.to_pandas()
+    frame["created"] = pd.to_datetime(frame["created"])
+    return frame.sort_values("created", kind="stable").reset_index(drop=True)
+
+
+# --------------------------
+# The dashboard_queries interface, answered from the snapshot frame instead of a connection
+# --------------------------
+
+def date_slice(created, start, end):
+    """The positions [lo, hi) of rows created from start up to but excluding end, by binary search.
+
+    created must be sorted, as load_snapshot leaves it.
+    """
+    values = created.to_numpy()
+    return (values.searchsorted(pd.Timestamp(start).to_datetime64(), side="left"),
+            values.searchsorted(pd.Timestamp(end).to_datetime64(), side="left"))
+
+
+def filter_frame(frame, start_date, end_date, families, search=None, one_per_cluster=False):
+    """Applies the dashboard's date range and job family filters, and with one_per_cluster
+    keeps only the earliest listing of each near-duplicate cluster. Rows stay sorted by created.
+
+    The date range is a binary-searched slice of the sorted frame, so only the rows in range
+    are masked by family. Each visual filters the same way, so the last SLICE_CACHE_ENTRIES
+    slices are kept for the frame they were cut from.
+    The snapshot has no full-text index, searches are answered by dashboard_queries.
+    """
+    if search:
+        raise ValueError("The dashboard snapshot cannot be searched, query the database instead")
+    end = min(pd.Timestamp(end_date), pd.Timestamp.today().normalize()) + pd.Timedelta(days=1)
+    key = (pd.Timestamp(start_date), end, tuple(families), one_per_cluster)
+    with _slices_lock:
+        cached = _slices.get(key)
+    if cached is not None and cached[0] is frame:
+        return cached[1]
+
+    lo, hi = date_slice(frame["created"], start_date, end)
+    df = frame.iloc[lo:hi]
+    mask = df["title_data_family"].isin(families)
+    if one_per_cluster:
+        mask &= df["cluster_representative"]
+    df = df[mask]
+
+    with _slices_lock:
+        _slices[key] = (frame, df)
+        while len(_slices) > SLICE_CACHE_ENTRIES:
+            _slices.pop(next(iter(_slices)))
+    return df
+
+
+def date_bounds(frame):
+    created = frame.loc[frame["created"] <= pd.Timestamp.today().normalize(), "created"]
+    if created.empty:
+        return None, None
+    return created.min().date(), created.max().date()
+
+
+def job_families(frame):
+    return sorted(frame["title_data_family"].dropna().unique().tolist())
+
+
+def last_updated(frame, start_date, end_date, families, search=None, one_per_cluster=False):
+    created = filter_frame(frame, start_date, end_date, families, search, one_per_cluster)["created"]
+    return None if created.empty else created.max()
+
+
+def kpi_summary(frame, start_date, end_date, families, search=None, one_per_cluster=False):
+    df = filter_frame(frame, start_date, end_date, families, search, one_per_cluster)
+    if df.empty:
+        return {"latest_week_job_count": 0, "previous_week_job_count": 0,
+                "latest_month_job_count": 0, "previous_month_job_count": 0,
+                "latest_week_avg_salary": float("nan"), "previous_week_avg_salary": float("nan"),
+                "latest_month_avg_salary": float("nan"), "previous_month_avg_salary": float("nan")}
+
+    latest_week_start = (df["created"].max().to_period("W").start_time) - pd.Timedelta(weeks=1)  # Last complete week's Monday
+    latest_month_start = (df["created"].max().to_period("M").start_time) - pd.DateOffset(months=1)  # Last complete month's start
+    windows = {
+        "latest_week": (latest_week_start, latest_week_start + pd.Timedelta(weeks=1)),
+        "previous_week": (latest_week_start - pd.Timedelta(weeks=1), latest_week_start),
+        "latest_month": (latest_month_start, latest_month_start + pd.DateOffset(months=1)),
+        "previous_month": (latest_month_start - pd.DateOffset(months=1), latest_month_start),
+    }
+
+    kpis = {}
+    for name, (start, end) in windows.items():
+        lo, hi = date_slice(df["created"], start, end)
+        window = df.iloc[lo:hi]
+        kpis[f"{name}_job_count"] = len(window)
+        kpis[f"{name}_avg_salary"] = window["annualized_salary"].mean()
+    return kpis
+
+
+def weekly_counts(frame, start_date, end_date, families, search=None, one_per_cluster=False):
+    df = filter_frame(frame, start_date, end_date, families, search, one_per_cluster)
+    df_weekly = df.groupby([pd.Grouper(key="created", freq="W-MON"), "title_data_family"], observed=True).size().reset_index(name="job_count")
+    df_weekly = df_weekly[df_weekly["job_count"] > 0]
+    return df_weekly.rename(columns={"created": "week_begin"})
+
+
+def skill_counts(frame, start_date, end_date, families, search=None, one_per_cluster=False):
+    masks = filter_frame(frame, start_date, end_date, families, search, one_per_cluster)["skills_mask"]
+    return pd.DataFrame({"Skill": SKILLS, "Count": [int(has_skill(masks, skill).sum()) for skill in SKILLS]})
+
+
+def salary_distribution(frame, start_date, end_date, families, search=None, one_per_cluster=False):
+    df = filter_frame(frame, start_date, end_date, families, search, one_per_cluster).dropna(subset=["annualized_salary", "title_data_family"])
+    salaries = df.groupby("title_data_family", observed=True)["annualized_salary"]
+    return pd.DataFrame({
+        "min_salary": salaries.min(),
+        "q1_salary": salaries.quantile(0.25),
+        "median_salary": salaries.median(),
+        "q3_salary": salaries.quantile(0.75),
+        "max_salary": salaries.max(),
+    }).reset_index()
+
+
+def sample_listings(frame, start_date, end_date, families, search=None, one_per_cluster=False, limit=50):
+    df = filter_frame(frame, start_date, end_date, families, search, one_per_cluster)
+    # Newest first, ties by listing key descending, as the database backend orders them
+    return df[["title", "company", "created", "location", "url"]].iloc[::-1].head(limit).reset_index(drop=True)
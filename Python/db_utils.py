@@ -0,0 +1,165 @@
+import io
+import os
+import threading
+from contextlib import contextmanager
+import psycopg2
+from psycopg2.pool import ThreadedConnectionPool
+from dotenv import load_dotenv
+from skills import skill_masks
+from salary import normalise_salaries
+from listing_key import listing_keys
+from descriptions import DESCRIPTIONS_TABLE, description_hashes
+from search_catalogue import DEFAULT_COUNTRY
+
+RAW_TABLE = "adzuna_results_raw"
+
+# Column order of adzuna_results_raw, shared by the CSV files and the COPY statements
+RAW_COLUMNS = [
+    "Title", "Company", "Location", "Category", "Contract Type", "Contract Time",
+    "Salary Min", "Salary Max", "Created", "Redirect URL", "timestamp",
+    "Skills Mask", "Pay Period", "Annualized Salary AUD", "Listing Key", "Description Hash", "Country"
+]
+# The staging table also carries the description text, which goes to adzuna_descriptions
+STAGE_COLUMNS = RAW_COLUMNS + ["Description"]
+# "Listing Key" hashes Title, Company and Created, see listing_key.py
+RAW_KEY_COLUMNS = ["Listing Key", "timestamp"]
+
+
+def connection_settings():
+    """Returns the psycopg2 connection keywords built from the DB_ settings in .env."""
+    load_dotenv()  # Load environment variables from .env
+
+    return {
+        'host': os.getenv('DB_HOST'),
+        'port': os.getenv('DB_PORT'),
+        'dbname': os.getenv('DB_NAME'),
+        'user': os.getenv('DB_USER'),
+        'password': os.getenv('DB_PASSWORD')
+    }
+
+
+def get_connection():
+    """Opens a psycopg2 connection using the DB_ settings from .env."""
+    return psycopg2.connect(**connection_settings())
+
+
+class BlockingConnectionPool(ThreadedConnectionPool):
+    """A ThreadedConnectionPool whose getconn waits for a free connection instead of raising PoolError."""
+
+    def __init__(self, minconn, maxconn, *args, **kwargs):
+        self._slots = threading.BoundedSemaphore(maxconn)
+        super().__init__(minconn, maxconn, *args, **kwargs)
+
+    def getconn(self, key=None):
+        self._slots.acquire()
+        try:
+            return super().getconn(key)
+        except Exception:
+            self._slots.release()
+            raise
+
+    def putconn(self, conn=None, key=None, close=False):
+        super().putconn(conn, key, close)
+        self._slots.release()
+
+
+def create_connection_pool(max_connections=4):
+    """Creates a thread-safe pool of connections shared by the stages of one process.
+
+    Borrowing a connection while all max_connections are out waits for one to be returned.
+    """
+    return BlockingConnectionPool(1, max_connections, **connection_settings())
+
+
+@contextmanager
+def pooled_connection(pool, autocommit=False):
+    """Borrows a connection from the pool for the duration of a with block."""
+    conn = pool.getconn()
+    try:
+        conn.autocommit = autocommit
+        yield conn
+    finally:
+        if not autocommit:
+            conn.rollback()
+        conn.autocommit = False
+        pool.putconn(conn)
+
+
+def quote_columns(columns):
+    """Double-quotes column names so the spaced raw column names survive in SQL."""
+    return ", ".join(f'"{column}"' for column in columns)
+
+
+def clean_raw_frame(df):
+    """Applies the raw table's rules: one row per key and no listing without a company."""
+    df = df.drop_duplicates(subset=RAW_KEY_COLUMNS)
+    df = df[df["Company"].notna() & (df["Company"] != "")]
+    return df
+
+
+def prepare_raw_frame(df):
+    """Cleans a page or CSV chunk and derives the columns computed once per listing at ingest."""
+    if "Listing Key" not in df.columns:
+        # CSVs written before the key was added at fetch time
+        df = df.assign(**{"Listing Key": listing_keys(df)})
+    df = clean_raw_frame(df).copy()
+    if "Skills Mask" not in df.columns:
+        df["Skills Mask"] = skill_masks(df["Description"])
+    if "Country" not in df.columns:
+        # CSVs written before the search catalogue added countries
+        df["Country"] = DEFAULT_COUNTRY
+    df["Description Hash"] = description_hashes(df["Description"])
+    return normalise_salaries(df)
+
+
+def create_raw_stage(cur):
+    """Creates (or empties) the session-local staging table: adzuna_results_raw plus the description text."""
+    cur.execute(f"""
+        CREATE TEMP TABLE IF NOT EXISTS adzuna_results_stage (
+            LIKE {RAW_TABLE} INCLUDING DEFAULTS,
+            "Description" TEXT
+        )
+    """)
+    cur.execute("TRUNCATE adzuna_results_stage")
+
+
+def copy_frame_to_stage(cur, df):
+    """Streams a DataFrame into the staging table through an in-memory COPY buffer."""
+    buffer = io.StringIO()
+    df[STAGE_COLUMNS].to_csv(buffer, index=False, header=False)
+    buffer.seek(0)
+    cur.copy_expert(f"COPY adzuna_results_stage ({quote_columns(STAGE_COLUMNS)}) FROM STDIN WITH (FORMAT csv)", buffer)
+
+
+def insert_stage_into_raw(cur):
+    """Moves the staged rows into adzuna_results_raw in one statement and returns the rows inserted.
+
+    Listings already in raw, or repeated within the stage, are skipped rather than
+    aborting the whole batch. Descriptions are added to adzuna_descriptions first,
+    only those not stored already.
+    """
+    cur.execute(f"""
+        INSERT INTO {DESCRIPTIONS_TABLE} (description_hash, description)
+        SELECT DISTINCT ON ("Description Hash") "Description Hash", "Description"
+        FROM adzuna_results_stage
+        WHERE "Description Hash" IS NOT NULL
+        ON CONFLICT DO NOTHING
+    """)
+    columns = quote_columns(RAW_COLUMNS)
+    cur.execute(f"""
+        INSERT INTO {RAW_TABLE} ({columns})
+        SELECT {columns} FROM adzuna_results_stage
+        ON CONFLICT DO NOTHING
+    """)
+    return cur.rowcount
+
+
+def copy_frame_to_raw(conn, df):
+    """Streams a DataFrame into adzuna_results_raw with COPY and returns the rows inserted.
+
+    The caller owns the transaction.
+    """
+    with conn.cursor() as cur:
+        create_raw_stage(cur)
+        copy_frame_to_stage(cur, df)
+        return insert_stage_into_raw(cur)
@@ -0,0 +1,18 @@
+import hashlib
+import uuid
+
+# Each distinct description is stored once in adzuna_descriptions, keyed by its md5.
+# The same ad text returned under several search terms or on later fetches adds no rows.
+DESCRIPTIONS_TABLE = "adzuna_descriptions"
+
+
+def description_hash(description):
+    """md5 of a description as a uuid string, equal to md5(description)::uuid in SQL."""
+    if not isinstance(description, str) or description == "":
+        return None
+    return str(uuid.UUID(hashlib.md5(description.encode("utf-8")).hexdigest()))
+
+
+def description_hashes(descriptions):
+    """Vectorised description_hash over a Series of descriptions."""
+    return descriptions.map(description_hash)
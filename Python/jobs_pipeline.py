@@ -1,52 +1,319 @@
-import subprocess
+import argparse
 import os
-from dotenv import load_dotenv
+import re
+import sys
+import time
+import adzuna_api_call_v2
+import adzuna_2_rawdataingestion
+import adzuna_backfill
+import dashboard_snapshot
+import near_duplicates
+import search_catalogue
+from dashboard_queries import data_version
+from db_utils import create_connection_pool
+import pipeline_metrics as metrics
 
 # Move up one level from the "Python" folder to the actual project root
 BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
-PYTHON_DIR = os.path.join(BASE_DIR, "Python")  # Now correctly points to Python/
 SQL_DIR = os.path.join(BASE_DIR, "SQL")  # Now correctly points to SQL/
 
-def fetch_jobs():
-    """Runs the Adzuna API call script."""
-    script_path = os.path.join(PYTHON_DIR, "adzuna_api_call_v2.py")
-    print(f"Running API call: {script_path}")
-    subprocess.run(["python", script_path], check=True)
-
-def ingest_jobs():
-    """Runs the raw data ingestion script."""
-    script_path = os.path.join(PYTHON_DIR, "adzuna_2_rawdataingestion.py")
-    print(f"Running raw data ingestion: {script_path}")
-    subprocess.run(["python", script_path], check=True)
-
-def run_sql():
-    """Executes the SQL script to update the database."""
-    load_dotenv()  # Load environment variables from the .env file
-    
-    # Set PGPASSWORD for PostgreSQL authentication
-    env = os.environ.copy()
-    env["PGPASSWORD"] = os.getenv("DB_PASSWORD")
-
-    sql_path = os.path.join(SQL_DIR, "combine_raw_master.sql")
+
+def fetch_jobs(pool, args):
+    """Fetches the listings of the catalogue's due searches from the Adzuna API, or replays an archived fetch.
+    Returns the listings fetched.
+
+    With --backfill the stage runs (or resumes) a historical backfill instead.
+    """
+    conn = pool.getconn() if args.stream else None
+    try:
+        if args.replay:
+            return adzuna_api_call_v2.replay_archived_run(args.replay, stream_to_db=args.stream, conn=conn,
+                                                          as_new_batch=args.as_new_batch)
+        if args.backfill:
+            return adzuna_backfill.backfill_catalogue(stream_to_db=args.stream, conn=conn)
+        return adzuna_api_call_v2.fetch_catalogue(
+            incremental=not args.full, all_searches=args.all, stream_to_db=args.stream, conn=conn,
+            max_shard_pages=adzuna_api_call_v2.SHARD_MAX_PAGES if args.shard else None)
+    finally:
+        if conn is not None:
+            pool.putconn(conn)
+
+
+def ingest_jobs(pool, args):
+    """Loads the fetched CSVs into adzuna_results_raw. Returns the rows inserted."""
+    conn = pool.getconn()
+    try:
+        return adzuna_2_rawdataingestion.ingest_csv_files(max_workers=args.ingest_workers, conn=conn)
+    finally:
+        pool.putconn(conn)
+
+
+def cluster_jobs(pool, args):
+    """Assigns the descriptions of the unmerged raw rows to near-duplicate clusters. Returns the descriptions clustered."""
+    conn = pool.getconn()
+    try:
+        return near_duplicates.cluster_unmerged_descriptions(conn)
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        pool.putconn(conn)
+
+
+def classify_jobs(pool, args):
+    """Classifies the titles of the unmerged raw rows into the catalogue's job families. Returns the titles classified."""
+    conn = pool.getconn()
+    try:
+        return search_catalogue.classify_unmerged_titles(conn)
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        pool.putconn(conn)
+
+
+def split_sql_statements(sql):
+    """Splits a script into (label, statement) pairs on semicolons that end a line.
+
+    The label is the statement's number and first line of code, used to time each one.
+    Scripts split this way must not contain dollar-quoted bodies.
+    """
+    statements = []
+    for statement in re.split(r";[ \t]*$", sql, flags=re.MULTILINE):
+        code = [line.strip() for line in statement.splitlines() if line.strip() and not line.strip().startswith("--")]
+        if code:
+            statements.append((f"{len(statements) + 1:02d} {code[0][:60]}", statement))
+    return statements
+
+
+def run_sql_script(cur, filename, metric):
+    """Runs a script from the SQL folder one statement at a time on cur, timing each in metric.
+
+    Returns the first row of the last statement, which these scripts use to report their counts.
+    """
+    sql_path = os.path.join(SQL_DIR, filename)
     print(f"Running SQL script: {sql_path}")
+    with open(sql_path) as f:
+        sql = f.read()
+    for label, statement in split_sql_statements(sql):
+        with metrics.timer(metric, statement=label):
+            cur.execute(statement)
+    return cur.fetchone()
 
-    subprocess.run([
-        "psql",
-        "-d", os.getenv("DB_NAME"),  # Database name
-        "-U", os.getenv("DB_USER"),  # Username
-        "-h", os.getenv("DB_HOST"),  # Host
-        "-p", os.getenv("DB_PORT"),  # Port
-        "-f", sql_path  # Path to the SQL script
-    ], env=env, check=True)
 
-if __name__ == "__main__":
+def merge_jobs(pool, args):
+    """Runs combine_raw_master.sql in one transaction. Returns the listings inserted or updated."""
+    conn = pool.getconn()
+    try:
+        with conn.cursor() as cur:
+            # Statements run one at a time, in the same transaction, so each can be timed
+            inserted_rows, updated_rows = run_sql_script(cur, "combine_raw_master.sql", "merge_statement_seconds")
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        pool.putconn(conn)
+
+    print(f"Merged {inserted_rows} new and {updated_rows} updated listings into adzuna_jobs_master.")
+    return inserted_rows + updated_rows
+
+
+def refresh_dashboard(pool, args):
+    """Refreshes the dashboard's materialized view without blocking readers, then the daily rollups
+    for the days the merge touched. Returns the view's row count."""
+    conn = pool.getconn()
+    try:
+        with conn.cursor() as cur:
+            cur.execute("REFRESH MATERIALIZED VIEW CONCURRENTLY public.adzuna_jobs_streamlit_dashboard")
+            # A refresh leaves the view's statistics stale, and the dashboard queries are planned from them
+            cur.execute("ANALYZE public.adzuna_jobs_streamlit_dashboard")
+            # In the same transaction, so the rollups are published with the view they summarise
+            rollup_days = run_sql_script(cur, "refresh_rollups.sql", "rollup_statement_seconds")[0]
+            cur.execute("SELECT count(*) FROM public.adzuna_jobs_streamlit_dashboard")
+            row_count = cur.fetchone()[0]
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        pool.putconn(conn)
+
+    print(f"Refreshed adzuna_jobs_streamlit_dashboard ({row_count} rows) and the rollups of {rollup_days} days.")
+    return row_count
+
+
+def export_snapshot(pool, args):
+    """Publishes the refreshed dashboard data as a columnar snapshot file. Returns the rows written."""
+    conn = pool.getconn()
     try:
-        print("Running job pipeline...")
-        fetch_jobs()
-        ingest_jobs()
-        run_sql()
-        print("Pipeline completed successfully.")
-    except subprocess.CalledProcessError as e:
-        print(f"Pipeline failed with error: {e}")
-    except Exception as e:
-        print(f"Unexpected error: {e}")
+        row_count = dashboard_snapshot.export_snapshot(conn, data_version(conn),
+                                                       include_description=args.snapshot_descriptions)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        pool.putconn(conn)
+
+    print(f"Exported {row_count} rows to {dashboard_snapshot.SNAPSHOT_PATH}")
+    return row_count
+
+
+# Stages in dependency order; each takes the shared pool and the CLI args and returns a row count
+STAGES = [
+    ("fetch", fetch_jobs),
+    ("ingest", ingest_jobs),
+    ("cluster", cluster_jobs),
+    ("classify", classify_jobs),
+    ("merge", merge_jobs),
+    ("refresh_dashboard", refresh_dashboard),
+    ("export_snapshot", export_snapshot),
+]
+
+
+def start_run(log_conn, resume):
+    """Returns the run id to log under and the stages it has already completed.
+
+    --resume reuses the most recent run so its successful stages are skipped.
+    """
+    with log_conn.cursor() as cur:
+        if resume:
+            cur.execute("SELECT max(run_id) FROM pipeline_run_log")
+            run_id = cur.fetchone()[0]
+            if run_id is not None:
+                cur.execute("SELECT stage FROM pipeline_run_log WHERE run_id = %s AND status = 'success'", (run_id,))
+                return run_id, {row[0] for row in cur.fetchall()}
+            print("No previous run to resume, starting a new run.")
+
+        cur.execute("SELECT nextval('pipeline_run_id_seq')")
+        return cur.fetchone()[0], set()
+
+
+def log_stage(log_conn, run_id, stage, status, duration_seconds=None, row_count=None, error=None):
+    """Upserts the stage's row in pipeline_run_log and commits it straight away."""
+    with log_conn.cursor() as cur:
+        cur.execute("""
+            INSERT INTO pipeline_run_log (run_id, stage, status, started_at, duration_seconds, row_count, error)
+            VALUES (%(run_id)s, %(stage)s, %(status)s, now(), %(duration)s, %(row_count)s, %(error)s)
+            ON CONFLICT (run_id, stage) DO UPDATE
+            SET status = EXCLUDED.status,
+                started_at = CASE WHEN EXCLUDED.status = 'running' THEN EXCLUDED.started_at
+                                  ELSE pipeline_run_log.started_at END,
+                finished_at = CASE WHEN EXCLUDED.status = 'running' THEN NULL ELSE now() END,
+                duration_seconds = EXCLUDED.duration_seconds,
+                row_count = EXCLUDED.row_count,
+                error = EXCLUDED.error
+        """, {"run_id": run_id, "stage": stage, "status": status, "duration": duration_seconds,
+              "row_count": row_count, "error": error})
+    log_conn.commit()
+
+
+def run_stage(func, pool, args, run_id, stage):
+    """Calls one stage, under cProfile when --profile is given, and records its wall time and rows."""
+    start = time.perf_counter()
+    try:
+        if args.profile:
+            with metrics.profile(os.path.join(metrics.METRICS_DIR, f"profile_run{run_id}_{stage}.prof")):
+                row_count = func(pool, args)
+        else:
+            row_count = func(pool, args)
+    finally:
+        metrics.set_gauge("pipeline_stage_seconds", time.perf_counter() - start, stage=stage)
+    metrics.set_gauge("pipeline_stage_rows", row_count, stage=stage)
+    return row_count
+
+
+def write_run_metrics(run_id, status, timings):
+    """Writes the Prometheus textfile and the JSON summary of the run to the metrics folder."""
+    stages = [{"stage": stage, "seconds": round(duration, 3), "rows": row_count,
+               "rows_per_second": round(row_count / duration, 1) if duration > 0 else None}
+              for stage, duration, row_count in timings]
+    metrics.write_textfile()
+    metrics.write_summary(os.path.join(metrics.METRICS_DIR, f"run_{run_id}.json"),
+                          run_id=run_id, status=status, stages=stages)
+    print(f"Metrics written to {metrics.METRICS_DIR}")
+
+
+def run_pipeline(args):
+    """Runs the stages in order in this process, logging each one. Returns True on success."""
+    # One connection for the run log plus up to two in use by a stage at a time
+    pool = create_connection_pool(max_connections=3)
+    log_conn = pool.getconn()
+    timings = []
+    run_id = None
+    status = "failed"
+    metrics.reset()
+
+    try:
+        run_id, completed = start_run(log_conn, args.resume)
+        print(f"Running job pipeline (run {run_id})...")
+
+        for stage, func in STAGES:
+            if args.only and stage != args.only:
+                continue
+            if stage in completed:
+                print(f"Skipping {stage}: already completed in run {run_id}.")
+                continue
+
+            print(f"Starting stage: {stage}")
+            log_stage(log_conn, run_id, stage, "running")
+            start = time.perf_counter()
+            try:
+                row_count = run_stage(func, pool, args, run_id, stage)
+            except Exception as e:
+                duration = time.perf_counter() - start
+                log_stage(log_conn, run_id, stage, "failed", duration, error=str(e))
+                print(f"Pipeline failed at stage '{stage}' after {duration:.1f}s with error: {e}")
+                print(f"Fix the problem and rerun with --resume to continue from '{stage}'.")
+                return False
+
+            duration = time.perf_counter() - start
+            log_stage(log_conn, run_id, stage, "success", duration, row_count)
+            timings.append((stage, duration, row_count))
+            print(f"Finished stage: {stage} in {duration:.1f}s ({row_count} rows)")
+        status = "success"
+    finally:
+        pool.putconn(log_conn)
+        pool.closeall()
+        if run_id is not None:
+            write_run_metrics(run_id, status, timings)
+
+    for stage, duration, row_count in timings:
+        print(f"  {stage:<18}{duration:>10.1f}s{row_count:>10} rows")
+    print("Pipeline completed successfully.")
+    return True
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fetch, ingest and merge Adzuna job listings.")
+    parser.add_argument("--resume", action="store_true",
+                        help="continue the most recent run, skipping the stages it completed")
+    parser.add_argument("--only", choices=[stage for stage, _ in STAGES],
+                        help="run a single stage, eg retry a failed merge without refetching")
+    parser.add_argument("--stream", action="store_true",
+                        help="COPY fetched pages straight into adzuna_results_raw")
+    parser.add_argument("--full", action="store_true",
+                        help="ignore the fetch high-water marks and page through every result, "
+                             "without the catalogue's calls_per_run limit")
+    parser.add_argument("--all", action="store_true",
+                        help="fetch every search in the catalogue, not only those due a refresh")
+    parser.add_argument("--shard", action="store_true",
+                        help="split deep searches into state and salary band shards fetched in parallel")
+    parser.add_argument("--ingest-workers", type=int, default=1,
+                        help="load CSVs in this many worker processes instead of in-process")
+    parser.add_argument("--snapshot-descriptions", action="store_true",
+                        help="include job descriptions in the dashboard snapshot")
+    parser.add_argument("--profile", action="store_true",
+                        help="run each stage under cProfile and save the stats to the metrics folder")
+    parser.add_argument("--replay", metavar="RUN_ID",
+                        help="rebuild the fetch from the archived responses of RUN_ID (or latest) instead of calling the API")
+    parser.add_argument("--as-new-batch", action="store_true",
+                        help="with --replay, stamp the replayed listings with the replay time so the merge applies them again")
+    parser.add_argument("--backfill", action="store_true",
+                        help=f"fetch the last {adzuna_backfill.BACKFILL_MAX_DAYS_OLD} days in resumable units, "
+                             f"continuing an unfinished backfill")
+    args = parser.parse_args()
+
+    if not run_pipeline(args):
+        sys.exit(1)
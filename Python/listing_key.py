@@ -0,0 +1,25 @@
+import hashlib
+import pandas as pd
+
+# Fields are joined with the ASCII unit separator so ("ab", "c") and ("a", "bc") hash differently
+KEY_SEPARATOR = "\x1f"
+CREATED_FORMAT = "%Y-%m-%dT%H:%M:%SZ"
+
+
+def listing_key(title, company, created):
+    """64-bit key of one listing: the first 8 bytes of the md5 of its identity, as a signed BIGINT.
+
+    created must already be formatted as UTC CREATED_FORMAT. SQL/adzuna_listing_key_ddl.sql
+    computes the same value in the database.
+    """
+    identity = KEY_SEPARATOR.join((title, company, created)).encode("utf-8")
+    return int.from_bytes(hashlib.md5(identity).digest()[:8], "big", signed=True)
+
+
+def listing_keys(df):
+    """Vectorised listing_key over a raw frame's Title, Company and Created columns."""
+    created = pd.to_datetime(df["Created"], utc=True, errors="coerce").dt.strftime(CREATED_FORMAT).fillna("")
+    titles = df["Title"].fillna("").astype(str)
+    companies = df["Company"].fillna("").astype(str)
+    return pd.Series([listing_key(title, company, created_at) for title, company, created_at in zip(titles, companies, created)],
+                     index=df.index, dtype="int64")
@@ -0,0 +1,187 @@
+import hashlib
+import re
+import uuid
+import zlib
+import numpy as np
+from psycopg2.extras import execute_values
+
+# Near-identical ads (the same role reposted with a tweaked title or date, or one ad under
+# several search terms) share a cluster_id. Each description gets a MinHash signature over
+# its word shingles, and the buckets of the signature's bands, kept in adzuna_lsh_buckets,
+# find the stored descriptions likely to be similar, so a new description is compared
+# with a handful of candidates instead of every description seen before.
+CLUSTERS_TABLE = "adzuna_description_clusters"
+BUCKETS_TABLE = "adzuna_lsh_buckets"
+
+NUM_PERM = 128
+# 16 bands of 8 rows: a pair shares a bucket with probability 1 - (1 - s^8)^16 at Jaccard similarity s,
+# about 95% at the 0.8 threshold, 60% at 0.7 and 6% at 0.5
+BANDS = 16
+ROWS = NUM_PERM // BANDS
+SHINGLE_WORDS = 3
+# Estimated Jaccard similarity a candidate needs to join a cluster
+SIMILARITY_THRESHOLD = 0.8
+
+BACKFILL_BATCH_ROWS = 5000
+
+# Multiply-shift hash functions, fixed by the seed: stored signatures depend on them
+_rng = np.random.default_rng(20240301)
+_MULTIPLIERS = _rng.integers(1, 2 ** 63, NUM_PERM, dtype=np.uint64) | np.uint64(1)
+_INCREMENTS = _rng.integers(0, 2 ** 63, NUM_PERM, dtype=np.uint64)
+
+
+def shingles(description):
+    """The distinct runs of SHINGLE_WORDS words in a description, case and punctuation ignored."""
+    words = re.findall(r"\w+", description.lower())
+    if len(words) <= SHINGLE_WORDS:
+        return {" ".join(words)}
+    return {" ".join(words[i:i + SHINGLE_WORDS]) for i in range(len(words) - SHINGLE_WORDS + 1)}
+
+
+def minhash(description):
+    """MinHash signature of a description: the minimum of each of NUM_PERM hash functions over its shingles."""
+    hashes = np.fromiter((zlib.crc32(shingle.encode("utf-8")) for shingle in shingles(description)), dtype=np.uint64)
+    # uint64 arithmetic wraps, which is what multiply-shift hashing relies on
+    hashed = (np.outer(_MULTIPLIERS, hashes) + _INCREMENTS[:, None]) >> np.uint64(32)
+    return hashed.min(axis=1).astype(np.uint32)
+
+
+def band_buckets(signature):
+    """The LSH bucket of each band of a signature, as signed 64-bit keys."""
+    return [int.from_bytes(hashlib.md5(signature[band * ROWS:(band + 1) * ROWS].tobytes()).digest()[:8],
+                           "big", signed=True) for band in range(BANDS)]
+
+
+def new_cluster_id(description_hash):
+    """The id of a cluster founded by a description: the first 64 bits of its hash."""
+    return int.from_bytes(uuid.UUID(description_hash).bytes[:8], "big", signed=True)
+
+
+def cluster_descriptions(cur, descriptions):
+    """Assigns each (description_hash, description) a cluster and adds it to the LSH index.
+
+    A description joins the cluster of its most similar candidate at or above
+    SIMILARITY_THRESHOLD, or founds a new one. Returns the number of new clusters.
+    """
+    if not descriptions:
+        return 0
+    signatures = [minhash(description) for _, description in descriptions]
+    buckets = [band_buckets(signature) for signature in signatures]
+
+    # Every stored description sharing a bucket with the batch, in one indexed lookup
+    keys = sorted({(band, bucket) for description_buckets in buckets for band, bucket in enumerate(description_buckets)})
+    cur.execute(f"""
+        SELECT b.band, b.bucket, c.description_hash, c.cluster_id, c.signature
+        FROM unnest(%s::smallint[], %s::bigint[]) AS q (band, bucket)
+        JOIN {BUCKETS_TABLE} b
+        ON b.band = q.band AND b.bucket = q.bucket
+        JOIN {CLUSTERS_TABLE} c
+        ON c.description_hash = b.description_hash
+    """, ([band for band, _ in keys], [bucket for _, bucket in keys]))
+    index = {}
+    for band, bucket, description_hash, cluster_id, signature in cur.fetchall():
+        index.setdefault((band, bucket), []).append(
+            (str(description_hash), cluster_id, np.frombuffer(bytes(signature), dtype=np.uint32)))
+
+    cluster_rows, bucket_rows = [], []
+    new_clusters = 0
+    for (description_hash, _), signature, description_buckets in zip(descriptions, signatures, buckets):
+        best_cluster, best_similarity = None, SIMILARITY_THRESHOLD
+        compared = set()
+        for key in enumerate(description_buckets):
+            for candidate_hash, cluster_id, candidate in index.get(key, []):
+                if candidate_hash in compared:
+                    continue
+                compared.add(candidate_hash)
+                similarity = np.count_nonzero(signature == candidate) / NUM_PERM
+                if similarity >= best_similarity:
+                    best_cluster, best_similarity = cluster_id, similarity
+        if best_cluster is None:
+            best_cluster = new_cluster_id(description_hash)
+            new_clusters += 1
+
+        # Later descriptions in the same batch can match this one
+        for key in enumerate(description_buckets):
+            index.setdefault(key, []).append((description_hash, best_cluster, signature))
+            bucket_rows.append((key[0], key[1], description_hash))
+        cluster_rows.append((description_hash, best_cluster, signature.tobytes()))
+
+    execute_values(cur, f"""
+        INSERT INTO {CLUSTERS_TABLE} (description_hash, cluster_id, signature) VALUES %s
+        ON CONFLICT DO NOTHING
+    """, cluster_rows)
+    execute_values(cur, f"""
+        INSERT INTO {BUCKETS_TABLE} (band, bucket, description_hash) VALUES %s
+        ON CONFLICT DO NOTHING
+    """, bucket_rows, page_size=1000)
+    return new_clusters
+
+
+def cluster_unmerged_descriptions(conn):
+    """Clusters the descriptions of raw rows not merged yet that have no cluster. Returns the descriptions clustered.
+
+    The merge copies each listing's cluster_id into adzuna_jobs_master from adzuna_description_clusters.
+    """
+    with conn.cursor() as cur:
+        cur.execute(f"""
+            SELECT d.description_hash::text, d.description
+            FROM public.adzuna_descriptions d
+            WHERE d.description_hash IN (
+                SELECT "Description Hash"
+                FROM public.adzuna_results_raw
+                WHERE NOT "Merged"
+            )
+            AND NOT EXISTS (SELECT 1 FROM {CLUSTERS_TABLE} c WHERE c.description_hash = d.description_hash)
+            ORDER BY d.description_hash
+        """)
+        descriptions = cur.fetchall()
+        new_clusters = cluster_descriptions(cur, descriptions)
+    conn.commit()
+    print(f"Clustered {len(descriptions)} new descriptions, {len(descriptions) - new_clusters} of them near-duplicates.")
+    return len(descriptions)
+
+
+def backfill_clusters(conn):
+    """Clusters every stored description that has no cluster, then sets adzuna_jobs_master.cluster_id.
+
+    Run once after migrate_08_near_duplicates.sql, then run SQL/rebuild_dashboard.sql.
+    """
+    clustered = 0
+    while True:
+        with conn.cursor() as cur:
+            cur.execute(f"""
+                SELECT d.description_hash::text, d.description
+                FROM public.adzuna_descriptions d
+                WHERE NOT EXISTS (SELECT 1 FROM {CLUSTERS_TABLE} c WHERE c.description_hash = d.description_hash)
+                ORDER BY d.description_hash
+                LIMIT %s
+            """, (BACKFILL_BATCH_ROWS,))
+            descriptions = cur.fetchall()
+            if not descriptions:
+                break
+            cluster_descriptions(cur, descriptions)
+        conn.commit()
+        clustered += len(descriptions)
+        print(f"Clustered {clustered} descriptions...")
+
+    with conn.cursor() as cur:
+        cur.execute(f"""
+            UPDATE public.adzuna_jobs_master m
+            SET cluster_id = c.cluster_id
+            FROM {CLUSTERS_TABLE} c
+            WHERE c.description_hash = m.description_hash
+            AND m.cluster_id IS NULL
+        """)
+        print(f"Set cluster_id for {cur.rowcount} listings.")
+    conn.commit()
+    return clustered
+
+
+if __name__ == "__main__":
+    from db_utils import get_connection
+
+    conn = get_connection()
+    try:
+        backfill_clusters(conn)
+    finally:
+        conn.close()
@@ -0,0 +1,178 @@
+import bisect
+import cProfile
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# Counters and histograms collected by the pipeline stages in this process, written at the
+# end of a run as a Prometheus textfile (for node_exporter's textfile collector) and a JSON summary
+METRICS_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "metrics"))
+TEXTFILE_PATH = os.path.join(METRICS_DIR, "adzuna_pipeline.prom")
+
+# Upper bounds in seconds, wide enough for a fast API page and a slow merge statement
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+HELP = {
+    "adzuna_http_request_seconds": "Latency of Adzuna API requests by response status",
+    "adzuna_http_retries_total": "Adzuna API requests retried, by the status or error that caused it",
+    "adzuna_pages_fetched_total": "Result pages fetched per search term",
+    "adzuna_rows_fetched_total": "Listings fetched per search term",
+    "adzuna_duplicate_rows_total": "Listings dropped per search term because another page or shard returned them",
+    "adzuna_shard_splits_total": "Searches split into shards per search term",
+    "adzuna_shard_fallbacks_total": "Splits abandoned per search term because the shards did not cover the search",
+    "ingest_file_seconds": "Time to load one CSV into adzuna_results_raw",
+    "ingest_files_total": "CSV files loaded into adzuna_results_raw",
+    "ingest_bytes_total": "CSV bytes loaded into adzuna_results_raw",
+    "ingest_rows_total": "CSV rows read and rows inserted into adzuna_results_raw",
+    "merge_statement_seconds": "Time of each statement in combine_raw_master.sql",
+    "rollup_statement_seconds": "Time of each statement in refresh_rollups.sql",
+    "pipeline_stage_seconds": "Wall time of each pipeline stage in the last run",
+    "pipeline_stage_rows": "Rows reported by each pipeline stage in the last run",
+}
+
+_lock = threading.Lock()
+_counters = {}
+_gauges = {}
+_histograms = {}
+
+
+def _key(name, labels):
+    return name, tuple(sorted((label, str(value)) for label, value in labels.items()))
+
+
+def inc(name, value=1, **labels):
+    """Adds value to a counter."""
+    with _lock:
+        key = _key(name, labels)
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def set_gauge(name, value, **labels):
+    """Sets a gauge to value."""
+    with _lock:
+        _gauges[_key(name, labels)] = value
+
+
+def observe(name, value, buckets=DEFAULT_BUCKETS, **labels):
+    """Records one observation, eg a duration in seconds, in a histogram."""
+    with _lock:
+        key = _key(name, labels)
+        histogram = _histograms.setdefault(key, {"buckets": buckets, "counts": [0] * len(buckets), "sum": 0.0, "count": 0})
+        index = bisect.bisect_left(histogram["buckets"], value)
+        if index < len(histogram["buckets"]):
+            histogram["counts"][index] += 1
+        histogram["sum"] += value
+        histogram["count"] += 1
+
+
+@contextmanager
+def timer(name, **labels):
+    """Observes the wall time of a with block in a histogram, even when it raises."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - start, **labels)
+
+
+@contextmanager
+def profile(path):
+    """Runs a with block under cProfile and dumps the stats to path (open with pstats or snakeviz)."""
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        profiler.dump_stats(path)
+
+
+def reset():
+    """Clears every metric, eg between runs in one process."""
+    with _lock:
+        _counters.clear()
+        _gauges.clear()
+        _histograms.clear()
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels, **extra):
+    labels = list(labels) + list(extra.items())
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels) + "}"
+
+
+def _format_value(value):
+    return "+Inf" if value == float("inf") else repr(float(value))
+
+
+def render_textfile():
+    """The collected metrics in the Prometheus text exposition format."""
+    lines = []
+    with _lock:
+        families = {}
+        for kind, metrics in (("counter", _counters), ("gauge", _gauges), ("histogram", _histograms)):
+            for (name, labels), value in metrics.items():
+                families.setdefault((name, kind), []).append((labels, value))
+
+        for (name, kind), series in sorted(families.items()):
+            if name in HELP:
+                lines.append(f"# HELP {name} {HELP[name]}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in sorted(series):
+                if kind != "histogram":
+                    lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+                    continue
+                cumulative = 0
+                for bound, count in zip(value["buckets"], value["counts"]):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{_format_labels(labels, le=_format_value(bound))} {cumulative}")
+                lines.append(f"{name}_bucket{_format_labels(labels, le='+Inf')} {value['count']}")
+                lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(value['sum'])}")
+                lines.append(f"{name}_count{_format_labels(labels)} {value['count']}")
+    return "\n".join(lines) + "\n"
+
+
+def summary():
+    """The collected metrics as plain dicts: counters and gauges by name, histograms with count, sum and mean."""
+    def labelled(labels):
+        return ",".join(f"{name}={value}" for name, value in labels) or "total"
+
+    result = {"counters": {}, "gauges": {}, "histograms": {}}
+    with _lock:
+        for (name, labels), value in _counters.items():
+            result["counters"].setdefault(name, {})[labelled(labels)] = value
+        for (name, labels), value in _gauges.items():
+            result["gauges"].setdefault(name, {})[labelled(labels)] = value
+        for (name, labels), value in _histograms.items():
+            result["histograms"].setdefault(name, {})[labelled(labels)] = {
+                "count": value["count"],
+                "sum_seconds": round(value["sum"], 6),
+                "mean_seconds": round(value["sum"] / value["count"], 6) if value["count"] else None,
+            }
+    return result
+
+
+def _write_atomically(path, text):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+
+def write_textfile(path=TEXTFILE_PATH):
+    """Writes the Prometheus textfile, swapped in atomically so a scrape never sees half a file."""
+    _write_atomically(path, render_textfile())
+
+
+def write_summary(path, **extra):
+    """Writes the JSON run summary: the extra fields (eg run id and stage timings) plus every metric."""
+    _write_atomically(path, json.dumps({**extra, **summary()}, indent=2, default=str))
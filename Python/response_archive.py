@@ -0,0 +1,92 @@
+import gzip
+import json
+import os
+import threading
+from datetime import datetime
+
+try:
+    import zstandard
+except ImportError:  # gzip members work the same way, just larger and slower
+    zstandard = None
+
+# Every API page is kept as fetched, so a change to the field mapping can be replayed from disk
+# instead of refetching. One file per run holds one compressed frame per page (a JSON line),
+# and a sidecar index records where each term/page frame starts so it can be read on its own.
+ARCHIVE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "responses"))
+ZSTD_LEVEL = 3
+
+
+def _codec():
+    return ("zst", zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress) if zstandard else ("gz", gzip.compress)
+
+
+def _decompress(path, blob):
+    if path.endswith(".zst"):
+        if zstandard is None:
+            raise RuntimeError(f"{path} is zstd compressed: pip install zstandard to read it")
+        return zstandard.ZstdDecompressor().decompress(blob)
+    return gzip.decompress(blob)
+
+
+class ResponseArchive:
+    """Appends the pages of one fetch run to responses/run_<id>.jsonl.<zst|gz> with an index."""
+
+    def __init__(self, archive_dir=ARCHIVE_DIR, run_id=None):
+        os.makedirs(archive_dir, exist_ok=True)
+        self.run_id = run_id or datetime.now().strftime("%Y%m%d_%H%M%S")
+        extension, self.compress = _codec()
+        self.path = os.path.join(archive_dir, f"run_{self.run_id}.jsonl.{extension}")
+        self.index_path = os.path.join(archive_dir, f"run_{self.run_id}.index.jsonl")
+        self.lock = threading.Lock()
+        self.pages = 0
+
+    def write_page(self, term, page, data, timestamp, shard=None, country="au"):
+        """Stores one page response with the batch timestamp its listings were given.
+
+        shard labels the slice of the term's search the page belongs to, when it was sharded.
+        """
+        record = {"term": term, "shard": shard or term, "country": country, "page": page,
+                  "timestamp": timestamp.isoformat(), "response": data}
+        frame = self.compress(json.dumps(record).encode("utf-8") + b"\n")
+        with self.lock:
+            with open(self.path, "ab") as f:
+                offset = f.tell()
+                f.write(frame)
+            with open(self.index_path, "a") as f:
+                f.write(json.dumps({"term": term, "shard": shard or term, "page": page, "offset": offset, "length": len(frame),
+                                    "listings": len(data.get("results", []))}) + "\n")
+            self.pages += 1
+
+
+def list_runs(archive_dir=ARCHIVE_DIR):
+    """Archived run ids, oldest first."""
+    if not os.path.isdir(archive_dir):
+        return []
+    return sorted(filename[len("run_"):-len(".index.jsonl")] for filename in os.listdir(archive_dir)
+                  if filename.startswith("run_") and filename.endswith(".index.jsonl"))
+
+
+def read_index(run_id, archive_dir=ARCHIVE_DIR):
+    """The index entries of a run, in the order the pages were written."""
+    with open(os.path.join(archive_dir, f"run_{run_id}.index.jsonl")) as f:
+        return [json.loads(line) for line in f]
+
+
+def read_pages(run_id, archive_dir=ARCHIVE_DIR, terms=None):
+    """Yields the archived records of a run ({term, shard, country, page, timestamp, response}), optionally for some terms only.
+
+    Frames are read by offset from the index, so skipped terms are never decompressed.
+    """
+    data_path = next((os.path.join(archive_dir, f"run_{run_id}.jsonl.{extension}") for extension in ("zst", "gz")
+                      if os.path.exists(os.path.join(archive_dir, f"run_{run_id}.jsonl.{extension}"))), None)
+    if data_path is None:
+        raise FileNotFoundError(f"No archived responses for run {run_id} in {archive_dir}")
+
+    with open(data_path, "rb") as f:
+        for entry in read_index(run_id, archive_dir):
+            if terms and entry["term"] not in terms:
+                continue
+            f.seek(entry["offset"])
+            record = json.loads(_decompress(data_path, f.read(entry["length"])))
+            record["timestamp"] = datetime.fromisoformat(record["timestamp"])
+            yield record
@@ -0,0 +1,41 @@
+import numpy as np
+import pandas as pd
+
+# Pay periods detected from the size of the advertised minimum salary
+ANNUAL = "annual"
+THOUSANDS = "annual_thousands"  # eg 90 meaning $90k a year
+DAILY = "daily"
+
+# Working days a year used to annualise contract day rates
+WORKING_DAYS_PER_YEAR = 260
+
+
+def normalise_salaries(df):
+    """Adds typed salary columns to a raw frame, vectorised over the whole page or chunk.
+
+    "Salary Min"/"Salary Max" become numbers, "Pay Period" records how the salary was
+    quoted and "Annualized Salary AUD" is the midpoint converted to a yearly figure.
+    The rules match the ones the dashboard view used to apply on every query:
+    five or more digits is annual, 10-299 is thousands a year, and 301-9999 on a
+    contract is a day rate. Anything else is left without an annualized salary.
+    """
+    df = df.copy()
+    salary_min = pd.to_numeric(df["Salary Min"], errors="coerce")
+    salary_max = pd.to_numeric(df["Salary Max"], errors="coerce")
+    rounded_min = salary_min.round()
+    rounded_max = salary_max.round()
+    is_contract = df["Contract Type"].eq("contract")
+
+    conditions = [
+        rounded_min >= 10000,
+        (rounded_min >= 10) & (rounded_min < 300),
+        is_contract & (rounded_min > 300) & (rounded_min < 10000),
+    ]
+    multipliers = np.select(conditions, [1, 1000, WORKING_DAYS_PER_YEAR], default=np.nan)
+
+    df["Salary Min"] = salary_min
+    df["Salary Max"] = salary_max
+    df["Pay Period"] = pd.Series(np.select(conditions, [ANNUAL, THOUSANDS, DAILY], default=""),
+                                 index=df.index).replace("", None)
+    df["Annualized Salary AUD"] = (rounded_min + rounded_max) * multipliers / 2
+    return df
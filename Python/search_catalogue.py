@@ -0,0 +1,117 @@
+import json
+import os
+import re
+from psycopg2.extras import execute_values
+
+# What to fetch and how to group it lives in search_catalogue.json at the project root:
+# the Adzuna countries to search, the search terms (each searched in every enabled country
+# unless it lists its own), the API budget, and the job families titles are classified into.
+CATALOGUE_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "search_catalogue.json"))
+DEFAULT_COUNTRY = "au"
+
+# Each distinct title is classified once, here, and the dashboard view joins on it
+TITLE_FAMILIES_TABLE = "adzuna_title_families"
+
+BACKFILL_BATCH_ROWS = 5000
+
+
+def load_catalogue(path=CATALOGUE_PATH):
+    """Reads the search catalogue."""
+    with open(path) as f:
+        return json.load(f)
+
+
+def searches(catalogue):
+    """The (country, term) pairs to fetch, in catalogue order."""
+    enabled = [country["code"] for country in catalogue["countries"] if country.get("enabled", True)]
+    pairs = []
+    for entry in catalogue["terms"]:
+        term, countries = (entry, enabled) if isinstance(entry, str) else (entry["term"], entry.get("countries", enabled))
+        pairs.extend((country, term) for country in countries)
+    return pairs
+
+
+def country_locations(catalogue):
+    """The "where" sent with each country's searches, by country code."""
+    return {country["code"]: country.get("where") for country in catalogue["countries"]}
+
+
+def search_label(country, term):
+    """How a search is named in logs, CSV file names and the fetch state; the default country is left out."""
+    return term if country == DEFAULT_COUNTRY else f"{country.upper()} {term}"
+
+
+def family_matcher(catalogue):
+    """Compiles the catalogue's families into a function returning a title's family, or None.
+
+    A title belongs to the first family with a phrase it contains, case-insensitively.
+    """
+    patterns = [(family["family"], re.compile("|".join(re.escape(title) for title in family["titles"]), re.IGNORECASE))
+                for family in catalogue["families"]]
+
+    def classify(title):
+        if not isinstance(title, str):
+            return None
+        for family, pattern in patterns:
+            if pattern.search(title):
+                return family
+        return None
+
+    return classify
+
+
+def classify_titles(cur, titles, catalogue):
+    """Stores the family of each title, None for titles in no family."""
+    classify = family_matcher(catalogue)
+    execute_values(cur, f"""
+        INSERT INTO {TITLE_FAMILIES_TABLE} (title, title_data_family) VALUES %s
+        ON CONFLICT (title) DO UPDATE SET title_data_family = EXCLUDED.title_data_family
+    """, [(title, classify(title)) for title in titles], page_size=1000)
+
+
+def classify_unmerged_titles(conn, catalogue=None):
+    """Classifies the titles of raw rows not merged yet that are not classified. Returns the titles classified."""
+    catalogue = catalogue or load_catalogue()
+    with conn.cursor() as cur:
+        cur.execute(f"""
+            SELECT DISTINCT r."Title"
+            FROM public.adzuna_results_raw r
+            WHERE NOT r."Merged"
+            AND NOT EXISTS (SELECT 1 FROM {TITLE_FAMILIES_TABLE} f WHERE f.title = r."Title")
+        """)
+        titles = [title for (title,) in cur.fetchall()]
+        classify_titles(cur, titles, catalogue)
+    conn.commit()
+    print(f"Classified {len(titles)} new titles into job families.")
+    return len(titles)
+
+
+def reclassify_titles(conn, catalogue=None):
+    """Classifies every title in adzuna_jobs_master again, eg after the catalogue's families change.
+
+    Run SQL/rebuild_dashboard.sql afterwards so the dashboard view and rollups follow.
+    """
+    catalogue = catalogue or load_catalogue()
+    classified = 0
+    with conn.cursor(name="reclassify_titles") as titles_cur, conn.cursor() as cur:
+        titles_cur.itersize = BACKFILL_BATCH_ROWS
+        titles_cur.execute("SELECT DISTINCT title FROM public.adzuna_jobs_master")
+        while True:
+            titles = [title for (title,) in titles_cur.fetchmany(BACKFILL_BATCH_ROWS)]
+            if not titles:
+                break
+            classify_titles(cur, titles, catalogue)
+            classified += len(titles)
+            print(f"Classified {classified} titles...")
+    conn.commit()
+    return classified
+
+
+if __name__ == "__main__":
+    from db_utils import get_connection
+
+    conn = get_connection()
+    try:
+        reclassify_titles(conn)
+    finally:
+        conn.close()
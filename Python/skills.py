@@ -0,0 +1,77 @@
+import re
+from psycopg2.extras import execute_values
+
+# Bit i of a listing's skills mask is set when SKILLS[i] appears in its description.
+# Only ever append to this list: the bit positions are stored in the database.
+SKILLS = [
+    "Python", "SQL", "Excel", "Power BI", "Tableau", "AWS", "Azure", "GCP", "Spark", "Snowflake",
+    "Databricks", "dbt", "Mage"
+]
+
+SKILL_BITS = {skill.lower(): 1 << bit for bit, skill in enumerate(SKILLS)}
+
+# One alternation over every skill (longest first, whole words only) so a description is scanned once
+SKILL_PATTERN = re.compile(
+    r"\b(" + "|".join(re.escape(skill).replace(r"\ ", r"\s+") for skill in sorted(SKILLS, key=len, reverse=True)) + r")\b",
+    re.IGNORECASE
+)
+
+BACKFILL_BATCH_ROWS = 5000
+
+
+def skill_mask(description):
+    """Returns the bitmask of the skills mentioned in one description."""
+    if not isinstance(description, str):
+        return 0
+    mask = 0
+    for match in SKILL_PATTERN.finditer(description):
+        mask |= SKILL_BITS[" ".join(match.group(1).lower().split())]
+    return mask
+
+
+def skill_masks(descriptions):
+    """Vectorised skill_mask over a Series of descriptions."""
+    return descriptions.map(skill_mask).astype("int64")
+
+
+def has_skill(masks, skill):
+    """Boolean Series of the masks that include the given skill."""
+    return (masks.fillna(0).astype("int64") & SKILL_BITS[skill.lower()]) != 0
+
+
+def backfill_master_skill_masks(conn):
+    """Fills skills_mask for adzuna_jobs_master rows merged before the column existed."""
+    updated = 0
+    while True:
+        with conn.cursor() as cur:
+            cur.execute("""
+                SELECT m.listing_key, d.description
+                FROM public.adzuna_jobs_master m
+                LEFT JOIN public.adzuna_descriptions d
+                ON d.description_hash = m.description_hash
+                WHERE m.skills_mask IS NULL
+                LIMIT %s
+            """, (BACKFILL_BATCH_ROWS,))
+            rows = cur.fetchall()
+            if not rows:
+                break
+            execute_values(cur, """
+                UPDATE public.adzuna_jobs_master m
+                SET skills_mask = v.skills_mask
+                FROM (VALUES %s) AS v (listing_key, skills_mask)
+                WHERE m.listing_key = v.listing_key
+            """, [(key, skill_mask(description)) for key, description in rows])
+        conn.commit()
+        updated += len(rows)
+        print(f"Backfilled skills_mask for {updated} listings...")
+    return updated
+
+
+if __name__ == "__main__":
+    from db_utils import get_connection
+
+    conn = get_connection()
+    try:
+        backfill_master_skill_masks(conn)
+    finally:
+        conn.close()
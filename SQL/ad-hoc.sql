@@ -1,4 +1,26 @@
 SELECT title_data_family, title, company, COUNT (*)
 FROM adzuna_jobs_streamlit_dashboard
 GROUP BY 1,2,3
-ORDER BY COUNT(*) DESC
\ No newline at end of file
+ORDER BY COUNT(*) DESC
+
+--listings as they stood at the end of a given day
+SELECT title, company, salary_min, salary_max
+FROM adzuna_jobs_as_of('2025-01-31 23:59:59')
+ORDER BY created DESC
+
+
+--Snowflake and dbt roles in Sydney this month, answered from the full-text index
+SELECT count(*)
+FROM adzuna_jobs_master
+WHERE search_vector @@ websearch_to_tsquery('english', 'snowflake dbt')
+AND location ILIKE '%sydney%'
+AND created >= date_trunc('month', current_date)
+
+
+--the largest groups of near-identical ads, eg one role reposted with new titles or dates
+SELECT cluster_id, count(*) AS listings, min(title) AS example_title, min(company) AS example_company
+FROM adzuna_jobs_master
+WHERE cluster_id IS NOT NULL
+GROUP BY cluster_id
+ORDER BY count(*) DESC
+LIMIT 20
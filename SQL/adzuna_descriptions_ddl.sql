@@ -0,0 +1,15 @@
+--each distinct job description once, referenced by description_hash from raw, master and history
+--description_hash is md5(description)::uuid, computed at fetch time by Python/descriptions.py
+CREATE TABLE IF NOT EXISTS adzuna_descriptions (
+    description_hash UUID PRIMARY KEY,
+    description TEXT NOT NULL
+);
+
+--lz4 compresses long text faster than the default pglz, servers built without it keep pglz
+DO $$
+BEGIN
+    ALTER TABLE adzuna_descriptions ALTER COLUMN description SET COMPRESSION lz4;
+EXCEPTION WHEN feature_not_supported THEN
+    RAISE NOTICE 'lz4 is not available on this server, adzuna_descriptions uses pglz';
+END;
+$$;
@@ -0,0 +1,36 @@
+--point-in-time view of the listings as they stood at as_of, eg SELECT * FROM adzuna_jobs_as_of('2025-01-31')
+--run after the master and history DDL; dropped first so a changed return type can be redeployed
+DROP FUNCTION IF EXISTS adzuna_jobs_as_of(TIMESTAMP);
+
+CREATE OR REPLACE FUNCTION adzuna_jobs_as_of(as_of TIMESTAMP)
+RETURNS TABLE (
+    title TEXT,
+    company TEXT,
+    location TEXT,
+    category TEXT,
+    contract_type TEXT,
+    contract_time TEXT,
+    salary_min NUMERIC,
+    salary_max NUMERIC,
+    created TIMESTAMPTZ,
+    description TEXT,
+    url TEXT,
+    "timestamp" TIMESTAMP
+) AS $$
+    SELECT m.title, m.company, m.location, m.category, m.contract_type, m.contract_time,
+           m.salary_min, m.salary_max, m.created, d.description, m.url, m.timestamp
+    FROM public.adzuna_jobs_master m
+    LEFT JOIN public.adzuna_descriptions d
+    ON d.description_hash = m.description_hash
+    WHERE m.valid_from <= as_of
+
+    UNION ALL
+
+    SELECT h.title, h.company, h.location, h.category, h.contract_type, h.contract_time,
+           h.salary_min, h.salary_max, h.created, d.description, h.url, h.timestamp
+    FROM public.adzuna_jobs_master_history h
+    LEFT JOIN public.adzuna_descriptions d
+    ON d.description_hash = h.description_hash
+    WHERE h.valid_from <= as_of
+    AND h.valid_to > as_of
+$$ LANGUAGE sql STABLE;
@@ -5,12 +5,32 @@ CREATE TABLE adzuna_jobs_master (
     category TEXT,
     contract_type TEXT,
     contract_time TEXT,
-    salary_min TEXT,
-    salary_max TEXT,
+    salary_min NUMERIC,
+    salary_max NUMERIC,
     created TIMESTAMPTZ NOT NULL,
-    description TEXT,
+    description_hash UUID, --text is in adzuna_descriptions
     url TEXT,
     timestamp TIMESTAMP NOT NULL,
-    PRIMARY KEY (title, company, created)
+    valid_from TIMESTAMP NOT NULL, --first fetch of the current content, older versions are in history
+    skills_mask INTEGER, --bit i set when skills.SKILLS[i] is in the description
+    pay_period TEXT, --annual, annual_thousands or daily, see salary.py
+    annualized_salary_aud NUMERIC,
+    listing_key BIGINT NOT NULL, --64-bit hash of title, company and created, see listing_key.py
+    search_vector TSVECTOR, --title (weight A) and description (weight B), maintained by the merge
+    cluster_id BIGINT, --near-duplicate cluster of the description it was first merged with, see near_duplicates.py
+    country TEXT NOT NULL DEFAULT 'au', --Adzuna country code of the search that first found it
+    merged_at TIMESTAMP NOT NULL DEFAULT now(), --when a merge last inserted or updated it, read by refresh_rollups.sql
+    PRIMARY KEY (listing_key)
 );
 
+--listings by the fetch that last updated them
+CREATE INDEX IF NOT EXISTS adzuna_jobs_master_timestamp_idx ON adzuna_jobs_master (timestamp);
+
+--the listings merged since the last rollup refresh
+CREATE INDEX IF NOT EXISTS adzuna_jobs_master_merged_at_idx ON adzuna_jobs_master (merged_at);
+
+--full-text search, eg WHERE search_vector @@ websearch_to_tsquery('english', 'snowflake dbt')
+CREATE INDEX IF NOT EXISTS adzuna_jobs_master_search_idx ON adzuna_jobs_master USING GIN (search_vector);
+
+--the rollup refresh rebuilds the days of every listing in a cluster the batch added to
+CREATE INDEX IF NOT EXISTS adzuna_jobs_master_cluster_idx ON adzuna_jobs_master (cluster_id);
@@ -1,3 +1,6 @@
+--history keeps one row per superseded version of a listing (valid_from <= t < valid_to)
+--the current version of every listing lives in adzuna_jobs_master
+--partitioned by month of valid_to so old versions can be detached or dropped as a unit
 CREATE TABLE adzuna_jobs_master_history (
     title TEXT NOT NULL,
     company TEXT NOT NULL,
@@ -5,13 +8,56 @@ CREATE TABLE adzuna_jobs_master_history (
     category TEXT,
     contract_type TEXT,
     contract_time TEXT,
-    salary_min TEXT,
-    salary_max TEXT,
+    salary_min NUMERIC,
+    salary_max NUMERIC,
     created TIMESTAMPTZ NOT NULL,
-    description TEXT,
+    description_hash UUID, --text is in adzuna_descriptions
     url TEXT,
     timestamp TIMESTAMP NOT NULL,
-    snapshot DATE,
-    PRIMARY KEY (title, company, created, snapshot)
-);
+    valid_from TIMESTAMP NOT NULL,
+    valid_to TIMESTAMP NOT NULL,
+    listing_key BIGINT NOT NULL,
+    PRIMARY KEY (listing_key, valid_to)
+) PARTITION BY RANGE (valid_to);
 
+--creates the monthly partition holding ts, called by the merge before it closes any versions
+CREATE OR REPLACE FUNCTION adzuna_history_ensure_partition(ts TIMESTAMP)
+RETURNS void AS $$
+DECLARE
+    month_start DATE := date_trunc('month', ts);
+BEGIN
+    IF ts IS NULL THEN
+        RETURN;
+    END IF;
+
+    EXECUTE format(
+        'CREATE TABLE IF NOT EXISTS %I PARTITION OF adzuna_jobs_master_history FOR VALUES FROM (%L) TO (%L)',
+        'adzuna_jobs_master_history_' || to_char(month_start, 'YYYY_MM'),
+        month_start,
+        month_start + interval '1 month'
+    );
+END;
+$$ LANGUAGE plpgsql;
+
+--retention: detaches (to archive/compress elsewhere) or drops every partition wholly before older_than
+CREATE OR REPLACE FUNCTION adzuna_history_retire_partitions(older_than DATE, drop_partitions BOOLEAN DEFAULT false)
+RETURNS SETOF TEXT AS $$
+DECLARE
+    partition_name TEXT;
+BEGIN
+    FOR partition_name IN
+        SELECT c.relname
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = 'adzuna_jobs_master_history'::regclass
+        AND to_date(right(c.relname, 7), 'YYYY_MM') + interval '1 month' <= older_than
+        ORDER BY c.relname
+    LOOP
+        EXECUTE format('ALTER TABLE adzuna_jobs_master_history DETACH PARTITION %I', partition_name);
+        IF drop_partitions THEN
+            EXECUTE format('DROP TABLE %I', partition_name);
+        END IF;
+        RETURN NEXT partition_name;
+    END LOOP;
+END;
+$$ LANGUAGE plpgsql;
@@ -1,48 +1,71 @@
-drop view public.adzuna_jobs_streamlit_dashboard;
+--materialized so the family lookup, salary casts and annualisation run once per refresh
+--instead of on every dashboard load. jobs_pipeline.py refreshes it concurrently after each merge
+--databases still holding the old plain view need it dropped first:
+--drop view public.adzuna_jobs_streamlit_dashboard;
+drop materialized view if exists public.adzuna_jobs_streamlit_dashboard;
 
-create view public.adzuna_jobs_streamlit_dashboard AS
+create materialized view public.adzuna_jobs_streamlit_dashboard AS
 
 WITH master_data as (
 
-select case when lower(title) like '%data scientist%' THEN 'Data Scientist'
-            when lower(title) like '%data analyst%' THEN 'Data Analyst'
-            when lower(title) like '%data engineer%' THEN 'Data Engineer'
-       end as title_data_family,
-       title,
+select f.title_data_family,
+       m.title,
        company,
        date(created) as created,
+       created as created_at,
        contract_type,
-       salary_min,
-       ROUND(CAST(salary_min AS float)) AS salary_min_new,
-       salary_max,
-       ROUND(CAST(salary_max AS float)) AS salary_max_new,
+       --salaries are typed and annualised once per listing at ingest, see Python/salary.py
+       CAST(ROUND(salary_min) AS float) AS salary_min_new,
+       CAST(ROUND(salary_max) AS float) AS salary_max_new,
+       CAST(annualized_salary_aud AS float) AS annualized_salary,
        location,
        url,
-       description
-from public.adzuna_jobs_master
-where lower(title) like '%data analyst%'
-or lower(title) like '%data engineer%'
-or lower(title) like '%data scientist%'
-) ,
-
-transformation as (
-SELECT * 
-     ,CASE WHEN LENGTH(salary_min) >= 7 THEN (salary_min_new + salary_max_new) / 2  
-           WHEN LENGTH(salary_min) IN (4,5) AND salary_min_new < 300 THEN ((salary_min_new * 1000) + (salary_max_new * 1000)) / 2 
-           WHEN contract_type = 'contract' and salary_min_new > 300 and LENGTH(salary_min) IN (5,6) THEN ((salary_min_new * 260) + (salary_max_new * 260)) / 2 
-      end annualized_salary
-FROM master_data
-order by salary_min_new
+       description,
+       skills_mask,
+       listing_key,
+       search_vector,
+       cluster_id
+from public.adzuna_jobs_master m
+--the family of each title is looked up, classified once per title from search_catalogue.json
+join public.adzuna_title_families f
+on f.title = m.title
+left join public.adzuna_descriptions d
+on d.description_hash = m.description_hash
+where f.title_data_family is not null
+--salaries are annualised in AUD, so the dashboard shows the Australian listings only
+and m.country = 'au'
 )
 
 SELECT title_data_family,
        title,
        company,
        created,
+       created_at,
        salary_min_new,
        salary_max_new,
        annualized_salary,       
        location,
        url,
-       description
-from transformation
\ No newline at end of file
+       description,
+       skills_mask,
+       listing_key,
+       search_vector,
+       cluster_id,
+       --the earliest listing of each near-duplicate cluster, to count each ad once; listings without one stand alone
+       row_number() OVER (PARTITION BY coalesce(cluster_id, listing_key) ORDER BY created_at, listing_key) = 1
+           AS cluster_representative
+from master_data;
+
+--REFRESH ... CONCURRENTLY needs a unique index, the listing key of adzuna_jobs_master
+create unique index adzuna_jobs_streamlit_dashboard_key_idx
+on public.adzuna_jobs_streamlit_dashboard (listing_key);
+
+create index adzuna_jobs_streamlit_dashboard_created_idx
+on public.adzuna_jobs_streamlit_dashboard (created);
+
+create index adzuna_jobs_streamlit_dashboard_family_idx
+on public.adzuna_jobs_streamlit_dashboard (title_data_family, created);
+
+--the dashboard's search box
+create index adzuna_jobs_streamlit_dashboard_search_idx
+on public.adzuna_jobs_streamlit_dashboard using gin (search_vector);
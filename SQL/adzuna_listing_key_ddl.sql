@@ -0,0 +1,7 @@
+--the listing key computed at fetch time by Python/listing_key.py, for backfills and ad-hoc lookups
+--eg SELECT * FROM adzuna_jobs_master WHERE listing_key = adzuna_listing_key('Data Engineer', 'Acme', '2025-01-31T02:00:00Z')
+CREATE OR REPLACE FUNCTION adzuna_listing_key(title TEXT, company TEXT, created TIMESTAMPTZ)
+RETURNS BIGINT AS $$
+    SELECT ('x' || substr(md5(title || chr(31) || company || chr(31)
+                              || to_char(created AT TIME ZONE 'UTC', 'YYYY-MM-DD"T"HH24:MI:SS"Z"')), 1, 16))::bit(64)::bigint
+$$ LANGUAGE sql IMMUTABLE;
@@ -0,0 +1,15 @@
+--near-duplicate clusters of job descriptions, assigned by Python/near_duplicates.py before each merge
+--signature is the description's MinHash signature (128 uint32 values), compared with later descriptions
+CREATE TABLE adzuna_description_clusters (
+    description_hash UUID PRIMARY KEY,
+    cluster_id BIGINT NOT NULL,
+    signature BYTEA NOT NULL
+);
+
+--the LSH index: a bucket per band of each signature, descriptions sharing a bucket are compared
+CREATE TABLE adzuna_lsh_buckets (
+    band SMALLINT NOT NULL,
+    bucket BIGINT NOT NULL,
+    description_hash UUID NOT NULL,
+    PRIMARY KEY (band, bucket, description_hash)
+);
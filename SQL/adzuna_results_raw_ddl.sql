@@ -5,11 +5,23 @@ CREATE TABLE adzuna_results_raw (
 	"Category" TEXT,
 	"Contract Type" TEXT,
 	"Contract Time" TEXT,
-	"Salary Min" TEXT,
-	"Salary Max" TEXT,
+	"Salary Min" NUMERIC,
+	"Salary Max" NUMERIC,
 	"Created" TIMESTAMPTZ NOT NULL,
-	"Description" TEXT,
 	"Redirect URL" TEXT,
 	"timestamp" TIMESTAMP NOT NULL,
-    PRIMARY KEY ("Title","Company", "Created", "timestamp")
-);
\ No newline at end of file
+	"Skills Mask" INTEGER, --bit i set when skills.SKILLS[i] is in the description
+	"Pay Period" TEXT, --annual, annual_thousands or daily, see salary.py
+	"Annualized Salary AUD" NUMERIC,
+	"Listing Key" BIGINT NOT NULL, --64-bit hash of Title, Company and Created, see listing_key.py
+	"Description Hash" UUID, --text is in adzuna_descriptions
+	"Country" TEXT NOT NULL DEFAULT 'au', --Adzuna country code of the search, see search_catalogue.json
+	"Merged" BOOLEAN NOT NULL DEFAULT false, --set by combine_raw_master.sql once the row is merged into master
+    PRIMARY KEY ("Listing Key", "timestamp")
+);
+
+--fetch batches by their timestamp, eg the latest one
+CREATE INDEX IF NOT EXISTS adzuna_results_raw_timestamp_idx ON adzuna_results_raw ("timestamp");
+
+--the rows not merged yet, which the classify, cluster and merge stages read, whatever their timestamp
+CREATE INDEX IF NOT EXISTS adzuna_results_raw_unmerged_idx ON adzuna_results_raw ("Listing Key") WHERE NOT "Merged";
\ No newline at end of file
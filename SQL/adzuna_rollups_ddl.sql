@@ -0,0 +1,39 @@
+--per day and job family aggregates of the dashboard view, so the dashboard's KPIs and charts
+--read a few hundred rows however much history accumulates. refresh_rollups.sql keeps them current.
+--Each is split by cluster_representative, so counts can include near-duplicates or count each ad once
+CREATE TABLE adzuna_daily_rollup (
+    created DATE NOT NULL,
+    title_data_family TEXT NOT NULL,
+    cluster_representative BOOLEAN NOT NULL, --false for the near-duplicates of an earlier listing
+    job_count INTEGER NOT NULL,
+    salary_count INTEGER NOT NULL, --listings with an annualized salary
+    salary_sum DOUBLE PRECISION,
+    salary_min DOUBLE PRECISION,
+    salary_max DOUBLE PRECISION,
+    PRIMARY KEY (created, title_data_family, cluster_representative)
+);
+
+--annualized salaries counted in $5,000 buckets centred on round salaries (bucket 18 is $87,500 to $92,499),
+--used to estimate quartiles
+CREATE TABLE adzuna_daily_salary_histogram (
+    created DATE NOT NULL,
+    title_data_family TEXT NOT NULL,
+    cluster_representative BOOLEAN NOT NULL,
+    bucket INTEGER NOT NULL,
+    listings INTEGER NOT NULL,
+    PRIMARY KEY (created, title_data_family, cluster_representative, bucket)
+);
+
+CREATE TABLE adzuna_daily_skill_rollup (
+    created DATE NOT NULL,
+    title_data_family TEXT NOT NULL,
+    cluster_representative BOOLEAN NOT NULL,
+    bit INTEGER NOT NULL, --index into skills.SKILLS
+    listings INTEGER NOT NULL,
+    PRIMARY KEY (created, title_data_family, cluster_representative, bit)
+);
+
+--adzuna_jobs_master.merged_at of the last merge included in the rollups
+CREATE TABLE adzuna_rollup_watermark (
+    merged_through TIMESTAMP NOT NULL
+);
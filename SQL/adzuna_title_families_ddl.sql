@@ -0,0 +1,6 @@
+--the job family of each distinct listing title, from the families in search_catalogue.json
+--filled by Python/search_catalogue.py before each merge; titles in no family have a NULL family
+CREATE TABLE adzuna_title_families (
+    title TEXT PRIMARY KEY,
+    title_data_family TEXT
+);
@@ -1,17 +1,98 @@
---create a new script to preserve into history first
-insert INTO public.adzuna_jobs_master_history
-select *, current_date
-from public.adzuna_jobs_master;
+--incremental merge of the raw rows not merged yet into master
+--run as a single transaction (psql --single-transaction) so master is never seen half-merged
+--the final statement returns the number of listings inserted and updated
 
---clear master table
-TRUNCATE TABLE public.adzuna_jobs_master;
+--the raw rows not merged yet, whatever their timestamp (eg a CSV ingested after a later merge);
+--only these are marked merged at the end, so rows ingested during the merge wait for the next one
+DROP TABLE IF EXISTS merge_rows;
 
---repopulate master table
-INSERT INTO public.adzuna_jobs_master
+CREATE TEMP TABLE merge_rows AS
+SELECT "Listing Key", "timestamp"
+FROM public.adzuna_results_raw
+WHERE NOT "Merged";
 
-WITH master AS (
+--one row per listing (the latest fetch wins)
+DROP TABLE IF EXISTS merge_batch;
+
+CREATE TEMP TABLE merge_batch AS
+SELECT DISTINCT ON ("Listing Key")
+       "Listing Key" as listing_key,
+       "Title" as title,
+       "Company" as company,
+       "Location" as location,
+       "Category" as category,
+       "Contract Type" as contract_type,
+       "Contract Time" as contract_time,
+       "Salary Min" as salary_min,
+       "Salary Max" as salary_max,
+       "Created" as created,
+       "Description Hash" as description_hash,
+       "Redirect URL" as url,
+       "timestamp" as timestamp,
+       "Skills Mask" as skills_mask,
+       "Pay Period" as pay_period,
+       "Annualized Salary AUD" as annualized_salary_aud,
+       "Country" as country,
+       c.cluster_id
+FROM public.adzuna_results_raw r
+JOIN merge_rows USING ("Listing Key", "timestamp")
+LEFT JOIN public.adzuna_description_clusters c
+ON c.description_hash = r."Description Hash"
+ORDER BY "Listing Key", "timestamp" DESC;
+
+--make sure the month partitions exist for the versions closed by this batch
+SELECT public.adzuna_history_ensure_partition(month)
+FROM (SELECT DISTINCT date_trunc('month', timestamp) AS month FROM merge_batch) months;
+
+--close the master versions whose content changes in this batch, unchanged listings add no history
+INSERT INTO public.adzuna_jobs_master_history
+       (title, company, location, category, contract_type, contract_time, salary_min, salary_max,
+        created, description_hash, url, timestamp, valid_from, valid_to, listing_key)
+SELECT m.title,
+       m.company,
+       m.location,
+       m.category,
+       m.contract_type,
+       m.contract_time,
+       m.salary_min,
+       m.salary_max,
+       m.created,
+       m.description_hash,
+       m.url,
+       m.timestamp,
+       m.valid_from,
+       b.timestamp as valid_to,
+       m.listing_key
+FROM public.adzuna_jobs_master m
+JOIN merge_batch b
+ON m.listing_key = b.listing_key
+--a row fetched before master's version of the listing, merged late, is older news
+WHERE b.timestamp > m.timestamp
+AND (COALESCE(b.location, m.location), COALESCE(b.category, m.category),
+       COALESCE(b.contract_type, m.contract_type), COALESCE(b.contract_time, m.contract_time),
+       COALESCE(b.salary_min, m.salary_min), COALESCE(b.salary_max, m.salary_max),
+       COALESCE(b.description_hash, m.description_hash), COALESCE(b.url, m.url))
+      IS DISTINCT FROM
+      (m.location, m.category, m.contract_type, m.contract_time,
+       m.salary_min, m.salary_max, m.description_hash, m.url);
+
+--mark the rows of this merge, including those superseded within the batch or by master
+UPDATE public.adzuna_results_raw r
+SET "Merged" = true
+FROM merge_rows
+WHERE r."Listing Key" = merge_rows."Listing Key"
+AND r."timestamp" = merge_rows."timestamp";
+
+--upsert the batch into master, new values win unless they are missing, and rows older than master's are skipped
+--search_vector indexes the title and description text for full-text search, like skills_mask it follows the description
+--cluster_id is kept from the first merge that had one, so a listing never moves between clusters
+WITH upserted AS (
+    INSERT INTO public.adzuna_jobs_master AS m
+           (title, company, location, category, contract_type, contract_time, salary_min, salary_max,
+            created, description_hash, url, timestamp, valid_from, skills_mask, pay_period, annualized_salary_aud, listing_key,
+            search_vector, cluster_id, country, merged_at)
     SELECT title,
-           company ,
+           company,
            location,
            category,
            contract_type,
@@ -19,51 +100,52 @@ WITH master AS (
            salary_min,
            salary_max,
            created,
-           description,
+           b.description_hash,
            url,
-           timestamp	
-FROM public.adzuna_jobs_master_history
-where snapshot = (select max(snapshot) from public.adzuna_jobs_master_history)
-)
-
-, new AS (
-	SELECT * 
-	FROM public.adzuna_results_raw
-    WHERE timestamp = (select max(timestamp) from public.adzuna_results_raw)
-),
-
-combined as (
-    SELECT COALESCE(b."Title", a.title) as title,
-            COALESCE(b."Company", a.company) as company,
-            COALESCE(b."Location", a.location) as location,
-            COALESCE(b."Category", a.category) as category,
-            COALESCE(b."Contract Type", a.contract_type) as contract_type,
-            COALESCE(b."Contract Time", a.contract_time) as contract_time,
-            COALESCE(b."Salary Min", a.salary_min) as salary_min,
-            COALESCE(b."Salary Max", a.salary_max) as salary_max,
-            COALESCE(b."Created", a.created) as created,
-            COALESCE(b."Description", a.description) as description,
-            COALESCE(b."Redirect URL", a.url) as url,
-            COALESCE(b."timestamp", a.timestamp) as timestamp,
-            ROW_NUMBER()OVER(PARTITION BY COALESCE(b."Title", a.title), COALESCE(b."Company", a.company), COALESCE(b."Created", a.created) ORDER BY COALESCE(b."timestamp", a.timestamp) DESC) ROW
-    FROM master a
-    FULL OUTER JOIN new b
-    ON a.title = b."Title"
-    AND a.company = b."Company"
-    AND a.created = b."Created"
+           timestamp,
+           timestamp as valid_from,
+           skills_mask,
+           pay_period,
+           annualized_salary_aud,
+           listing_key,
+           setweight(to_tsvector('english', title), 'A') || setweight(to_tsvector('english', coalesce(d.description, '')), 'B'),
+           cluster_id,
+           country,
+           now()
+    FROM merge_batch b
+    LEFT JOIN public.adzuna_descriptions d
+    ON d.description_hash = b.description_hash
+    ON CONFLICT (listing_key) DO UPDATE
+    SET location = COALESCE(EXCLUDED.location, m.location),
+        category = COALESCE(EXCLUDED.category, m.category),
+        contract_type = COALESCE(EXCLUDED.contract_type, m.contract_type),
+        contract_time = COALESCE(EXCLUDED.contract_time, m.contract_time),
+        salary_min = COALESCE(EXCLUDED.salary_min, m.salary_min),
+        salary_max = COALESCE(EXCLUDED.salary_max, m.salary_max),
+        description_hash = COALESCE(EXCLUDED.description_hash, m.description_hash),
+        url = COALESCE(EXCLUDED.url, m.url),
+        pay_period = CASE WHEN EXCLUDED.salary_min IS NULL THEN m.pay_period ELSE EXCLUDED.pay_period END,
+        annualized_salary_aud = CASE WHEN EXCLUDED.salary_min IS NULL THEN m.annualized_salary_aud ELSE EXCLUDED.annualized_salary_aud END,
+        skills_mask = CASE WHEN EXCLUDED.description_hash IS NULL THEN m.skills_mask ELSE EXCLUDED.skills_mask END,
+        search_vector = CASE WHEN EXCLUDED.description_hash IS NULL THEN m.search_vector ELSE EXCLUDED.search_vector END,
+        cluster_id = COALESCE(m.cluster_id, EXCLUDED.cluster_id),
+        timestamp = EXCLUDED.timestamp,
+        merged_at = EXCLUDED.merged_at,
+        --a new version starts only when the content changed (SET expressions see the old row)
+        valid_from = CASE WHEN (COALESCE(EXCLUDED.location, m.location), COALESCE(EXCLUDED.category, m.category),
+                                COALESCE(EXCLUDED.contract_type, m.contract_type), COALESCE(EXCLUDED.contract_time, m.contract_time),
+                                COALESCE(EXCLUDED.salary_min, m.salary_min), COALESCE(EXCLUDED.salary_max, m.salary_max),
+                                COALESCE(EXCLUDED.description_hash, m.description_hash), COALESCE(EXCLUDED.url, m.url))
+                               IS DISTINCT FROM
+                               (m.location, m.category, m.contract_type, m.contract_time,
+                                m.salary_min, m.salary_max, m.description_hash, m.url)
+                          THEN EXCLUDED.timestamp
+                          ELSE m.valid_from
+                     END
+    WHERE EXCLUDED.timestamp > m.timestamp
+    RETURNING (xmax = 0) AS inserted
 )
 
-SELECT title,
-       company,
-       location,
-       category,
-       contract_type,
-       contract_time,
-       salary_min,
-       salary_max,
-       created,
-       description,
-       url,
-       timestamp
-FROM combined
-where ROW = 1
+SELECT count(*) FILTER (WHERE inserted) AS inserted_rows,
+       count(*) FILTER (WHERE NOT inserted) AS updated_rows
+FROM upserted;
@@ -0,0 +1,107 @@
+--one-off migration from daily snapshot history to valid_from/valid_to versions
+--run from the SQL folder with: psql --single-transaction -v ON_ERROR_STOP=1 -f migrate_01_history_scd2.sql
+--the old table is kept as adzuna_jobs_master_history_snapshots, drop it once the result is checked
+--adzuna_jobs_as_of() is created by migrate_03_typed_salaries.sql once the salaries are numeric
+
+--the original dashboard is a plain view, which the later migrations' DROP MATERIALIZED VIEW cannot remove;
+--rebuild_dashboard.sql recreates it as a materialized view after the last migration
+DO $$
+BEGIN
+    IF EXISTS (SELECT 1 FROM pg_views
+               WHERE schemaname = 'public' AND viewname = 'adzuna_jobs_streamlit_dashboard') THEN
+        DROP VIEW public.adzuna_jobs_streamlit_dashboard;
+    END IF;
+END;
+$$;
+
+ALTER TABLE adzuna_jobs_master_history RENAME TO adzuna_jobs_master_history_snapshots;
+ALTER TABLE adzuna_jobs_master_history_snapshots
+    RENAME CONSTRAINT adzuna_jobs_master_history_pkey TO adzuna_jobs_master_history_snapshots_pkey;
+
+ALTER TABLE adzuna_jobs_master ADD COLUMN valid_from TIMESTAMP;
+
+\ir adzuna_jobs_master_history_ddl.sql
+\ir adzuna_listing_key_ddl.sql
+\ir adzuna_descriptions_ddl.sql
+
+--collapse consecutive identical snapshots of a listing into one version
+CREATE TEMP TABLE snapshot_versions AS
+WITH snapshots AS (
+    SELECT *,
+           md5(row(location, category, contract_type, contract_time, salary_min, salary_max, description, url)::text) AS content,
+           lag(md5(row(location, category, contract_type, contract_time, salary_min, salary_max, description, url)::text))
+               OVER (PARTITION BY title, company, created ORDER BY snapshot) AS previous_content
+    FROM adzuna_jobs_master_history_snapshots
+),
+
+numbered AS (
+    SELECT *,
+           count(*) FILTER (WHERE previous_content IS DISTINCT FROM content)
+               OVER (PARTITION BY title, company, created ORDER BY snapshot) AS version_number
+    FROM snapshots
+),
+
+--a version starts when its content was first fetched (the row's own timestamp), not on the
+--day it was first snapshotted, which can be days later
+versions AS (
+    SELECT DISTINCT ON (title, company, created, version_number) *,
+           min(timestamp) OVER (PARTITION BY title, company, created, version_number) AS version_start,
+           max(snapshot) OVER (PARTITION BY title, company, created, version_number) AS last_snapshot
+    FROM numbered
+    ORDER BY title, company, created, version_number, snapshot
+)
+
+SELECT *,
+       lead(version_start) OVER (PARTITION BY title, company, created ORDER BY version_number) AS next_start
+FROM versions;
+
+--the current version started with the last snapshotted version with the same content as master
+UPDATE adzuna_jobs_master m
+SET valid_from = v.version_start
+FROM snapshot_versions v
+WHERE v.title = m.title
+AND v.company = m.company
+AND v.created = m.created
+AND v.next_start IS NULL
+AND v.content = md5(row(m.location, m.category, m.contract_type, m.contract_time, m.salary_min, m.salary_max, m.description, m.url)::text);
+
+UPDATE adzuna_jobs_master SET valid_from = timestamp WHERE valid_from IS NULL;
+ALTER TABLE adzuna_jobs_master ALTER COLUMN valid_from SET NOT NULL;
+
+--every other version is closed by the start of the one after it (or of master's current version)
+CREATE TEMP TABLE closed_versions AS
+SELECT v.title, v.company, v.location, v.category, v.contract_type, v.contract_time,
+       v.salary_min, v.salary_max, v.created, v.description, v.url, v.timestamp,
+       v.version_start AS valid_from,
+       --listings that dropped out of master have no closing time, the day after their last snapshot closes them
+       COALESCE(v.next_start, m.valid_from, v.last_snapshot::timestamp + interval '1 day') AS valid_to
+FROM snapshot_versions v
+LEFT JOIN adzuna_jobs_master m
+ON v.title = m.title
+AND v.company = m.company
+AND v.created = m.created
+WHERE v.next_start IS NOT NULL
+OR m.valid_from IS DISTINCT FROM v.version_start;
+
+SELECT adzuna_history_ensure_partition(month)
+FROM (SELECT DISTINCT date_trunc('month', valid_to) AS month FROM closed_versions) months;
+
+--the history DDL declares numeric salaries, the listing key and the description hash,
+--master gets them in migrate_03, migrate_04 and migrate_05
+INSERT INTO adzuna_descriptions (description_hash, description)
+SELECT DISTINCT md5(description)::uuid, description
+FROM closed_versions
+WHERE valid_to > valid_from
+AND description <> ''
+ON CONFLICT DO NOTHING;
+
+INSERT INTO adzuna_jobs_master_history
+       (title, company, location, category, contract_type, contract_time, salary_min, salary_max,
+        created, description_hash, url, timestamp, valid_from, valid_to, listing_key)
+SELECT title, company, location, category, contract_type, contract_time,
+       NULLIF(trim(salary_min::text), '')::numeric, NULLIF(trim(salary_max::text), '')::numeric,
+       created, md5(NULLIF(description, ''))::uuid, url, timestamp,
+       valid_from, valid_to,
+       adzuna_listing_key(title, company, created)
+FROM closed_versions
+WHERE valid_to > valid_from;
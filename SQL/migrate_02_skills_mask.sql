@@ -0,0 +1,5 @@
+--adds the skill bitmask columns to an existing database
+--after the last migration, run Python/skills.py once to backfill adzuna_jobs_master, before rebuild_dashboard.sql;
+--it reads descriptions by hash and updates by listing key, which migrate_04 and migrate_05 add
+ALTER TABLE adzuna_results_raw ADD COLUMN "Skills Mask" INTEGER;
+ALTER TABLE adzuna_jobs_master ADD COLUMN skills_mask INTEGER;
@@ -0,0 +1,48 @@
+--converts the text salary columns to numbers and adds the pay period and annualized salary
+--run from the SQL folder with: psql --single-transaction -v ON_ERROR_STOP=1 -f migrate_03_typed_salaries.sql
+--new rows get the same values from Python/salary.py at ingest
+
+--objects that depend on the salary column types are recreated at the end
+DROP MATERIALIZED VIEW IF EXISTS public.adzuna_jobs_streamlit_dashboard;
+DROP FUNCTION IF EXISTS adzuna_jobs_as_of(TIMESTAMP);
+
+ALTER TABLE adzuna_results_raw
+    ALTER COLUMN "Salary Min" TYPE NUMERIC USING NULLIF(trim("Salary Min"::text), '')::numeric,
+    ALTER COLUMN "Salary Max" TYPE NUMERIC USING NULLIF(trim("Salary Max"::text), '')::numeric,
+    ADD COLUMN "Pay Period" TEXT,
+    ADD COLUMN "Annualized Salary AUD" NUMERIC;
+
+ALTER TABLE adzuna_jobs_master
+    ALTER COLUMN salary_min TYPE NUMERIC USING NULLIF(trim(salary_min::text), '')::numeric,
+    ALTER COLUMN salary_max TYPE NUMERIC USING NULLIF(trim(salary_max::text), '')::numeric,
+    ADD COLUMN pay_period TEXT,
+    ADD COLUMN annualized_salary_aud NUMERIC;
+
+ALTER TABLE adzuna_jobs_master_history
+    ALTER COLUMN salary_min TYPE NUMERIC USING NULLIF(trim(salary_min::text), '')::numeric,
+    ALTER COLUMN salary_max TYPE NUMERIC USING NULLIF(trim(salary_max::text), '')::numeric;
+
+--same rules as Python/salary.py, applied to the rounded minimum salary
+UPDATE adzuna_results_raw
+SET "Pay Period" = CASE WHEN round("Salary Min") >= 10000 THEN 'annual'
+                        WHEN round("Salary Min") >= 10 AND round("Salary Min") < 300 THEN 'annual_thousands'
+                        WHEN "Contract Type" = 'contract' AND round("Salary Min") > 300 AND round("Salary Min") < 10000 THEN 'daily'
+                   END,
+    "Annualized Salary AUD" = (round("Salary Min") + round("Salary Max"))
+                              * CASE WHEN round("Salary Min") >= 10000 THEN 1
+                                     WHEN round("Salary Min") >= 10 AND round("Salary Min") < 300 THEN 1000
+                                     WHEN "Contract Type" = 'contract' AND round("Salary Min") > 300 AND round("Salary Min") < 10000 THEN 260
+                                END / 2
+WHERE "Salary Min" IS NOT NULL;
+
+UPDATE adzuna_jobs_master
+SET pay_period = CASE WHEN round(salary_min) >= 10000 THEN 'annual'
+                      WHEN round(salary_min) >= 10 AND round(salary_min) < 300 THEN 'annual_thousands'
+                      WHEN contract_type = 'contract' AND round(salary_min) > 300 AND round(salary_min) < 10000 THEN 'daily'
+                 END,
+    annualized_salary_aud = (round(salary_min) + round(salary_max))
+                            * CASE WHEN round(salary_min) >= 10000 THEN 1
+                                   WHEN round(salary_min) >= 10 AND round(salary_min) < 300 THEN 1000
+                                   WHEN contract_type = 'contract' AND round(salary_min) > 300 AND round(salary_min) < 10000 THEN 260
+                              END / 2
+WHERE salary_min IS NOT NULL;
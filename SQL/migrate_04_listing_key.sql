@@ -0,0 +1,36 @@
+--replaces the (title, company, created) keys with the 64-bit listing key computed at fetch time
+--run from the SQL folder with: psql --single-transaction -v ON_ERROR_STOP=1 -f migrate_04_listing_key.sql
+
+\ir adzuna_listing_key_ddl.sql
+
+--the dashboard view is recreated with the key at the end
+DROP MATERIALIZED VIEW IF EXISTS public.adzuna_jobs_streamlit_dashboard;
+
+ALTER TABLE adzuna_results_raw ADD COLUMN "Listing Key" BIGINT;
+UPDATE adzuna_results_raw SET "Listing Key" = adzuna_listing_key("Title", "Company", "Created");
+ALTER TABLE adzuna_results_raw
+    ALTER COLUMN "Listing Key" SET NOT NULL,
+    DROP CONSTRAINT adzuna_results_raw_pkey,
+    ADD PRIMARY KEY ("Listing Key", "timestamp");
+
+ALTER TABLE adzuna_jobs_master ADD COLUMN listing_key BIGINT;
+UPDATE adzuna_jobs_master SET listing_key = adzuna_listing_key(title, company, created);
+ALTER TABLE adzuna_jobs_master
+    ALTER COLUMN listing_key SET NOT NULL,
+    DROP CONSTRAINT adzuna_jobs_master_pkey,
+    ADD PRIMARY KEY (listing_key);
+
+--history converted by migrate_01 after this change already has the key
+DO $$
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM information_schema.columns
+                   WHERE table_name = 'adzuna_jobs_master_history' AND column_name = 'listing_key') THEN
+        ALTER TABLE adzuna_jobs_master_history ADD COLUMN listing_key BIGINT;
+        UPDATE adzuna_jobs_master_history SET listing_key = adzuna_listing_key(title, company, created);
+        ALTER TABLE adzuna_jobs_master_history
+            ALTER COLUMN listing_key SET NOT NULL,
+            DROP CONSTRAINT adzuna_jobs_master_history_pkey,
+            ADD PRIMARY KEY (listing_key, valid_to);
+    END IF;
+END;
+$$;
@@ -0,0 +1,47 @@
+--moves job descriptions out of raw, master and history into adzuna_descriptions, stored once per distinct text
+--run from the SQL folder with: psql --single-transaction -v ON_ERROR_STOP=1 -f migrate_05_description_store.sql
+--run VACUUM FULL on the three tables afterwards to give the space back
+
+\ir adzuna_descriptions_ddl.sql
+
+--objects that read the description column are recreated at the end
+DROP MATERIALIZED VIEW IF EXISTS public.adzuna_jobs_streamlit_dashboard;
+DROP FUNCTION IF EXISTS adzuna_jobs_as_of(TIMESTAMP);
+
+INSERT INTO adzuna_descriptions (description_hash, description)
+SELECT DISTINCT md5("Description")::uuid, "Description"
+FROM adzuna_results_raw
+WHERE "Description" <> ''
+ON CONFLICT DO NOTHING;
+
+ALTER TABLE adzuna_results_raw ADD COLUMN "Description Hash" UUID;
+UPDATE adzuna_results_raw SET "Description Hash" = md5(NULLIF("Description", ''))::uuid;
+ALTER TABLE adzuna_results_raw DROP COLUMN "Description";
+
+INSERT INTO adzuna_descriptions (description_hash, description)
+SELECT DISTINCT md5(description)::uuid, description
+FROM adzuna_jobs_master
+WHERE description <> ''
+ON CONFLICT DO NOTHING;
+
+ALTER TABLE adzuna_jobs_master ADD COLUMN description_hash UUID;
+UPDATE adzuna_jobs_master SET description_hash = md5(NULLIF(description, ''))::uuid;
+ALTER TABLE adzuna_jobs_master DROP COLUMN description;
+
+--history converted by migrate_01 after this change already holds hashes
+DO $$
+BEGIN
+    IF EXISTS (SELECT 1 FROM information_schema.columns
+               WHERE table_name = 'adzuna_jobs_master_history' AND column_name = 'description') THEN
+        INSERT INTO adzuna_descriptions (description_hash, description)
+        SELECT DISTINCT md5(description)::uuid, description
+        FROM adzuna_jobs_master_history
+        WHERE description <> ''
+        ON CONFLICT DO NOTHING;
+
+        ALTER TABLE adzuna_jobs_master_history ADD COLUMN description_hash UUID;
+        UPDATE adzuna_jobs_master_history SET description_hash = md5(NULLIF(description, ''))::uuid;
+        ALTER TABLE adzuna_jobs_master_history DROP COLUMN description;
+    END IF;
+END;
+$$;
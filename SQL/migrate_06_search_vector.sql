@@ -0,0 +1,16 @@
+--adds full-text search over title and description to master and the dashboard view
+--run from the SQL folder with: psql --single-transaction -v ON_ERROR_STOP=1 -f migrate_06_search_vector.sql
+
+DROP MATERIALIZED VIEW IF EXISTS public.adzuna_jobs_streamlit_dashboard;
+
+ALTER TABLE adzuna_jobs_master ADD COLUMN search_vector TSVECTOR;
+
+UPDATE adzuna_jobs_master m
+SET search_vector = setweight(to_tsvector('english', m.title), 'A')
+                    || setweight(to_tsvector('english', coalesce(d.description, '')), 'B')
+FROM adzuna_jobs_master k
+LEFT JOIN adzuna_descriptions d
+ON d.description_hash = k.description_hash
+WHERE k.listing_key = m.listing_key;
+
+CREATE INDEX adzuna_jobs_master_search_idx ON adzuna_jobs_master USING GIN (search_vector);
@@ -0,0 +1,6 @@
+--adds the daily rollups the dashboard reads its KPIs and charts from
+--run from the SQL folder with: psql --single-transaction -v ON_ERROR_STOP=1 -f migrate_07_rollups.sql
+--this only creates the tables, empty; rebuild_dashboard.sql, run after the last migration, backfills them
+--from the recreated dashboard view, which needs the columns later migrations add
+
+\ir adzuna_rollups_ddl.sql
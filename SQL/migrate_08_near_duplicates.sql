@@ -0,0 +1,11 @@
+--adds near-duplicate clusters: the MinHash/LSH tables and adzuna_jobs_master.cluster_id
+--run from the SQL folder with: psql --single-transaction -v ON_ERROR_STOP=1 -f migrate_08_near_duplicates.sql
+--then run Python/near_duplicates.py once to cluster the stored descriptions, before rebuild_dashboard.sql
+
+DROP MATERIALIZED VIEW IF EXISTS public.adzuna_jobs_streamlit_dashboard;
+
+\ir adzuna_near_duplicates_ddl.sql
+
+ALTER TABLE adzuna_jobs_master ADD COLUMN cluster_id BIGINT;
+
+CREATE INDEX adzuna_jobs_master_cluster_idx ON adzuna_jobs_master (cluster_id);
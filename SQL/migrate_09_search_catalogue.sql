@@ -0,0 +1,12 @@
+--adds the search catalogue's country column and the title to job family lookup
+--run from the SQL folder with: psql --single-transaction -v ON_ERROR_STOP=1 -f migrate_09_search_catalogue.sql
+--then run Python/search_catalogue.py once to classify the stored titles, before rebuild_dashboard.sql
+
+DROP MATERIALIZED VIEW IF EXISTS public.adzuna_jobs_streamlit_dashboard;
+
+\ir adzuna_title_families_ddl.sql
+
+--every listing fetched so far came from the Australian endpoint
+ALTER TABLE adzuna_results_raw ADD COLUMN "Country" TEXT NOT NULL DEFAULT 'au';
+
+ALTER TABLE adzuna_jobs_master ADD COLUMN country TEXT NOT NULL DEFAULT 'au';
@@ -0,0 +1,10 @@
+--adds the timestamp indexes declared in the master and raw DDL
+--CREATE INDEX CONCURRENTLY cannot run inside a transaction, so run this one WITHOUT --single-transaction:
+--run from the SQL folder with: psql -v ON_ERROR_STOP=1 -f migrate_10_timestamp_indexes.sql
+--the tables stay writable while the indexes build; if a build fails, DROP the invalid index and rerun
+
+--listings by the fetch that last updated them
+CREATE INDEX CONCURRENTLY IF NOT EXISTS adzuna_jobs_master_timestamp_idx ON adzuna_jobs_master (timestamp);
+
+--fetch batches by their timestamp, eg the latest one
+CREATE INDEX CONCURRENTLY IF NOT EXISTS adzuna_results_raw_timestamp_idx ON adzuna_results_raw ("timestamp");
@@ -0,0 +1,20 @@
+--tracks which raw rows have been merged, instead of merging only rows newer than the last merged timestamp
+--run from the SQL folder with: psql --single-transaction -v ON_ERROR_STOP=1 -f migrate_11_merge_tracking.sql
+
+--the rows the old timestamp filter would still merge are the only ones left unmerged
+ALTER TABLE adzuna_results_raw ADD COLUMN "Merged" BOOLEAN NOT NULL DEFAULT true;
+ALTER TABLE adzuna_results_raw ALTER COLUMN "Merged" SET DEFAULT false;
+UPDATE adzuna_results_raw
+SET "Merged" = false
+WHERE "timestamp" > (SELECT coalesce(max(timestamp), '-infinity') FROM adzuna_jobs_master);
+
+CREATE INDEX adzuna_results_raw_unmerged_idx ON adzuna_results_raw ("Listing Key") WHERE NOT "Merged";
+
+--until now the rollups followed master.timestamp, which the watermark already holds
+ALTER TABLE adzuna_jobs_master ADD COLUMN merged_at TIMESTAMP;
+UPDATE adzuna_jobs_master SET merged_at = timestamp;
+ALTER TABLE adzuna_jobs_master
+    ALTER COLUMN merged_at SET DEFAULT now(),
+    ALTER COLUMN merged_at SET NOT NULL;
+
+CREATE INDEX adzuna_jobs_master_merged_at_idx ON adzuna_jobs_master (merged_at);
@@ -0,0 +1,17 @@
+--one row per stage of each jobs_pipeline.py run, used for timings and --resume
+CREATE SEQUENCE pipeline_run_id_seq;
+
+CREATE TABLE pipeline_run_log (
+    run_id BIGINT NOT NULL,
+    stage TEXT NOT NULL,
+    status TEXT NOT NULL, --running, success or failed
+    started_at TIMESTAMP NOT NULL,
+    finished_at TIMESTAMP,
+    duration_seconds NUMERIC,
+    row_count BIGINT,
+    error TEXT,
+    PRIMARY KEY (run_id, stage)
+);
+
+--the dashboard probes the latest successful refresh to decide whether its cache is stale
+CREATE INDEX pipeline_run_log_stage_idx ON pipeline_run_log (stage, finished_at);
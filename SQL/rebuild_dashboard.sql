@@ -0,0 +1,12 @@
+--recreates what is derived from master from the current DDL: the as-of function, the dashboard view and its rollups
+--run from the SQL folder after the last migration with: psql --single-transaction -v ON_ERROR_STOP=1 -f rebuild_dashboard.sql
+
+\ir adzuna_jobs_as_of_ddl.sql
+
+\ir adzuna_jobs_streamlit_dashboard.sql
+
+DROP TABLE IF EXISTS adzuna_daily_rollup, adzuna_daily_salary_histogram, adzuna_daily_skill_rollup, adzuna_rollup_watermark;
+
+\ir adzuna_rollups_ddl.sql
+
+\ir refresh_rollups.sql
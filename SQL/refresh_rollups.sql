@@ -0,0 +1,78 @@
+--rebuilds the rollups for each created day touched by the batches merged since the last refresh
+--jobs_pipeline.py runs it right after refreshing the dashboard view, in the same transaction,
+--so the dashboard never sees the two out of step. The last statement returns the days rebuilt
+
+--master.merged_at is the merge that last inserted or updated a listing, so rows merged late,
+--with an old fetch timestamp, are picked up too
+DROP TABLE IF EXISTS rollup_touched;
+
+CREATE TEMP TABLE rollup_touched AS
+SELECT created, cluster_id, merged_at
+FROM public.adzuna_jobs_master
+WHERE merged_at > (SELECT coalesce(max(merged_through), '-infinity') FROM public.adzuna_rollup_watermark);
+
+--a listing joining a cluster can take over as its representative, so the days of the rest of the cluster change too
+DROP TABLE IF EXISTS rollup_days;
+
+CREATE TEMP TABLE rollup_days AS
+SELECT date(created) AS created
+FROM rollup_touched
+UNION
+SELECT date(m.created)
+FROM public.adzuna_jobs_master m
+WHERE m.cluster_id IN (SELECT cluster_id FROM rollup_touched);
+
+DELETE FROM public.adzuna_daily_rollup WHERE created IN (SELECT created FROM rollup_days);
+
+DELETE FROM public.adzuna_daily_salary_histogram WHERE created IN (SELECT created FROM rollup_days);
+
+DELETE FROM public.adzuna_daily_skill_rollup WHERE created IN (SELECT created FROM rollup_days);
+
+INSERT INTO public.adzuna_daily_rollup
+SELECT created,
+       title_data_family,
+       cluster_representative,
+       count(*),
+       count(annualized_salary),
+       sum(annualized_salary),
+       min(annualized_salary),
+       max(annualized_salary)
+FROM public.adzuna_jobs_streamlit_dashboard
+WHERE created IN (SELECT created FROM rollup_days)
+GROUP BY created, title_data_family, cluster_representative;
+
+INSERT INTO public.adzuna_daily_salary_histogram
+SELECT created,
+       title_data_family,
+       cluster_representative,
+       round(annualized_salary / 5000)::integer AS bucket,
+       count(*)
+FROM public.adzuna_jobs_streamlit_dashboard
+WHERE created IN (SELECT created FROM rollup_days)
+AND annualized_salary IS NOT NULL
+GROUP BY created, title_data_family, cluster_representative, bucket;
+
+--skills_mask is a 32-bit integer, so bits 0 to 31 cover every skill it can hold
+INSERT INTO public.adzuna_daily_skill_rollup
+SELECT created,
+       title_data_family,
+       cluster_representative,
+       bit,
+       count(*)
+FROM public.adzuna_jobs_streamlit_dashboard
+CROSS JOIN generate_series(0, 31) AS bit
+WHERE created IN (SELECT created FROM rollup_days)
+AND skills_mask & (1 << bit) <> 0
+GROUP BY created, title_data_family, cluster_representative, bit;
+
+UPDATE public.adzuna_rollup_watermark
+SET merged_through = (SELECT max(merged_at) FROM rollup_touched)
+WHERE EXISTS (SELECT 1 FROM rollup_touched);
+
+INSERT INTO public.adzuna_rollup_watermark
+SELECT max(merged_at)
+FROM rollup_touched
+WHERE NOT EXISTS (SELECT 1 FROM public.adzuna_rollup_watermark)
+HAVING count(*) > 0;
+
+SELECT count(*) FROM rollup_days;
@@ -1,9 +1,15 @@
 import streamlit as st
 import pandas as pd
-import psycopg2
 import altair as alt
-from dotenv import load_dotenv
 import os
+import sys
+from contextlib import contextmanager
+
+# Shared pipeline modules live in the Python folder
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "Python"))
+import dashboard_queries as queries
+import dashboard_snapshot
+from db_utils import create_connection_pool, pooled_connection
 
 # Set up the page with a wide layout and custom title.
 st.set_page_config(page_title="Australian Data Jobs", layout="wide")
@@ -36,64 +42,107 @@ st.markdown("""
     """, unsafe_allow_html=True)
 
 # --------------------------
-# Data Loading Function
+# Data Loading Functions
 # --------------------------
+# When the pipeline has published a snapshot file the dashboard memory-maps it and
+# never touches the database. Otherwise filters are pushed into parameterised SQL and
+# each visual fetches only its aggregated result set.
+USE_SNAPSHOT = os.path.exists(dashboard_snapshot.SNAPSHOT_PATH)
+
+# One pool per server process, shared by every session and rerun
+@st.cache_resource
+def get_connection_pool():
+    return create_connection_pool(max_connections=8)
+
+# Cheap probe of the pipeline's published data version; the cached data below is
+# keyed on it, so it is reloaded once per pipeline run however many viewers there are
+@st.cache_data(ttl=60)
+def get_data_version():
+    if USE_SNAPSHOT:
+        return dashboard_snapshot.snapshot_version()
+    with pooled_connection(get_connection_pool(), autocommit=True) as conn:
+        return queries.data_version(conn)
+
+# Only the current snapshot is kept in memory
+@st.cache_resource(max_entries=1)
+def load_snapshot_frame(data_version):
+    return dashboard_snapshot.load_snapshot()
+
+@contextmanager
+def data_source(data_version, search=None):
+    """Yields the query module to use and the frame or connection it reads from.
+
+    Searches always go to the database, which holds the full-text index.
+    """
+    if USE_SNAPSHOT and not search:
+        yield dashboard_snapshot, load_snapshot_frame(data_version)
+    else:
+        with pooled_connection(get_connection_pool(), autocommit=True) as conn:
+            yield queries, conn
+
+@st.cache_data(max_entries=16)
+def load_filter_options(data_version):
+    with data_source(data_version) as (source, handle):
+        return source.date_bounds(handle), source.job_families(handle)
+
+# Each visual has its own cached loader keyed on the data version and the filters, so a
+# cache miss only recomputes what that visual shows, already shaped for drawing
+@st.cache_data(max_entries=256)
+def load_last_updated(data_version, filters):
+    with data_source(data_version, filters[3]) as (source, handle):
+        return source.last_updated(handle, *filters)
+
+@st.cache_data(max_entries=256)
+def load_kpis(data_version, filters):
+    with data_source(data_version, filters[3]) as (source, handle):
+        return source.kpi_summary(handle, *filters)
+
+@st.cache_data(max_entries=256)
+def load_weekly(data_version, filters):
+    with data_source(data_version, filters[3]) as (source, handle):
+        df_weekly = source.weekly_counts(handle, *filters)
+    if not df_weekly.empty:
+        # Convert week_begin to datetime for proper sorting
+        df_weekly["week_begin_date"] = pd.to_datetime(df_weekly["week_begin"])
+        df_weekly = df_weekly.sort_values("week_begin_date")  # Sort by date
 
-@st.cache_data
-def load_data():
-
-    load_dotenv()  # Load environment variables from .env
-
-    conn = psycopg2.connect(
-    host=os.getenv('DB_HOST'),
-    database=os.getenv('DB_NAME'),
-    user=os.getenv('DB_USER'),
-    password=os.getenv('DB_PASSWORD')
-)
-
-    query = "SELECT * FROM adzuna_jobs_streamlit_dashboard where created <= current_date;"  # Replace with your actual view name.
-    df = pd.read_sql(query, conn)
-    conn.close()
-    return df
-
-# Load the data.
-df = load_data()
-
-# Convert the "created" field to datetime.
-if "created" in df.columns:
-    df["created"] = pd.to_datetime(df["created"])
-
-    # Extract year and month from the created column
-    #df["created_year_month"] = df["created"].dt.to_period("M")
-
-    # Drop duplicates based on title, company, and created_year_month
-    #df = df.drop_duplicates(subset=["title", "company", "created_year_month"])
-
-    # Get current date (without time)
-    current_date = pd.Timestamp.today().normalize()
-
-    # Filter out future dates
-    df = df[df['created'] <= current_date]
-
-###########################################################
-# Function to create binary fields for predefined skills
-###########################################################
-
-def add_skill_columns(df, skills):
-    for skill in skills:
-        df[skill] = df['description'].str.contains(skill, case=False, na=False).astype(int)
-    return df
+        # Compute cumulative job counts by job family
+        df_weekly["cumulative_job_count"] = df_weekly.groupby("title_data_family")["job_count"].cumsum()
+    return df_weekly
+
+@st.cache_data(max_entries=256)
+def load_skills(data_version, filters):
+    with data_source(data_version, filters[3]) as (source, handle):
+        return source.skill_counts(handle, *filters).sort_values("Count", ascending=False)
+
+@st.cache_data(max_entries=256)
+def load_salary(data_version, filters):
+    with data_source(data_version, filters[3]) as (source, handle):
+        return source.salary_distribution(handle, *filters)
+
+# The rendered table, so a rerun does not rebuild the HTML
+@st.cache_data(max_entries=256)
+def load_sample_html(data_version, filters, limit):
+    with data_source(data_version, filters[3]) as (source, handle):
+        sample_df = source.sample_listings(handle, *filters, limit=limit)
+    if sample_df.empty:
+        return None
+
+    # Format the created column (remove time, show only date)
+    sample_df["created"] = pd.to_datetime(sample_df["created"]).dt.strftime("%Y-%m-%d")
+
+    # Convert the URL column to clickable links
+    sample_df["url"] = sample_df["url"].apply(
+        lambda x: f'<a href="{x}" target="_blank">Link</a>' if pd.notna(x) else "N/A"
+    )
+    return sample_df.to_html(escape=False, index=False)
 
-# Predefined list of skills
-skills_list = [
-    "Python", "SQL", "Excel", "Power BI", "Tableau", "AWS", "Azure","GCP","Spark","Snowflake",
-    "Databricks","dbt","Mage"
-]
+data_version = get_data_version()
+(min_date, max_date), job_families = load_filter_options(data_version)
 
-# Add binary skill columns
-if "description" in df.columns:
-    df = add_skill_columns(df, skills_list)
-###########################################################
+if min_date is None:
+    st.write("No job listings are available yet.")
+    st.stop()
 
 # --------------------------
 # Sidebar: Enhanced Filters
@@ -101,40 +150,45 @@ if "description" in df.columns:
 st.sidebar.header("Filters")
 
 # 🎚️ Date Range Slider
-if "created" in df.columns:
-    min_date = df["created"].min().date()
-    max_date = df["created"].max().date()
-    
-    # Convert dates to ordinal format for Streamlit slider
-    date_range = st.sidebar.slider(
-        "Select Date Range", 
-        min_value=min_date, 
-        max_value=max_date, 
-        value=(min_date, max_date),
-        format="YYYY-MM-DD"
-    )
-    
-    # Apply date filter
-    df = df[(df["created"].dt.date >= date_range[0]) & (df["created"].dt.date <= date_range[1])]
+date_range = st.sidebar.slider(
+    "Select Date Range", 
+    min_value=min_date, 
+    max_value=max_date, 
+    value=(min_date, max_date),
+    format="YYYY-MM-DD"
+)
 
 # 📂 Job Family Filter (Dropdown)
-if "title_data_family" in df.columns:
-    job_families = df["title_data_family"].unique().tolist()
-    selected_families = st.sidebar.multiselect(
-        "Select Job Families", 
-        options=job_families, 
-        default=job_families  # Default: Show all
-    )
-    
-    # Apply filter
-    df = df[df["title_data_family"].isin(selected_families)]
+selected_families = st.sidebar.multiselect(
+    "Select Job Families", 
+    options=job_families, 
+    default=job_families  # Default: Show all
+)
+
+# 🔍 Full-text search over titles and descriptions
+search = st.sidebar.text_input(
+    "Search Listings",
+    placeholder='eg snowflake dbt, "data platform" -junior',
+    help="Matches words in the job title and description, best matches are listed first"
+).strip()
+
+# 🧬 Near-duplicate ads (reposts, the same ad under several search terms) counted once
+one_per_cluster = st.sidebar.checkbox(
+    "Count Near-Duplicates Once",
+    value=False,
+    help="Counts each group of near-identical job ads as one listing, the earliest posted"
+)
+
+# Every loader and visual takes the filters as one hashable tuple
+filters = (date_range[0], date_range[1], tuple(selected_families), search or None, one_per_cluster)
 
 # --------------------------
 # Last Updated Timestamp (Top Right Corner)
 # --------------------------
 
-if "created" in df.columns:
-    last_updated = df["created"].max().strftime("%Y-%m-%d %H:%M:%S")  # Format as 'YYYY-MM-DD HH:MM:SS'
+last_updated = load_last_updated(data_version, filters)
+if last_updated is not None:
+    last_updated = pd.Timestamp(last_updated).strftime("%Y-%m-%d %H:%M:%S")  # Format as 'YYYY-MM-DD HH:MM:SS'
     
     # Display in the top right corner
     kpi_col1, kpi_col2, kpi_col3 = st.columns([2, 1, 1])  # Adjust spacing
@@ -152,171 +206,76 @@ st.markdown('<div class="main-header">Australian Data Jobs</div>', unsafe_allow_
 st.markdown("<hr>", unsafe_allow_html=True)
 
 # --------------------------
-# KPI: Total Job Listings for Last Two Complete Weeks
+# KPI helpers: % change and its colour
 # --------------------------
 
-# Ensure "created" field exists
-if "created" in df.columns:
-    latest_week_start = (df["created"].max().to_period("W").start_time) - pd.Timedelta(weeks=1)  # Last complete week's Monday
-    previous_week_start = latest_week_start - pd.Timedelta(weeks=1)  # Two weeks ago Monday
-    
-    # Filter jobs for the last two complete weeks
-    df_latest_week = df[(df["created"] >= latest_week_start) & (df["created"] < latest_week_start + pd.Timedelta(weeks=1))]
-    df_previous_week = df[(df["created"] >= previous_week_start) & (df["created"] < latest_week_start)]
-    
-    # Calculate job counts
-    latest_week_job_count = len(df_latest_week)
-    previous_week_job_count = len(df_previous_week)
-    
-    # Calculate % change
-    if previous_week_job_count > 0:
-        percent_change = ((latest_week_job_count - previous_week_job_count) / previous_week_job_count) * 100
-    else:
-        percent_change = 0  # Avoid division by zero
+def percent_change(latest, previous):
+    if previous > 0:
+        return ((latest - previous) / previous) * 100
+    return 0  # Avoid division by zero (or no data)
 
+def delta_color(change):
     # Determine color (green for increase, red for decrease, grey for no change)
-    if percent_change > 0:
-        delta_color = "🟢"
-    elif percent_change < 0:
-        delta_color = "🔴"
-    else:
-        delta_color = "⚪"
-
-# --------------------------
-# KPI: Total Job Listings for Last Two Complete Months
-# --------------------------
-if "created" in df.columns:
-    latest_month_start = (df["created"].max().to_period("M").start_time) - pd.DateOffset(months=1)  # Last complete month's start
-    previous_month_start = latest_month_start - pd.DateOffset(months=1)  # Two months ago start
-    
-    # Filter jobs for the last two complete months
-    df_latest_month = df[(df["created"] >= latest_month_start) & (df["created"] < latest_month_start + pd.DateOffset(months=1))]
-    df_previous_month = df[(df["created"] >= previous_month_start) & (df["created"] < latest_month_start)]
-    
-    # Calculate job counts
-    latest_month_job_count = len(df_latest_month)
-    previous_month_job_count = len(df_previous_month)
-    
-    # Calculate % change
-    if previous_month_job_count > 0:
-        month_percent_change = ((latest_month_job_count - previous_month_job_count) / previous_month_job_count) * 100
-    else:
-        month_percent_change = 0  # Avoid division by zero
-
-    # Determine color for the KPI
-    if month_percent_change > 0:
-        month_delta_color = "🟢"
-    elif month_percent_change < 0:
-        month_delta_color = "🔴"
-    else:
-        month_delta_color = "⚪"
-
-# --------------------------
-# KPI: Weekly Change in Average Salary (Last Two Complete Weeks)
-# --------------------------
-if "created" in df.columns and "annualized_salary" in df.columns:
-    latest_week_avg_salary = df_latest_week["annualized_salary"].mean()
-    previous_week_avg_salary = df_previous_week["annualized_salary"].mean()
-
-    # Calculate percentage change
-    if previous_week_avg_salary > 0:
-        weekly_salary_percent_change = ((latest_week_avg_salary - previous_week_avg_salary) / previous_week_avg_salary) * 100
-    else:
-        weekly_salary_percent_change = 0  # Avoid division by zero
-
-    # Determine color for weekly salary change
-    if weekly_salary_percent_change > 0:
-        weekly_salary_delta_color = "🟢"
-    elif weekly_salary_percent_change < 0:
-        weekly_salary_delta_color = "🔴"
-    else:
-        weekly_salary_delta_color = "⚪"
-
-# --------------------------
-# KPI: Monthly Change in Average Salary (Last Two Complete Months)
-# --------------------------
-if "created" in df.columns and "annualized_salary" in df.columns:
-    latest_month_avg_salary = df_latest_month["annualized_salary"].mean()
-    previous_month_avg_salary = df_previous_month["annualized_salary"].mean()
-
-    # Calculate percentage change
-    if previous_month_avg_salary > 0:
-        monthly_salary_percent_change = ((latest_month_avg_salary - previous_month_avg_salary) / previous_month_avg_salary) * 100
-    else:
-        monthly_salary_percent_change = 0  # Avoid division by zero
-
-    # Determine color for monthly salary change
-    if monthly_salary_percent_change > 0:
-        monthly_salary_delta_color = "🟢"
-    elif monthly_salary_percent_change < 0:
-        monthly_salary_delta_color = "🔴"
-    else:
-        monthly_salary_delta_color = "⚪"
-
+    if change > 0:
+        return "🟢"
+    elif change < 0:
+        return "🔴"
+    return "⚪"
 
 # --------------------------
-# KPI Row: Job Listing and Salary Changes
+# KPIs: Job Listings and Average Salary for the Last Two Complete Weeks and Months
 # --------------------------
+# Each visual below is a fragment: a control inside one reruns only that visual, and a
+# sidebar change reruns them all, each from its own cached loader.
+@st.fragment
+def kpi_row(filters):
+    kpis = load_kpis(data_version, filters)
+    weekly_job_change = percent_change(kpis["latest_week_job_count"], kpis["previous_week_job_count"])
+    monthly_job_change = percent_change(kpis["latest_month_job_count"], kpis["previous_month_job_count"])
+    weekly_salary_change = percent_change(kpis["latest_week_avg_salary"], kpis["previous_week_avg_salary"])
+    monthly_salary_change = percent_change(kpis["latest_month_avg_salary"], kpis["previous_month_avg_salary"])
 
-if "created" in df.columns:
     kpi_col1, kpi_col2, kpi_col3, kpi_col4 = st.columns(4)
 
     # Job Listing Change (Weekly)
     with kpi_col1:
         st.metric(
             label="Job Listing Change (Weekly)", 
-            value=f"{latest_week_job_count:,}", 
-            delta=f"{percent_change:.1f}% {delta_color}"
+            value=f"{kpis['latest_week_job_count']:,}", 
+            delta=f"{weekly_job_change:.1f}% {delta_color(weekly_job_change)}"
         )
 
     # Job Listing Change (Monthly)
     with kpi_col2:
         st.metric(
             label="Job Listing Change (Monthly)", 
-            value=f"{latest_month_job_count:,}", 
-            delta=f"{month_percent_change:.1f}% {month_delta_color}"
+            value=f"{kpis['latest_month_job_count']:,}", 
+            delta=f"{monthly_job_change:.1f}% {delta_color(monthly_job_change)}"
         )
 
     # Weekly Salary Change
-    if "annualized_salary" in df.columns:
-        with kpi_col3:
-            st.metric(
-                label="Salary Change (Weekly)", 
-                value=f"${latest_week_avg_salary:,.0f}", 
-                delta=f"{weekly_salary_percent_change:.1f}% {weekly_salary_delta_color}"
-            )
+    with kpi_col3:
+        st.metric(
+            label="Salary Change (Weekly)", 
+            value=f"${kpis['latest_week_avg_salary']:,.0f}", 
+            delta=f"{weekly_salary_change:.1f}% {delta_color(weekly_salary_change)}"
+        )
 
     # Monthly Salary Change
-    if "annualized_salary" in df.columns:
-        with kpi_col4:
-            st.metric(
-                label="Salary Change (Monthly)", 
-                value=f"${latest_month_avg_salary:,.0f}", 
-                delta=f"{monthly_salary_percent_change:.1f}% {monthly_salary_delta_color}"
-            )        
-
+    with kpi_col4:
+        st.metric(
+            label="Salary Change (Monthly)", 
+            value=f"${kpis['latest_month_avg_salary']:,.0f}", 
+            delta=f"{monthly_salary_change:.1f}% {delta_color(monthly_salary_change)}"
+        )        
 
-# --------------------------
-# Dashboard Layout: 2 Rows x 2 Columns
-# --------------------------
-col1, col2 = st.columns(2)
-col3, col4 = st.columns(2)
 
 # Create the line chart for Weekly Job Listings by Job Family
-with col1:
+@st.fragment
+def weekly_chart(filters):
     st.markdown("### Job Listings Weekly")
-    if "created" in df.columns and "title_data_family" in df.columns:
-        # Group data by week and job family
-        df_weekly = df.groupby([pd.Grouper(key="created", freq="W-MON"), "title_data_family"]).size().reset_index(name="job_count")
-        df_weekly.rename(columns={"created": "week_begin"}, inplace=True)
-
-        # Convert week_begin to datetime for proper sorting
-        df_weekly["week_begin_date"] = pd.to_datetime(df_weekly["week_begin"])
-        df_weekly = df_weekly.sort_values("week_begin_date")  # Sort by date
-
-        # Compute cumulative job counts by job family
-        df_weekly["cumulative_job_count"] = df_weekly.groupby("title_data_family")["job_count"].cumsum()
-
+    df_weekly = load_weekly(data_version, filters)
+    if not df_weekly.empty:
         # Create the line chart with Altair using cumulative counts
         line_chart = alt.Chart(df_weekly).mark_line(point=True).encode(
             x=alt.X("week_begin_date:T", title="Week Ending", axis=alt.Axis(format='%b %d')),
@@ -333,24 +292,17 @@ with col1:
         # Display the chart
         st.altair_chart(line_chart, use_container_width=True)
     else:
-        st.write("Required fields ('created' or 'title_data_family') are not available.")
-
+        st.write("No job listings match the selected filters.")
 
 
 # Visual 2: Sideways Bar Chart of Skills Count (Top Right)
-with col2:
+@st.fragment
+def skills_chart(filters):
     st.markdown("### # Most common Skills")
     st.markdown('<div class="container">', unsafe_allow_html=True)
 
-    # Ensure skill columns exist in the dataframe
-    if any(skill in df.columns for skill in skills_list):
-        # Calculate the sum for each skill column with exact match
-        skill_counts = {skill: df[skill].sum() for skill in skills_list if skill in df.columns}
-
-        # Convert the counts to a dataframe
-        skills_df = pd.DataFrame(list(skill_counts.items()), columns=["Skill", "Count"])
-        skills_df.sort_values("Count", ascending=False, inplace=True)
-
+    skills_df = load_skills(data_version, filters)
+    if skills_df["Count"].sum() > 0:
         # Create a sideways bar chart using Altair
         bar_chart = alt.Chart(skills_df).mark_bar().encode(
             x=alt.X("Count:Q", title="Count"),
@@ -360,64 +312,68 @@ with col2:
 
         st.altair_chart(bar_chart, use_container_width=True)
     else:
-        st.write("No skill columns available.")
+        st.write("No skills found in the selected listings.")
     st.markdown('</div>', unsafe_allow_html=True)
 
 # Visual 3: Horizontal Box-and-Whisker Plot for Annualized Salary by Job Family (Bottom Left)
-with col3:
+@st.fragment
+def salary_chart(filters):
     st.markdown("### Salary Distribution by Title")
     st.markdown('<div class="container">', unsafe_allow_html=True)
 
-    # Ensure required fields exist
-    if "annualized_salary" in df.columns and "title_data_family" in df.columns:
-        # Remove rows with missing salary values
-        df_filtered = df.dropna(subset=["annualized_salary", "title_data_family"])
-
-        # Create the horizontal box-and-whisker plot using Altair
-        box_plot = alt.Chart(df_filtered).mark_boxplot(extent="min-max").encode(
+    salary_df = load_salary(data_version, filters)
+    if not salary_df.empty:
+        # Draw the box plot from the five-number summary computed in the database
+        base = alt.Chart(salary_df).encode(
             y=alt.Y("title_data_family:N", title="Job Family"),  # Job Family on Y-axis
-            x=alt.X("annualized_salary:Q", title="Annualized Salary (AUD)"),  # Salary on X-axis
             color=alt.Color("title_data_family:N", legend=None)  # Color by job family
-        ).properties(height=400)
+        )
+        whiskers = base.mark_rule().encode(
+            x=alt.X("min_salary:Q", title="Annualized Salary (AUD)"),  # Salary on X-axis
+            x2="max_salary:Q"
+        )
+        boxes = base.mark_bar(size=20).encode(x="q1_salary:Q", x2="q3_salary:Q")
+        medians = base.mark_tick(color="white", size=20).encode(x="median_salary:Q")
+        box_plot = (whiskers + boxes + medians).properties(height=400)
 
         st.altair_chart(box_plot, use_container_width=True)
     else:
-        st.write("Required fields ('annualized_salary' or 'title_data_family') are not available.")
+        st.write("No salaries available for the selected listings.")
     st.markdown('</div>', unsafe_allow_html=True)
 
 # Visual 4: Scrollable Sample Dataframe (Bottom Right)
-with col4:
+@st.fragment
+def sample_table(filters):
     st.markdown("### Data Sample Job Listings")
     st.markdown('<div class="container">', unsafe_allow_html=True)
 
-    # Define the columns to display
-    selected_columns = [
-        "title", "company","created", "location", "url"
-    ]
-
-    # Check if the required columns exist in the dataframe
-    if all(col in df.columns for col in selected_columns):
-        # Prepare a subset of the dataframe
-        sample_df = df[selected_columns].head(50)  # Limit rows for scrolling
+    # Changing the row count reruns only this fragment
+    limit = st.selectbox("Rows", options=[25, 50, 100], index=1)
+    sample_html = load_sample_html(data_version, filters, limit)
+    if sample_html is not None:
+        # Render the formatted dataframe with Streamlit's markdown
+        st.markdown(sample_html, unsafe_allow_html=True)
+    else:
+        st.write("No job listings match the selected filters.")
+    st.markdown('</div>', unsafe_allow_html=True)
 
-        # # Format the annualized_salary column (remove decimals and add commas)
-        # sample_df["annualized_salary"] = sample_df["annualized_salary"].apply(
-        #     lambda x: f"${int(x):,}" if pd.notna(x) else "N/A"
-        # )
 
-        # Format the created column (remove time, show only date)
-        sample_df["created"] = sample_df["created"].dt.strftime("%Y-%m-%d")
+# --------------------------
+# KPI Row: Job Listing and Salary Changes
+# --------------------------
+kpi_row(filters)
 
-        # Convert the URL column to clickable links
-        sample_df["url"] = sample_df["url"].apply(
-            lambda x: f'<a href="{x}" target="_blank">Link</a>' if pd.notna(x) else "N/A"
-        )
+# --------------------------
+# Dashboard Layout: 2 Rows x 2 Columns
+# --------------------------
+col1, col2 = st.columns(2)
+col3, col4 = st.columns(2)
 
-        # Render the formatted dataframe with Streamlit's markdown
-        st.markdown(
-            sample_df.to_html(escape=False, index=False), 
-            unsafe_allow_html=True
-        )
-    else:
-        st.write("Required columns are not available in the data.")
-    st.markdown('</div>', unsafe_allow_html=True)
+with col1:
+    weekly_chart(filters)
+with col2:
+    skills_chart(filters)
+with col3:
+    salary_chart(filters)
+with col4:
+    sample_table(filters)
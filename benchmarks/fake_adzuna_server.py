@@ -0,0 +1,118 @@
+import argparse
+import json
+import math
+import random
+import re
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+from synthetic_listings import api_results, description_pool
+
+# Local stand-in for the Adzuna search endpoint, so the fetcher can be timed without the real API.
+# Point the fetcher at it with ADZUNA_API_BASE_URL=http://127.0.0.1:<port>/v1/api/jobs/{country}/search/
+# Every country is served the same listings.
+PAGE_PATH = re.compile(r"^/v1/api/jobs/[a-z]+/search/(\d+)$")
+
+
+def matches_filters(job, query):
+    """Applies the location1 and salary filters the fetcher's shards use, as Adzuna does."""
+    state = query.get("location1", [None])[0]
+    if state and not job["location"]["display_name"].endswith(state):
+        return False
+    low = float(query["salary_min"][0]) if "salary_min" in query else None
+    high = float(query["salary_max"][0]) if "salary_max" in query else None
+    if low is None and high is None:
+        return True
+    if job["salary_min"] is None:
+        return query.get("salary_include_unknown", ["0"])[0] == "1"
+    return (low is None or job["salary_max"] >= low) and (high is None or job["salary_min"] <= high)
+
+
+def make_handler(results_per_term, latency_ms, rate_429, retry_after, description_words, seed):
+    """Builds the request handler class for one server configuration."""
+    descriptions = description_pool(seed, description_words)
+    now = datetime.now(timezone.utc).replace(microsecond=0)
+    rng = random.Random(seed)
+    rng_lock = threading.Lock()
+    term_listings = {}
+    term_lock = threading.Lock()
+
+    def listings_for(term):
+        """Every listing of a term, built once so filtered searches page through the same rows."""
+        with term_lock:
+            if term not in term_listings:
+                # Each term gets its own block of listings so terms do not all return the same rows
+                term_offset = (sum(map(ord, term)) % 97) * results_per_term
+                term_listings[term] = api_results(term_offset, results_per_term, seed, descriptions, now)
+            return term_listings[term]
+
+    class FakeAdzunaHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            url = urlparse(self.path)
+            match = PAGE_PATH.match(url.path)
+            if not match:
+                self.send_error(404)
+                return
+
+            time.sleep(latency_ms / 1000)
+            with rng_lock:
+                throttled = rng.random() < rate_429
+            if throttled:
+                self.send_response(429)
+                self.send_header("Retry-After", str(retry_after))
+                self.end_headers()
+                return
+
+            query = parse_qs(url.query)
+            page = int(match.group(1))
+            per_page = int(query.get("results_per_page", ["50"])[0])
+            listings = [job for job in listings_for(query.get("what", [""])[0]) if matches_filters(job, query)]
+            start = (page - 1) * per_page
+            body = json.dumps({"count": len(listings), "results": listings[start:start + per_page]}).encode()
+
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass  # One line per request would swamp the benchmark output
+
+    return FakeAdzunaHandler
+
+
+def start_server(port=0, results_per_term=1000, latency_ms=50, rate_429=0.0, retry_after=0,
+                 description_words=120, seed=0):
+    """Starts the server on a background thread. Returns (server, base_url); call server.shutdown() to stop."""
+    handler = make_handler(results_per_term, latency_ms, rate_429, retry_after, description_words, seed)
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_address[1]}/v1/api/jobs/{{country}}/search/"
+    return server, base_url
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve synthetic Adzuna search results locally.")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--results-per-term", type=int, default=1000)
+    parser.add_argument("--latency-ms", type=float, default=50, help="delay added to every response")
+    parser.add_argument("--rate-429", type=float, default=0.0, help="share of requests answered with HTTP 429")
+    parser.add_argument("--retry-after", type=int, default=0, help="Retry-After seconds sent with a 429")
+    parser.add_argument("--description-words", type=int, default=120, help="payload size of each listing")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    server, base_url = start_server(args.port, args.results_per_term, args.latency_ms, args.rate_429,
+                                    args.retry_after, args.description_words, args.seed)
+    print(f"Serving {args.results_per_term} listings per term "
+          f"({math.ceil(args.results_per_term / 50)} pages) at {base_url}")
+    print(f"Set ADZUNA_API_BASE_URL={base_url} to fetch from it. Ctrl+C to stop.")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,324 @@
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+BASE_DIR = os.path.abspath(os.path.join(BENCH_DIR, ".."))
+SQL_DIR = os.path.join(BASE_DIR, "SQL")
+RESULTS_DIR = os.path.join(BENCH_DIR, "results")
+sys.path.append(os.path.join(BASE_DIR, "Python"))
+
+from dotenv import load_dotenv
+import adzuna_api_call_v2
+import adzuna_2_rawdataingestion
+import dashboard_queries
+import dashboard_snapshot
+import jobs_pipeline
+import pipeline_metrics as metrics
+import search_catalogue
+from db_utils import RAW_COLUMNS, create_connection_pool, pooled_connection, quote_columns
+from fake_adzuna_server import start_server
+from synthetic_listings import write_raw_csvs
+
+SIZES = {"10k": 10_000, "100k": 100_000, "1m": 1_000_000, "10m": 10_000_000}
+# ingest and merge also run before merge_changes, dashboard and replay, which need their data;
+# replay also needs the responses archived by fetch
+SCENARIOS = ["fetch", "ingest", "merge", "merge_changes", "dashboard", "replay"]
+
+# The benchmark database is rebuilt from these files, in this order
+DDL_FILES = [
+    "adzuna_results_raw_ddl.sql", "adzuna_jobs_master_ddl.sql", "adzuna_jobs_master_history_ddl.sql",
+    "adzuna_descriptions_ddl.sql", "adzuna_listing_key_ddl.sql", "adzuna_jobs_as_of_ddl.sql",
+    "adzuna_near_duplicates_ddl.sql", "adzuna_title_families_ddl.sql", "pipeline_run_log_ddl.sql",
+    "adzuna_jobs_streamlit_dashboard.sql",
+    "adzuna_rollups_ddl.sql",
+]
+DROP_SQL = """
+    DROP MATERIALIZED VIEW IF EXISTS adzuna_jobs_streamlit_dashboard;
+    DROP TABLE IF EXISTS adzuna_results_raw, adzuna_jobs_master, adzuna_jobs_master_history,
+                         adzuna_descriptions, pipeline_run_log, adzuna_daily_rollup, adzuna_daily_salary_histogram,
+                         adzuna_daily_skill_rollup, adzuna_rollup_watermark, adzuna_description_clusters,
+                         adzuna_lsh_buckets, adzuna_title_families CASCADE;
+    DROP SEQUENCE IF EXISTS pipeline_run_id_seq;
+"""
+
+
+class Results:
+    """Collects the timing of each scenario."""
+
+    def __init__(self):
+        self.scenarios = {}
+
+    def record(self, name, seconds, rows, **details):
+        self.scenarios[name] = {"seconds": round(seconds, 4), "rows": rows,
+                                "rows_per_second": round(rows / seconds, 1) if seconds > 0 else None, **details}
+        print(f"  {name:<22}{seconds:>10.2f}s{rows:>12,} rows{self.scenarios[name]['rows_per_second'] or 0:>14,.0f} rows/s")
+
+
+def reset_database(pool):
+    """Drops and recreates the pipeline's tables in the benchmark database."""
+    with pooled_connection(pool) as conn:
+        with conn.cursor() as cur:
+            cur.execute(DROP_SQL)
+            for filename in DDL_FILES:
+                with open(os.path.join(SQL_DIR, filename)) as f:
+                    cur.execute(f.read())
+        conn.commit()
+
+
+def bench_fetch(args, results, work_dir):
+    """Times fetch_jobs_and_save_to_csv against the local stand-in server."""
+    server, base_url = start_server(results_per_term=args.fetch_results_per_term, latency_ms=args.latency_ms,
+                                    rate_429=args.rate_429, description_words=args.description_words, seed=args.seed)
+    os.environ["ADZUNA_API_BASE_URL"] = base_url
+    metrics.reset()
+    try:
+        start = time.perf_counter()
+        rows = adzuna_api_call_v2.fetch_jobs_and_save_to_csv(
+            search_catalogue.searches(search_catalogue.load_catalogue()), max_workers=args.fetch_workers,
+            calls_per_minute=1_000_000, incremental=False, output_dir=os.path.join(work_dir, "fetch"),
+            state_path=os.path.join(work_dir, "fetch_state.json"), archive_dir=os.path.join(work_dir, "responses"),
+            max_shard_pages=args.fetch_shard_pages)
+        seconds = time.perf_counter() - start
+    finally:
+        server.shutdown()
+    latency = metrics.summary()["histograms"].get("adzuna_http_request_seconds", {})
+    counters = metrics.summary()["counters"]
+    results.record("fetch", seconds, rows, request_latency=latency, retries=counters.get("adzuna_http_retries_total", {}),
+                   pages=sum(counters.get("adzuna_pages_fetched_total", {}).values()),
+                   duplicates=sum(counters.get("adzuna_duplicate_rows_total", {}).values()))
+
+
+def bench_ingest(args, results, work_dir):
+    """Times the CSV loader on synthetic files of --rows listings."""
+    csv_dir = os.path.join(work_dir, "csv")
+    start = time.perf_counter()
+    paths = write_raw_csvs(args.rows, csv_dir, seed=args.seed, description_words=args.description_words)
+    print(f"  (generated {len(paths)} CSV files in {time.perf_counter() - start:.1f}s, not timed)")
+    csv_bytes = sum(os.path.getsize(path) for path in paths)
+
+    start = time.perf_counter()
+    inserted = adzuna_2_rawdataingestion.ingest_csv_files(csv_dir, max_workers=args.ingest_workers,
+                                                          archive_dir=os.path.join(work_dir, "archive"))
+    results.record("ingest", time.perf_counter() - start, inserted, files=len(paths), csv_bytes=csv_bytes)
+
+
+def bench_cluster(pool, args, results):
+    """Times near-duplicate clustering of the ingested descriptions."""
+    start = time.perf_counter()
+    descriptions = jobs_pipeline.cluster_jobs(pool, args)
+    results.record("cluster", time.perf_counter() - start, descriptions)
+
+
+def bench_classify(pool, args, results):
+    """Times the job family classification of the ingested titles."""
+    start = time.perf_counter()
+    titles = jobs_pipeline.classify_jobs(pool, args)
+    results.record("classify", time.perf_counter() - start, titles)
+
+
+def bench_merge(name, pool, args, results):
+    """Times combine_raw_master.sql, with the time of each statement."""
+    metrics.reset()
+    start = time.perf_counter()
+    rows = jobs_pipeline.merge_jobs(pool, args)
+    statements = {label.split("=", 1)[1]: value["sum_seconds"] for label, value
+                  in metrics.summary()["histograms"].get("merge_statement_seconds", {}).items()}
+    results.record(name, time.perf_counter() - start, rows, statements=statements)
+
+
+def stage_changes(pool, share=10):
+    """Refetches one listing in share with a raised salary, so the next merge updates master and writes history."""
+    changed = {
+        "Salary Min": '"Salary Min" + 1000',
+        "Salary Max": '"Salary Max" + 1000',
+        "Annualized Salary AUD": '"Annualized Salary AUD" + 1000',
+        "timestamp": "\"timestamp\" + interval '1 minute'",
+    }
+    select_list = ", ".join(changed.get(column, f'"{column}"') for column in RAW_COLUMNS)
+    with pooled_connection(pool) as conn:
+        with conn.cursor() as cur:
+            cur.execute(f"""
+                INSERT INTO adzuna_results_raw ({quote_columns(RAW_COLUMNS)})
+                SELECT {select_list}
+                FROM adzuna_results_raw
+                WHERE "Listing Key" %% %s = 0
+                AND "timestamp" = (SELECT max("timestamp") FROM adzuna_results_raw)
+            """, (share,))
+            rows = cur.rowcount
+        conn.commit()
+    return rows
+
+
+def bench_replay(pool, args, results, work_dir):
+    """Times replaying the fetched run into raw as a new batch and merging it.
+
+    The run is first loaded with its original timestamps and merged. Replaying it again
+    as it was must add nothing, and as a new batch must update every replayed listing in
+    master; the scenario fails otherwise.
+    """
+    archive_dir = os.path.join(work_dir, "responses")
+    with pooled_connection(pool) as conn:
+        replayed = adzuna_api_call_v2.replay_archived_run("latest", stream_to_db=True, save_csv=False, conn=conn,
+                                                          archive_dir=archive_dir)
+        jobs_pipeline.merge_jobs(pool, args)
+        adzuna_api_call_v2.replay_archived_run("latest", stream_to_db=True, save_csv=False, conn=conn,
+                                               archive_dir=archive_dir)
+        if jobs_pipeline.merge_jobs(pool, args):
+            raise RuntimeError("replaying a merged run with its original timestamps changed adzuna_jobs_master")
+
+        start = time.perf_counter()
+        adzuna_api_call_v2.replay_archived_run("latest", stream_to_db=True, save_csv=False, conn=conn,
+                                               archive_dir=archive_dir, as_new_batch=True)
+        merged = jobs_pipeline.merge_jobs(pool, args)
+    results.record("replay", time.perf_counter() - start, merged)
+    if merged != replayed:
+        raise RuntimeError(f"replaying {replayed:,} listings as a new batch changed {merged:,} in adzuna_jobs_master")
+
+
+def bench_dashboard(pool, args, results, work_dir):
+    """Times the dashboard's refresh and the aggregates behind one page load, from the database and the snapshot."""
+    start = time.perf_counter()
+    rows = jobs_pipeline.refresh_dashboard(pool, args)
+    results.record("dashboard_refresh", time.perf_counter() - start, rows)
+
+    def page_load(source, handle, search=None):
+        (min_date, max_date), families = source.date_bounds(handle), source.job_families(handle)
+        filters = (min_date, max_date, tuple(families), search)
+        return [source.last_updated(handle, *filters), source.kpi_summary(handle, *filters),
+                source.weekly_counts(handle, *filters), source.skill_counts(handle, *filters),
+                source.salary_distribution(handle, *filters), source.sample_listings(handle, *filters)]
+
+    with pooled_connection(pool, autocommit=True) as conn:
+        start = time.perf_counter()
+        page_load(dashboard_queries, conn)
+        results.record("dashboard_queries", time.perf_counter() - start, rows)
+
+        start = time.perf_counter()
+        page_load(dashboard_queries, conn, search="snowflake dbt")
+        results.record("dashboard_search", time.perf_counter() - start, rows)
+
+    # The export streams from a named cursor, which needs a transaction
+    snapshot_path = os.path.join(work_dir, "dashboard.arrow")
+    with pooled_connection(pool) as conn:
+        start = time.perf_counter()
+        dashboard_snapshot.export_snapshot(conn, dashboard_queries.data_version(conn), path=snapshot_path)
+        results.record("dashboard_export", time.perf_counter() - start, rows)
+
+    start = time.perf_counter()
+    frame = dashboard_snapshot.load_snapshot(snapshot_path)
+    page_load(dashboard_snapshot, frame)
+    results.record("dashboard_snapshot", time.perf_counter() - start, rows)
+
+
+def git_version():
+    try:
+        return subprocess.run(["git", "describe", "--always", "--dirty"], cwd=BASE_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def compare(current, baseline_path):
+    """Prints each scenario's change in seconds against an earlier results file."""
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    print(f"\nCompared with {baseline['version']} ({baseline['rows']:,} rows):")
+    for name, result in current["scenarios"].items():
+        before = baseline["scenarios"].get(name)
+        if not before or not before["seconds"]:
+            print(f"  {name:<22}{result['seconds']:>10.2f}s  (new)")
+            continue
+        change = (result["seconds"] - before["seconds"]) / before["seconds"] * 100
+        print(f"  {name:<22}{before['seconds']:>10.2f}s -> {result['seconds']:>8.2f}s  {change:+7.1f}%")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the fetch, ingest, merge and dashboard stages.")
+    parser.add_argument("--database", help="scratch database for the database scenarios, rebuilt on every run")
+    parser.add_argument("--rows", default="10k", help=f"listings to ingest and merge: {', '.join(SIZES)} or a number")
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=SCENARIOS)
+    parser.add_argument("--fetch-results-per-term", type=int, default=2000)
+    parser.add_argument("--fetch-workers", type=int, default=4)
+    parser.add_argument("--fetch-shard-pages", type=int, metavar="PAGES",
+                        help="shard fetched searches deeper than this many pages, as --shard does")
+    parser.add_argument("--latency-ms", type=float, default=50, help="stand-in server response delay")
+    parser.add_argument("--rate-429", type=float, default=0.0, help="share of stand-in requests throttled")
+    parser.add_argument("--description-words", type=int, default=120, help="words in each synthetic description")
+    parser.add_argument("--ingest-workers", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--compare", metavar="RESULTS_JSON", help="earlier results file to compare against")
+    parser.add_argument("--keep", action="store_true", help="keep the generated files")
+    args = parser.parse_args()
+    args.rows = SIZES.get(args.rows.lower()) or int(args.rows)
+    # merge_jobs and refresh_dashboard read these pipeline flags
+    args.snapshot_descriptions = False
+
+    load_dotenv()
+    needs_database = set(args.scenarios) - {"fetch"}
+    if needs_database:
+        if not args.database:
+            parser.error("--database is required for the ingest, merge, dashboard and replay scenarios")
+        if "replay" in args.scenarios and "fetch" not in args.scenarios:
+            parser.error("the replay scenario replays the responses archived by the fetch scenario")
+        if args.database == os.getenv("DB_NAME"):
+            parser.error("--database must not be the pipeline's own database, it is dropped and rebuilt")
+        # Set before any connection is opened, so ingestion's worker processes inherit it
+        os.environ["DB_NAME"] = args.database
+
+    work_dir = tempfile.mkdtemp(prefix="adzuna_bench_")
+    results = Results()
+    pool = None
+    print(f"Benchmarking {', '.join(args.scenarios)} with {args.rows:,} rows (files in {work_dir})")
+    try:
+        if "fetch" in args.scenarios:
+            bench_fetch(args, results, work_dir)
+        if needs_database:
+            pool = create_connection_pool(max_connections=2)
+            reset_database(pool)
+            bench_ingest(args, results, work_dir)
+            bench_cluster(pool, args, results)
+            bench_classify(pool, args, results)
+            bench_merge("merge", pool, args, results)
+            if "merge_changes" in args.scenarios:
+                changed = stage_changes(pool)
+                print(f"  (staged {changed:,} changed listings)")
+                bench_merge("merge_changes", pool, args, results)
+            if "dashboard" in args.scenarios:
+                bench_dashboard(pool, args, results, work_dir)
+            if "replay" in args.scenarios:
+                bench_replay(pool, args, results, work_dir)
+    finally:
+        if pool is not None:
+            pool.closeall()
+        if not args.keep:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    output = {
+        "version": git_version(),
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "rows": args.rows,
+        "config": {key: value for key, value in vars(args).items() if key not in ("compare", "keep", "database")},
+        "scenarios": results.scenarios,
+    }
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    path = os.path.join(RESULTS_DIR, f"bench_{output['version']}_{args.rows}_{datetime.now():%Y%m%d_%H%M%S}.json")
+    with open(path, "w") as f:
+        json.dump(output, f, indent=2, default=str)
+    print(f"Results written to {path}")
+
+    if args.compare:
+        compare(output, args.compare)
+
+
+if __name__ == "__main__":
+    main()
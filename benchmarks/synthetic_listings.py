@@ -0,0 +1,96 @@
+import os
+from datetime import datetime, timedelta, timezone
+import numpy as np
+import pandas as pd
+
+# Synthetic Adzuna listings for the benchmarks: deterministic for a seed, shaped like the
+# API response (for the stand-in server) and like the fetcher's CSVs (for ingestion)
+TITLES = [
+    "Data Scientist", "Senior Data Scientist", "Data Analyst", "Senior Data Analyst", "Business Data Analyst",
+    "Data Engineer", "Senior Data Engineer", "Lead Data Engineer", "Analytics Engineer", "BI Developer",
+]
+LOCATIONS = [
+    "Sydney, New South Wales", "Melbourne, Victoria", "Brisbane, Queensland", "Perth, Western Australia",
+    "Adelaide, South Australia", "Canberra, Australian Capital Territory", "Hobart, Tasmania", "Darwin, Northern Territory",
+]
+CONTRACT_TYPES = ["permanent", "contract", ""]
+CONTRACT_TIMES = ["full_time", "part_time", ""]
+COMPANY_COUNT = 5000
+WORDS = [
+    "python", "sql", "excel", "power", "bi", "tableau", "aws", "azure", "gcp", "spark", "snowflake", "databricks",
+    "dbt", "mage", "team", "data", "build", "pipelines", "stakeholders", "insight", "models", "platform", "cloud",
+    "reporting", "experience", "years", "delivery", "agile", "modern", "warehouse", "analytics", "growth",
+]
+# Listings share descriptions, as the same ad is posted under several titles and search terms
+DESCRIPTION_POOL = 2000
+CSV_CHUNK_ROWS = 100000
+
+
+def description_pool(seed, description_words, size=DESCRIPTION_POOL):
+    """size distinct descriptions of description_words words each."""
+    rng = np.random.default_rng(seed)
+    words = np.array(WORDS)
+    return [" ".join(words[rng.integers(0, len(words), description_words)]) + f" ref{i}" for i in range(size)]
+
+
+def listing_columns(start, count, seed, descriptions, now):
+    """Vectorised columns for listings start..start+count, newest first as the API sorts by date."""
+    index = np.arange(start, start + count)
+    rng = np.random.default_rng(seed + start)
+    titles = np.array(TITLES)[index % len(TITLES)]
+    salary_kind = rng.integers(0, 4, count)
+    annual = rng.integers(60, 200, count) * 1000
+    salary_min = np.where(salary_kind == 0, annual,
+                 np.where(salary_kind == 1, annual / 1000,
+                 np.where(salary_kind == 2, rng.integers(500, 1200, count), np.nan)))
+    created = now - pd.to_timedelta(index * 37 % (86400 * 120), unit="s")
+    return {
+        "Title": pd.Series(titles) + " " + pd.Series(index % 997).astype(str),
+        "Company": "Company " + pd.Series(rng.zipf(1.5, count) % COMPANY_COUNT).astype(str),
+        "Location": np.array(LOCATIONS)[rng.integers(0, len(LOCATIONS), count)],
+        "Category": "IT Jobs",
+        "Contract Type": np.where(salary_kind == 2, "contract", np.array(CONTRACT_TYPES)[rng.integers(0, 3, count)]),
+        "Contract Time": np.array(CONTRACT_TIMES)[rng.integers(0, 3, count)],
+        "Salary Min": salary_min,
+        "Salary Max": salary_min * 1.2,
+        "Created": pd.Series(created).dt.strftime("%Y-%m-%dT%H:%M:%SZ"),
+        "Description": np.array(descriptions, dtype=object)[index % len(descriptions)],
+        "Redirect URL": "https://www.adzuna.com.au/details/" + pd.Series(index).astype(str),
+    }
+
+
+def api_results(start, count, seed, descriptions, now):
+    """Listings start..start+count as the API's "results" list."""
+    columns = pd.DataFrame(listing_columns(start, count, seed, descriptions, now))
+    return [{
+        "title": row["Title"],
+        "company": {"display_name": row["Company"]},
+        "location": {"display_name": row["Location"]},
+        "category": {"label": row["Category"]},
+        "contract_type": row["Contract Type"],
+        "contract_time": row["Contract Time"],
+        "salary_min": None if pd.isna(row["Salary Min"]) else float(row["Salary Min"]),
+        "salary_max": None if pd.isna(row["Salary Max"]) else float(row["Salary Max"]),
+        "created": row["Created"],
+        "description": row["Description"],
+        "redirect_url": row["Redirect URL"],
+    } for row in columns.to_dict("records")]
+
+
+def write_raw_csvs(rows, output_dir, seed=0, description_words=120, chunk_rows=CSV_CHUNK_ROWS):
+    """Writes rows synthetic listings as fetcher-style CSVs of up to chunk_rows each. Returns the paths.
+
+    Memory holds one chunk at a time, so 10M rows need no more than 10k.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    descriptions = description_pool(seed, description_words)
+    now = datetime.now(timezone.utc).replace(microsecond=0)
+    timestamp = datetime.now() - timedelta(minutes=1)
+    paths = []
+    for start in range(0, rows, chunk_rows):
+        frame = pd.DataFrame(listing_columns(start, min(chunk_rows, rows - start), seed, descriptions, now))
+        frame["timestamp"] = timestamp
+        path = os.path.join(output_dir, f"jobs_output_data_synthetic_{start // chunk_rows:05d}.csv")
+        frame.to_csv(path, index=False)
+        paths.append(path)
+    return paths